@@ -37,7 +37,7 @@ def do_codegen(t: AST, code, env=None):
             code.append(operand)
 
     match t:
-        case IntToken(v):
+        case IntToken(v) | BoolToken(v):
             emit(Opcode.PUSH, int(v))
         
         case Var(name, _):
@@ -62,7 +62,7 @@ def do_codegen(t: AST, code, env=None):
             do_codegen(value, code, env)
             emit(Opcode.ASTORE)
         
-        case BinOp(op, left, right):
+        case BinOp(op, left, right) | TypedBinOp(op, left, right):
             do_codegen(left, code, env)
             do_codegen(right, code, env)
             match op:
@@ -130,6 +130,19 @@ def do_codegen(t: AST, code, env=None):
                     raise Exception(f"Undefined variable: {var.v}")
                 emit(Opcode.STORE, env[var.v])
 
+        case Hoisted(var, expr):
+            do_codegen(expr, code, env)  # Worked out every time: the VM has no empty value to test for
+
+        case Unset():
+            emit(Opcode.PUSH, 0)
+
+        case list():
+            for stmt in t:
+                do_codegen(stmt, code, env)
+
+        case _:
+            raise ValueError(f"Cannot assemble {type(t).__name__}")
+
     return code
 
 def codegen(t):
@@ -0,0 +1,60 @@
+import argparse
+import sys
+import time
+from lexer import lex
+from parser import parse
+from resolver import resolve
+from compiler import ENGINES
+
+def name(i: int) -> str:
+    """A distinct identifier per i; Cobra identifiers are letters only."""
+    letters = "x"
+    while True:
+        i, r = divmod(i, 26)
+        letters += chr(ord("a") + r)
+        if i == 0:
+            return letters
+
+def nested_lets(depth: int) -> str:
+    """let xa be 0 in let xb be xa + 1 in ... end end, nested depth times."""
+    lines = [f"let {name(0)} be 0 in"]
+    for i in range(1, depth):
+        lines.append(f"let {name(i)} be {name(i - 1)} + 1 in")
+    lines.append(name(depth - 1))
+    lines.append("end " * depth)
+    return "\n".join(lines)
+
+def counting_loop(iterations: int) -> str:
+    """A while loop doing arithmetic, a call and assignments each time round."""
+    return f"""
+let f be fun(a) is a + 1 in
+let n be 0 in let i be 0 in
+while {{i < {iterations}}} do n := n + f(i) % 7; i := i + 1 end; n
+end end end"""
+
+def timed(label, f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    print(f"{label:<10} {time.perf_counter() - start:8.3f}s")
+    return result
+
+def bench_nesting(depth: int):
+    code = nested_lets(depth)
+    print(f"{depth} nested lets, {len(code)} bytes (recursion limit {sys.getrecursionlimit()})")
+    timed("lex", lambda s: sum(1 for _ in lex(s)), code)
+    ast = timed("parse", parse, code)
+    timed("resolve", resolve, ast)
+
+def bench_engines(iterations: int):
+    ast = resolve(parse(counting_loop(iterations)))
+    print(f"{iterations} loop iterations")
+    for engine, run in ENGINES.items():
+        timed(engine, run, ast)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time the Cobra front end and engines on generated programs.")
+    arg_parser.add_argument("--depth", type=int, default=10000, help="number of nested lets")
+    arg_parser.add_argument("--iterations", type=int, default=100000, help="loop iterations per engine")
+    args = arg_parser.parse_args()
+    bench_nesting(args.depth)
+    bench_engines(args.iterations)
@@ -1,9 +1,11 @@
 import sys
 import os
+import argparse
 from lexer import *
 from parser import parse
 from resolver import resolve
 from tree import *
+from cache import compile_program
 
 # Instruction Set
 HALT = 0
@@ -45,10 +47,10 @@ def codegen(t: AST):
     def do_codegen(t):
         nonlocal env
         
-        if isinstance(t, IntToken):
+        if isinstance(t, (IntToken, BoolToken)):
             emit(PUSH, int(t.v))
         
-        elif isinstance(t, BinOp):
+        elif isinstance(t, (BinOp, TypedBinOp)):
             do_codegen(t.left)
             do_codegen(t.right)
             match t.op:
@@ -156,6 +158,12 @@ def codegen(t: AST):
             for stmt in t:
                 do_codegen(stmt)
         
+        elif isinstance(t, Hoisted):
+            do_codegen(t.expr)  # Worked out every time: the VM has no empty value to test for
+
+        elif isinstance(t, Unset):
+            emit(PUSH, 0)
+
         elif isinstance(t, If):
             do_codegen(t.cond)
             emit(JMPF, 0)  # placeholder
@@ -175,18 +183,20 @@ def codegen(t: AST):
     return bytes(code)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <input_file> <output_file>")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(description="Compile a Cobra program to bytecode.")
+    arg_parser.add_argument("input_file")
+    arg_parser.add_argument("output_file")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always lex, parse and resolve from scratch")
+    arg_parser.add_argument("--no-optimize", action="store_true", help="skip constant folding, propagation and loop optimizations")
+    args = arg_parser.parse_args()
     
-    with open(sys.argv[1], "r") as f:
+    with open(args.input_file, "r") as f:
         code = f.read()
     
-    ast = parse(code)
-    abt = resolve(ast)
+    abt = compile_program(code, use_cache=not args.no_cache, optimized=not args.no_optimize)
     bytecode = codegen(abt)
     
-    with open(sys.argv[2], "wb") as f:
+    with open(args.output_file, "wb") as f:
         f.write(bytecode)
     
-    print(f"Generated bytecode to {sys.argv[2]}")
\ No newline at end of file
+    print(f"Generated bytecode to {args.output_file}")
\ No newline at end of file
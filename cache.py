@@ -0,0 +1,210 @@
+import dataclasses
+import hashlib
+import marshal
+import os
+import zlib
+from array import array
+from decimal import Decimal
+from tree import *
+from lexer import *
+from parser import parse
+from resolver import resolve
+from optimizer import optimize, INLINE_BUDGET
+from runtime import WholeQuotient
+
+# On-disk cache of resolved programs. An entry is keyed by a hash of the source
+# text, the numeric mode, the optimizer settings and the compiler's own source
+# files, so changing any of them misses.
+# Entries are evicted oldest-used first once the directory exceeds MAX_BYTES.
+
+CACHE_DIR = os.environ.get("COBRA_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "cobra")
+MAX_BYTES = 32 * 1024 * 1024
+
+COMPILER_MODULES = ("lexer.py", "parser.py", "resolver.py", "tree.py", "optimizer.py", "inliner.py", "loops.py",
+                    "purity.py", "inference.py", "runtime.py", "cache.py")
+
+_compiler_version = None
+
+def compiler_version() -> str:
+    global _compiler_version
+    if _compiler_version is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for module in COMPILER_MODULES:
+            with open(os.path.join(here, module), "rb") as f:
+                h.update(f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+def cache_key(code: str, decimal: bool = False, optimized: bool = True, inline_budget: int = INLINE_BUDGET,
+              memoize: bool = True) -> str:
+    h = hashlib.sha256(compiler_version().encode())
+    h.update(b"decimal" if decimal else b"native")
+    h.update(f"optimized {inline_budget} {memoize}".encode() if optimized else b"plain")
+    h.update(code.encode())
+    return h.hexdigest()
+
+# Serialized form: a flat postfix program over a value stack, so that encoding
+# and decoding never recurse however deep the tree is. ops holds opcodes and
+# their operands; plain constants (str, int, float, bool, None) sit in consts
+# and are pushed in order by CONST, and Decimals and runtime.WholeQuotients,
+# which marshal cannot store, are kept as a str or float and pushed by DECIMAL
+# or QUOTIENT. The whole thing is marshalled and zlib compressed, which comes
+# to about a third of the source size.
+CONST, DECIMAL, LIST, DICT, NODE, QUOTIENT = range(6)
+
+def _node_types(base):
+    for cls in base.__subclasses__():
+        if dataclasses.is_dataclass(cls):
+            yield cls
+        yield from _node_types(cls)
+
+NODE_TYPES = sorted(set(_node_types(AST)) | set(_node_types(Token)), key=lambda cls: cls.__name__)
+NODE_INDEX = {cls: i for i, cls in enumerate(NODE_TYPES)}
+NODE_FIELDS = [tuple(f.name for f in dataclasses.fields(cls)) for cls in NODE_TYPES]
+
+def encode(tree) -> bytes:
+    ops = array("I")
+    consts = []
+    # Work items are values still to encode, or (opcode, operand) pairs that
+    # are emitted once everything pushed after them has been.
+    work = [tree]
+    while work:
+        item = work.pop()
+        if type(item) is tuple:
+            ops.extend(item)
+        elif type(item) in NODE_INDEX:
+            i = NODE_INDEX[type(item)]
+            work.append((NODE, i))
+            work.extend(getattr(item, name) for name in reversed(NODE_FIELDS[i]))
+        elif isinstance(item, list):
+            work.append((LIST, len(item)))
+            work.extend(reversed(item))
+        elif isinstance(item, dict):
+            work.append((DICT, len(item)))
+            for key, value in reversed(item.items()):
+                work.append(value)
+                work.append(key)
+        elif isinstance(item, Decimal):
+            ops.append(DECIMAL)
+            consts.append(str(item))
+        elif type(item) is WholeQuotient:  # Folded from a division by the optimizer
+            ops.append(QUOTIENT)
+            consts.append(float(item))
+        elif item is None or isinstance(item, (str, int, float)):
+            ops.append(CONST)
+            consts.append(item)
+        else:
+            raise TypeError(f"Cannot cache {type(item).__name__}")
+    return zlib.compress(marshal.dumps((ops.tobytes(), consts)), 1)
+
+def decode(data: bytes):
+    raw_ops, consts = marshal.loads(zlib.decompress(data))
+    ops = array("I")
+    ops.frombytes(raw_ops)
+    stack = []
+    next_const = iter(consts).__next__
+    i = 0
+    n = len(ops)
+    while i < n:
+        op = ops[i]
+        if op == CONST:
+            stack.append(next_const())
+            i += 1
+        elif op == DECIMAL:
+            stack.append(Decimal(next_const()))
+            i += 1
+        elif op == QUOTIENT:
+            stack.append(WholeQuotient(next_const()))
+            i += 1
+        elif op == NODE:
+            cls = NODE_TYPES[ops[i + 1]]
+            k = len(NODE_FIELDS[ops[i + 1]])
+            args = stack[len(stack) - k:] if k else []
+            del stack[len(stack) - k:]
+            stack.append(cls(*args))
+            i += 2
+        elif op == LIST:
+            k = ops[i + 1]
+            items = stack[len(stack) - k:] if k else []
+            del stack[len(stack) - k:]
+            stack.append(items)
+            i += 2
+        elif op == DICT:
+            k = 2 * ops[i + 1]
+            items = stack[len(stack) - k:] if k else []
+            del stack[len(stack) - k:]
+            stack.append(dict(zip(items[::2], items[1::2])))
+            i += 2
+        else:
+            raise ValueError(f"Bad cache opcode {op}")
+    [tree] = stack
+    return tree
+
+def load(key: str, cache_dir: str = None):
+    path = os.path.join(cache_dir or CACHE_DIR, key)
+    try:
+        with open(path, "rb") as f:
+            tree = decode(f.read())
+        os.utime(path)  # Mark as recently used for eviction
+        return tree
+    except Exception:
+        # Missing, truncated or written by an incompatible version: recompile
+        return None
+
+def store(key: str, tree, cache_dir: str = None, max_bytes: int = None):
+    cache_dir = cache_dir or CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encode(tree))
+        os.replace(tmp, path)
+        evict(cache_dir, MAX_BYTES if max_bytes is None else max_bytes)
+    except OSError:
+        pass  # A read-only or full disk just means no caching
+
+def evict(cache_dir: str, max_bytes: int):
+    entries = []
+    total = 0
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def front_end(code: str, decimal: bool = False, optimized: bool = True, inline_budget: int = INLINE_BUDGET,
+              report=None, memoize: bool = True) -> AST:
+    tree = resolve(parse(code, decimal))
+    if optimized:
+        tree = optimize(tree, decimal, inline_budget, report, memoize)
+    return tree
+
+def compile_program(code: str, use_cache: bool = True, cache_dir: str = None, decimal: bool = False,
+                    optimized: bool = True, inline_budget: int = INLINE_BUDGET, report=None,
+                    memoize: bool = True) -> AST:
+    """
+    parse(), resolve() and optimize() code, reusing the cached result from an
+    earlier run if there is one. Passing report (see optimize()) skips the
+    cache, since only running the optimizer can tell what it did.
+    """
+    if not use_cache or report is not None:
+        return front_end(code, decimal, optimized, inline_budget, report, memoize)
+    key = cache_key(code, decimal, optimized, inline_budget, memoize)
+    tree = load(key, cache_dir)
+    if tree is None:
+        tree = front_end(code, decimal, optimized, inline_budget, memoize=memoize)
+        store(key, tree, cache_dir)
+    return tree
@@ -0,0 +1,58 @@
+import os
+import sys
+from decimal import Decimal
+from cache import encode, decode, compile_program, store, cache_key
+from parser import parse
+from resolver import resolve
+from optimizer import optimize
+from runtime import printable
+
+PROGRAM = """let xs be [3, 1, 2] in
+    let m be {"a": 1.5} in
+        let f be fun(x) is x * 2 in
+            sort(xs); print(f(m."a"))
+        end
+    end
+end"""
+
+def test_round_trip():
+    tree = resolve(parse(PROGRAM))
+    assert decode(encode(tree)) == tree
+
+def test_whole_quotients_survive():
+    tree = decode(encode(optimize(resolve(parse("270 / 3")))))
+    assert repr(printable(tree)) == "FloatToken(v=Decimal('90'))"
+
+def test_map_keys_stay_interned():
+    tree = decode(encode(resolve(parse(PROGRAM))))
+    [key] = tree.f.e.entries
+    assert key is sys.intern("a")
+
+def test_round_trip_deep():
+    depth = 5000
+    tree = resolve(parse("let x be 0 in " * depth + "x" + " end" * depth))
+    copy = decode(encode(tree))
+    for _ in range(depth):
+        assert copy.v == tree.v
+        tree, copy = tree.f, copy.f
+    assert copy == tree
+
+def test_compile_program_hits_cache(tmp_path):
+    first = compile_program(PROGRAM, cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == [cache_key(PROGRAM)]
+    assert compile_program(PROGRAM, cache_dir=str(tmp_path)) == first
+    assert compile_program(PROGRAM, use_cache=False) == first
+
+def test_eviction(tmp_path):
+    tree = resolve(parse(PROGRAM))
+    for i in range(5):
+        store(f"entry{i}", tree, str(tmp_path), max_bytes=2 * len(encode(tree)))
+    assert sorted(os.listdir(tmp_path)) == ["entry3", "entry4"]
+
+def test_numeric_modes_are_cached_apart(tmp_path):
+    native = compile_program(PROGRAM, cache_dir=str(tmp_path))
+    exact = compile_program(PROGRAM, cache_dir=str(tmp_path), decimal=True)
+    assert len(os.listdir(tmp_path)) == 2
+    assert type(native.f.e.entries["a"].v) is float
+    assert type(exact.f.e.entries["a"].v) is Decimal
+    assert compile_program(PROGRAM, cache_dir=str(tmp_path), decimal=True) == exact
@@ -0,0 +1,377 @@
+from tree import *
+from lexer import *
+from resolver import frame_size
+from runtime import *
+from eval import make_closure
+
+# A CEK-style engine: the tree is walked by one loop that keeps its own stack
+# of continuations, what is left to do with the value being worked out,
+# instead of nesting Python calls. Each continuation is a tuple whose first
+# item says what it is and which carries the frame it resumes in, so a Cobra
+# call just switches frames and leaves nothing behind for the return: no
+# program nests Python calls, however deep its expressions or recursion go,
+# and every tail call runs in constant space. Frames, closures and values are
+# as in eval.py, and BinOps and ArrayIndexes are quickened as there.
+
+TOKENS = frozenset({IntToken, FloatToken, StringToken, BoolToken})
+
+# Continuations
+(BINOP_RIGHT, BINOP_APPLY, BINOP_QUICK, SEQ, ASSIGN, IF, WHILE_TEST, WHILE_BODY, LET, CALL_FUNC, CALL_ARGS, MEMO,
+ HOIST, ARRAY, INDEX, ARRAY_ASSIGN, GATHER, APPEND, MAP_STORE) = range(19)
+
+def run(tree: AST):
+    """Run a resolved program in a fresh top-level frame, returning the result boxed."""
+    return box(execute(tree, [None] * frame_size(tree)))
+
+def execute(node, frame):
+    stack = []
+    push, pop = stack.append, stack.pop
+    value = None
+    while True:
+        # Work node out in frame: either a value comes straight out, or what
+        # to do with a part's value is pushed and the part is worked out next
+        t = type(node)
+        if t is Var:
+            value = frame[node.slot] if node.depth == 0 else frame[0][node.slot]
+        elif t in TOKENS:
+            value = node.v
+        elif t is BinOp or t is TypedBinOp:
+            operation = TYPED_OPS[node.op] if t is TypedBinOp else None  # A BinOp is quickened instead
+            left = node.left
+            lt = type(left)
+            if lt is Var:
+                left_value = frame[left.slot] if left.depth == 0 else frame[0][left.slot]
+            elif lt in TOKENS:
+                left_value = left.v
+            else:
+                push((BINOP_RIGHT, node, frame, operation))
+                node = left
+                continue
+            right = node.right
+            rt = type(right)
+            if rt is Var:
+                right_value = frame[right.slot] if right.depth == 0 else frame[0][right.slot]
+            elif rt in TOKENS:
+                right_value = right.v
+            else:
+                push((BINOP_APPLY, operation, left_value) if operation else (BINOP_QUICK, node, left_value))
+                node = right
+                continue
+            if operation:
+                value = operation(left_value, right_value)
+            else:
+                quick = node.quick
+                if quick and type(left_value) is quick[0] and type(right_value) is quick[1]:
+                    value = quick[2](left_value, right_value)
+                else:
+                    value = quicken_binop(node, left_value, right_value)
+        elif t is Assign:
+            var = node.var
+            if var.depth == 0 and type(frame[var.slot]) is str and (addition := appended(node)):
+                push((APPEND, var.slot, frame))
+                node = addition
+                continue
+            push((ASSIGN, var, frame))
+            node = node.expr
+            continue
+        elif t is If:
+            push((IF, node, frame))
+            node = node.cond
+            continue
+        elif t is Call:
+            func, args = node.func, node.args
+            if type(func) is Var and args:
+                func_value = frame[func.slot] if func.depth == 0 else frame[0][func.slot]
+                if not isinstance(func_value, tuple) or len(func_value) != 3:
+                    raise TypeError("Attempted to call a non-function")
+                push((CALL_ARGS, node, frame, func_value, []))
+                node = args[0]
+            else:
+                push((CALL_FUNC, node, frame))
+                node = func
+            continue
+        elif t is Let:
+            push((LET, node, frame))
+            node = node.e
+            continue
+        elif t is list:
+            if not node:
+                value = None
+            else:
+                if len(node) > 1:
+                    push((SEQ, node, 1, frame))
+                node = node[0]
+                continue
+        elif t is While:
+            push((WHILE_TEST, node, frame, None))
+            node = node.condition
+            continue
+        elif t is Hoisted:
+            value = frame[node.var.slot]
+            if value is None:
+                push((HOIST, node.var.slot, frame))
+                node = node.expr
+                continue
+        elif t is Fun:
+            value = make_closure(node, frame)
+        elif t is ArrayIndex:
+            push((INDEX, node, frame, None, -1, None))
+            node = node.array
+            continue
+        elif t is ArrayAssign:
+            push((ARRAY_ASSIGN, node, frame, 0, None, None, None))
+            node = node.array
+            continue
+        elif t is Array:
+            if not node.elements:
+                value = []
+            else:
+                push((ARRAY, node.elements, frame, []))
+                node = node.elements[0]
+                continue
+        elif t is MapAccess and type(node.key) is str and type(node.map) is Var:
+            # A literal key (see resolver.map_key()) of a map in a variable, looked up on the spot
+            var = node.map
+            value = map_access(frame[var.slot] if var.depth == 0 else frame[0][var.slot], node.key)
+        elif t is MapAssign and type(node.key) is str and type(node.map) is Var:
+            var = node.map
+            push((MAP_STORE, frame[var.slot] if var.depth == 0 else frame[0][var.slot], node.key))
+            node = node.value
+            continue
+        elif t is str:
+            value = node
+        elif t is Unset:
+            value = None
+        elif isinstance(node, Token):
+            value = node.v
+        else:
+            parts, finish = gather(node)
+            if not parts:
+                value = finish([])
+            else:
+                push((GATHER, parts, frame, [], finish))
+                node = parts[0]
+                continue
+
+        # Hand value to continuations until one has a part to work out
+        while stack:
+            k = pop()
+            tag = k[0]
+            if tag == BINOP_APPLY:
+                value = k[1](k[2], value)
+            elif tag == SEQ:
+                statements, i = k[1], k[2]
+                if i + 1 < len(statements):
+                    push((SEQ, statements, i + 1, k[3]))
+                node = statements[i]
+                frame = k[3]
+                break
+            elif tag == ASSIGN:
+                var = k[1]
+                if var.depth == 0:
+                    k[2][var.slot] = value
+                else:
+                    k[2][0][var.slot] = value
+            elif tag == IF:
+                node = k[1].then if value else k[1].else_
+                frame = k[2]
+                break
+            elif tag == WHILE_TEST:
+                if value is not True:  # Only a boolean true keeps a loop going
+                    value = k[3]
+                    continue
+                push((WHILE_BODY, k[1], k[2]))
+                node = k[1].body
+                frame = k[2]
+                break
+            elif tag == WHILE_BODY:
+                push((WHILE_TEST, k[1], k[2], value))
+                node = k[1].condition
+                frame = k[2]
+                break
+            elif tag == LET:
+                let, frame = k[1], k[2]
+                if type(let.e) is Fun:
+                    # A recursive function captures itself
+                    for slot, var in enumerate(let.e.captures, 1):
+                        if var.i == let.v.i:
+                            value[2][slot] = value
+                frame[let.v.slot] = value
+                node = let.f
+                break
+            elif tag == CALL_ARGS or tag == CALL_FUNC:
+                call = k[1]
+                if tag == CALL_FUNC:
+                    func_value = value
+                    if not isinstance(func_value, tuple) or len(func_value) != 3:
+                        raise TypeError("Attempted to call a non-function")
+                    arg_values = []
+                    if call.args:
+                        push((CALL_ARGS, call, k[2], func_value, arg_values))
+                        node = call.args[0]
+                        frame = k[2]
+                        break
+                else:
+                    func_value, arg_values = k[3], k[4]
+                    arg_values.append(value)
+                    if len(arg_values) < len(call.args):
+                        push(k)
+                        node = call.args[len(arg_values)]
+                        frame = k[2]
+                        break
+                fun, body, func_env = func_value
+                memo = func_env[0]
+                if memo is not None and not call.tail:  # As in call_closure: a MEMO here would grow the stack
+                    key = memo_key(arg_values)
+                    if key is not None:
+                        value = memo.find(key)
+                        if value is not MISSING:
+                            continue
+                        push((MEMO, memo, key))
+                frame = call_frame(fun, func_env, arg_values)
+                node = body
+                break
+            elif tag == BINOP_QUICK:
+                quick, left_value = k[1].quick, k[2]
+                if quick and type(left_value) is quick[0] and type(value) is quick[1]:
+                    value = quick[2](left_value, value)
+                else:
+                    value = quicken_binop(k[1], left_value, value)
+            elif tag == BINOP_RIGHT:
+                push((BINOP_APPLY, k[3], value) if k[3] else (BINOP_QUICK, k[1], value))
+                node = k[1].right
+                frame = k[2]
+                break
+            elif tag == MAP_STORE:
+                value = map_assign(k[1], k[2], value)
+            elif tag == APPEND:
+                value = append_string(k[2], k[1], value)
+            elif tag == MEMO:
+                k[1].add(k[2], value)
+            elif tag == HOIST:
+                k[2][k[1]] = value
+            elif tag == INDEX:
+                index, frame, current, i, start = k[1], k[2], k[3], k[4], k[5]
+                if i < 0:
+                    current = value
+                elif start is not None:  # The column of a Grid's row, as in eval.py
+                    current = current.get(start, value)
+                    start = None
+                elif type(current) is index.quick and type(value) is int and 0 <= value < len(current):
+                    current = current[value]
+                elif type(current) is Grid and current.rows is None:
+                    start = current.row_start(value)
+                else:
+                    quicken_index(index, current, value)
+                    current = index_value(current, value)
+                i += 1
+                if i < len(index.index):
+                    push((INDEX, index, frame, current, i, start))
+                    node = index.index[i]
+                    break
+                value = current if start is None else GridRow(current.buffer, start, current.cols)
+            elif tag == ARRAY_ASSIGN:
+                assign, frame, step, current, new_value, start = k[1], k[2], k[3], k[4], k[5], k[6]
+                indices = assign.index
+                if step == 0:  # The array
+                    push((ARRAY_ASSIGN, assign, frame, 1, value, None, None))
+                    node = assign.value
+                    break
+                if step == 1:  # The value to store
+                    new_value = value
+                elif step - 1 < len(indices):  # An index to go through
+                    i = element_index(current, value)
+                    if step == len(indices) and type(current) is Grid and current.rows is None:
+                        start = i * current.cols  # The row of a Grid: its column comes next
+                    else:
+                        current = current[i]
+                else:  # The index to store at
+                    if start is not None:
+                        current.set(start, value, new_value)
+                    else:
+                        current[element_index(current, value)] = new_value
+                    value = new_value
+                    continue
+                push((ARRAY_ASSIGN, assign, frame, step + 1, current, new_value, start))
+                node = indices[step - 1]
+                break
+            elif tag == ARRAY:
+                elements, items = k[1], k[3]
+                items.append(value)
+                if len(items) < len(elements):
+                    push(k)
+                    node = elements[len(items)]
+                    frame = k[2]
+                    break
+                value = literal_grid(items) if all(type(elem) is Array for elem in elements) else pack(items)
+            elif tag == GATHER:
+                parts, values = k[1], k[3]
+                values.append(value)
+                if len(values) < len(parts):
+                    push(k)
+                    node = parts[len(values)]
+                    frame = k[2]
+                    break
+                value = k[4](values)
+        else:
+            return value
+
+def gather(node):
+    """
+    For the nodes that just work out their parts in order and then combine
+    them: the parts, and a function of their values giving the node's value.
+    """
+    match node:
+        case ArrayInit(value, size):
+            return [value, size], lambda values: make_array(*values)
+        case Map(entries):
+            parts = []
+            for key, value in entries.items():
+                if not isinstance(key, str):  # Plain string keys are used as they are
+                    parts.append(key)
+                parts.append(value)
+            def make_map(values):
+                values = iter(values)
+                return {key if isinstance(key, str) else next(values): next(values) for key in entries}
+            return parts, make_map
+        case MapAssign(map, key, value):
+            if type(key) is str:  # A literal key, used as it is
+                return [map, value], lambda values: map_assign(values[0], key, values[1])
+            return [map, key, value], lambda values: map_assign(*values)
+        case MapAccess(map, key):
+            if type(key) is str:
+                return [map], lambda values: map_access(values[0], key)
+            return [map, key], lambda values: map_access(*values)
+        case Input(prompt):
+            return [prompt], lambda values: read_input(values[0])
+        case Print(value):
+            return [value], lambda values: print_(values[0])
+        case Sort(array, descending, key):
+            parts = [part for part in (array, descending, key) if part is not None]
+            return parts, lambda values: sort_array(*values, call=call_function)
+        case Builtin(name, args):
+            builtin = BUILTINS[name]
+            return args, lambda values: builtin(call_function, *values)
+    raise ValueError(f"Unknown AST node := {node}")
+
+def call_function(closure, arg_values):
+    """
+    Call a closure for a builtin. This runs a loop of its own, so unlike a
+    Call it nests Python calls, one level for each builtin the call is inside.
+    """
+    return call_closure(closure, arg_values, execute)
+
+def map_assign(map_value, key_value, value_value):
+    if not isinstance(map_value, dict):
+        raise TypeError("Cannot assign to non-map")
+    map_value[key_value] = value_value
+    return value_value
+
+def map_access(map_value, key_value):
+    if not isinstance(map_value, dict):
+        raise TypeError("Cannot access non-map")
+    return map_value[key_value]
+
+def print_(value):
+    print_value(value)
+    return value
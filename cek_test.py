@@ -0,0 +1,171 @@
+import glob
+import os
+import pytest
+from array import array
+from cek import run
+from compiler import ENGINES
+from eval import e
+from optimizer import optimize
+from parser import parse
+from resolver import resolve
+from lexer import IntToken, FloatToken, StringToken
+import runtime
+
+def cek(code):
+    return run(resolve(parse(code)))
+
+def test_arithmetic_and_lets():
+    assert cek("let x be 2 in let y be x * 3 in (x + y) * (y - x) end end") == IntToken(32)
+
+def test_loops_and_assignment():
+    assert cek("let n be 0 in let i be 0 in while {i < 5} do n := n + i; i := i + 1 end; n end end") == IntToken(10)
+    assert cek("let i be 0 in while {i > 0} do i end end") is None
+
+def test_closures_and_recursion():
+    assert cek("let f be fun(n) is if {n < 2} then n else f(n - 1) + f(n - 2) end in f(15) end") == IntToken(610)
+    assert cek("let x be 1 in let f be fun(y) is x := x + y; x in f(5) + f(5) + x end end") == IntToken(13)
+
+def test_arrays_and_maps():
+    result = cek('let a be [1, [2, 3]] in let m be {"k": 4} in a[1][0] := m."k"; m."j" := a[1][0] + 1; [a, m."j"] end end')
+    assert result == [[IntToken(1), [IntToken(4), IntToken(3)]], IntToken(5)]
+
+def test_deep_recursion_without_tail_calls():
+    assert cek("let f be fun(n) is if {n == 0} then 0 else n + f(n - 1) end in f(50000) end") == IntToken(1250025000)
+
+def test_deeply_nested_expressions():
+    depth = 20000
+    assert cek("(1 + " * depth + "0" + ")" * depth) == IntToken(depth)
+
+def test_errors_are_raised_as_by_the_tree_walker():
+    for code in ['1 - "a"', "let f be 1 in f(2) end", "let f be fun(x) is x in f(1, 2) end", "let a be [1] in a[3] end"]:
+        errors = []
+        for engine in (e, run):
+            try:
+                engine(resolve(parse(code)))
+            except Exception as error:
+                errors.append((type(error), str(error)))
+        assert len(errors) == 2 and errors[0] == errors[1], code
+
+def test_golden_programs_agree(capsys):
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(here, "tests", "*", "code.txt"))):
+        if os.path.basename(os.path.dirname(path)) == "input":
+            continue
+        with open(path) as f:
+            tree = optimize(resolve(parse(f.read())))
+        results = []
+        for engine in ENGINES.values():
+            results.append((engine(tree), capsys.readouterr().out))
+        assert results[1:] == results[:-1], path
+
+def test_tree_engines_quicken_alike(monkeypatch):
+    code = 'let f be fun(a, b) is a + b in let g be fun(a, i) is a[i] in [f(1, 2), f(3, 4), f("a", "b"), g([5], 0), g("xy", 1)] end end'
+    counts = []
+    for engine in (e, run):
+        monkeypatch.setattr(runtime, "quick_stats", runtime.QuickStats())
+        assert engine(resolve(parse(code))) == [IntToken(3), IntToken(7), StringToken("ab"), IntToken(5), StringToken("y")]
+        counts.append(str(runtime.quick_stats))
+    assert counts == ["2 nodes specialized, 2 deoptimized"] * 2
+
+def test_engines_agree_on_packed_arrays():
+    code = ('let a be [(0, 50)] in let i be 0 in while {i < 50} do a[i] := 50 - i; i := i + 1 end; '
+            'a[3] := a[3] + 0.5; sort(a); [a[0], a[49], a[46]] end end')
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == [IntToken(1), IntToken(50), FloatToken(47.5)]
+
+def test_engines_agree_on_grids():
+    code = ('let a be [[3, 4], [1, 2]] in let b be [([(0, 2)], 2)] in let r be a[0] in '
+            'b[1][0] := a[1][1] * r[1]; r[0] := 5; sort(a); a[1] := b[1]; b[1][1] := 6; [a, b] end end end')
+    expected = [[[IntToken(1), IntToken(2)], [IntToken(8), IntToken(6)]], [[IntToken(0), IntToken(0)], [IntToken(8), IntToken(6)]]]
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == expected
+
+def test_engines_agree_on_builtins():
+    code = ('let a be [(0, 40)] in let i be 0 in while {i < 40} do a[i] := i; i := i + 1 end; '
+            'let odd be filter(fun(x) is x % 2 == 1, a) in '
+            '[sum(a), sum(map(fun(x) is x * x, odd)), reduce(fun(s, x) is s - x, odd, 0.5), dot(a, a), '
+            'matmul([[1, 2], [3, 4]], [[5], [6]]), odd[19]] end end end')
+    expected = [IntToken(780), IntToken(10660), FloatToken(-399.5), IntToken(20540),
+                [[IntToken(17)], [IntToken(39)]], IntToken(39)]
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == expected
+
+def test_bound_names_shadow_builtins():
+    code = "let sum be fun(a) is 0 in let map be 2 in sum([1, 2]) + map end end"
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == IntToken(2)
+
+def test_engines_agree_on_sort_variants():
+    code = ('let rows be [[1, "b"], [0, "c"], [2, "a"]] in let g be [([(0, 2)], 3)] in g[2][1] := 4; '
+            '[sort([3, 1, 2], true), sort(rows, false, 1), sort(g, true, fun(r) is r[1])] end end')
+    expected = [[IntToken(3), IntToken(2), IntToken(1)],
+                [[IntToken(2), StringToken("a")], [IntToken(1), StringToken("b")], [IntToken(0), StringToken("c")]],
+                [[IntToken(0), IntToken(4)], [IntToken(0), IntToken(0)], [IntToken(0), IntToken(0)]]]
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == expected
+
+def test_engines_agree_on_building_strings():
+    code = ('let s be "a" in let t be s in let i be 0 in '
+            'while {i < 3} do i := i + 1; s := s + i; t := t + "b"; s := s + (s := "c") end; '
+            'let u be s in s := s + "d"; [s, t, u, i + (i := i + 1) + i] end end end end')
+    expected = [StringToken("a1c2c3cd"), StringToken("abbb"), StringToken("a1c2c3c"), IntToken(11)]
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == expected
+
+def test_engines_agree_on_map_keys():
+    code = ('let m be {"a": 1} in let k be "b" in let f be fun(x) is x."a" in '
+            'm."b" := m."a" + 1; m.(k) := m.(k) * 10; m."a" := f(m) + m.(k); [m."a", m."b"] end end end')
+    for engine in ENGINES.values():
+        assert engine(resolve(parse(code))) == [IntToken(21), IntToken(20)]
+    for code in ['let m be 1 in m."a" end', 'let m be 1 in m."a" := 2 end', 'let m be {"a": 1} in m."b" end']:
+        errors = []
+        for engine in ENGINES.values():
+            try:
+                engine(resolve(parse(code)))
+            except Exception as error:
+                errors.append((type(error), str(error)))
+        assert len(errors) == len(ENGINES) and errors[1:] == errors[:-1], code
+
+def with_and_without_numpy(monkeypatch, make):
+    """make() with NumPy, then as runtime would make it without NumPy installed."""
+    with_numpy = make()
+    monkeypatch.setattr(runtime, "numpy", None)
+    without_numpy = make()
+    monkeypatch.undo()
+    return with_numpy, without_numpy
+
+def as_lists(value):
+    return [list(row) for row in value] if type(value) is runtime.Grid else value
+
+def test_numpy_builtins_match_the_fallback(monkeypatch):
+    pytest.importorskip("numpy")
+    big = 2 ** 62
+    small = runtime.pack(list(range(-20, 20)))
+    cases = [
+        (runtime.sum_array, [small], None),
+        (runtime.sum_array, [runtime.pack([runtime.INT64_MAX // 40] * 40)], None),
+        (runtime.sum_array, [runtime.pack([big] * 40)], 40 * big),  # Past int64, so must fall back
+        (runtime.dot, [small, runtime.pack(list(range(40)))], None),
+        (runtime.dot, [runtime.pack([2 ** 31] * 40), runtime.pack([-2 ** 31] * 40)], -40 * 2 ** 62),
+    ]
+    for rows, value in [(6, 7), (6, 2 ** 31)]:
+        a = runtime.Grid(runtime.NumArray(array("q", [value - i for i in range(rows * rows)])), rows, rows)
+        cases.append((runtime.matmul, [a, a], None))
+    assert runtime.int_vector(small.items) is not None
+    for f, args, expected in cases:
+        with_numpy, without_numpy = with_and_without_numpy(monkeypatch, lambda: as_lists(f(None, *args)))
+        assert with_numpy == without_numpy
+        assert type(with_numpy) is type(without_numpy)
+        if expected is not None:
+            assert with_numpy == expected
+
+def test_numpy_sorting_matches_the_fallback(monkeypatch):
+    pytest.importorskip("numpy")
+    values = [runtime.INT64_MAX, -runtime.INT64_MAX - 1, 0, -1, 1] + [(i * 7919) % 101 - 50 for i in range(40)]
+    for reverse in (False, True):
+        def sorted_packed():
+            packed = runtime.pack(list(values))
+            packed.sort(reverse=reverse)
+            return type(packed.items), list(packed)
+        with_numpy, without_numpy = with_and_without_numpy(monkeypatch, sorted_packed)
+        assert with_numpy == without_numpy == (array, sorted(values, reverse=reverse))
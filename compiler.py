@@ -0,0 +1,321 @@
+from tree import *
+from lexer import *
+from resolver import frame_size
+from runtime import *
+from eval import e
+import cek
+import operator
+
+# Closure compilation: instead of re-dispatching on every node each time it
+# runs, walk the resolved tree once and turn each node into a Python function
+# of the current frame. Operators, child functions and variable slots are
+# looked up here, at compile time, and captured by the functions returned.
+# Frames, closures and values are as in eval.py, except that a closure holds
+# its compiled body where eval's holds the body's tree.
+
+def run(tree: AST):
+    """Compile a resolved program and run it in a fresh top-level frame, returning the result boxed."""
+    return box(compile_node(tree)([None] * frame_size(tree)))
+
+def compile_node(tree):
+    match tree:
+        case Token():
+            value = tree.v
+            return lambda stack: value
+        case Var(v, i, depth, slot):
+            if depth == 0:
+                return lambda stack: stack[slot]
+            return lambda stack: stack[0][slot]
+        case Hoisted(var, expr):
+            return compile_hoisted(var.slot, compile_node(expr))
+        case Unset():
+            return lambda stack: None
+        case Array(elements):
+            element_codes = compile_each(elements)
+            if elements and all(type(elem) is Array for elem in elements):
+                return lambda stack: literal_grid([code(stack) for code in element_codes])
+            if len(element_codes) >= PACKED_MIN_LENGTH:
+                return lambda stack: pack([code(stack) for code in element_codes])
+            return lambda stack: [code(stack) for code in element_codes]
+        case ArrayIndex(array, indices):
+            return compile_array_index(array, indices)
+        case ArrayAssign(array, indices, value):
+            return compile_array_assign(array, indices, value)
+        case ArrayInit(value, size):
+            value_code = compile_node(value)
+            size_code = compile_node(size)
+            return lambda stack: make_array(value_code(stack), size_code(stack))
+        case Fun():
+            return compile_fun(tree)
+        case Call(func, args, tail):
+            return compile_call(func, args, tail)
+        case Assign(var, expr):
+            expr_code = compile_node(expr)
+            slot = var.slot
+            if appended(tree):
+                addition_code = compile_node(appended(tree))
+                def assign(stack):
+                    if type(stack[slot]) is str:
+                        return append_string(stack, slot, addition_code(stack))
+                    stack[slot] = value = expr_code(stack)
+                    return value
+            elif var.depth == 0:
+                def assign(stack):
+                    stack[slot] = value = expr_code(stack)
+                    return value
+            else:
+                def assign(stack):
+                    stack[0][slot] = value = expr_code(stack)
+                    return value
+            return assign
+        case Let(variable, value_expr, body_expr):
+            return compile_let(variable, value_expr, body_expr)
+        case While(condition, body):
+            return compile_while(condition, body)
+        case BinOp(op, left, right) | TypedBinOp(op, left, right):
+            operation = (TYPED_OPS if isinstance(tree, TypedBinOp) else BINARY_OPS)[op]
+            left_code = compile_node(left)
+            right_code = compile_node(right)
+            return lambda stack: operation(left_code(stack), right_code(stack))
+        case If(cond, then, else_):
+            cond_code = compile_node(cond)
+            then_code = compile_node(then)
+            else_code = compile_node(else_)
+            return lambda stack: then_code(stack) if cond_code(stack) else else_code(stack)
+        case Map(entries):
+            return compile_map(entries)
+        case MapAssign(map, key, value):
+            return compile_map_assign(map, key, value)
+        case MapAccess(map, key):
+            return compile_map_access(map, key)
+        case str():  # Plain strings, as map keys and access fields
+            return lambda stack: tree
+        case list():  # A list of statements
+            return compile_block(tree)
+        case Input(prompt):
+            prompt_code = compile_node(prompt)
+            return lambda stack: read_input(prompt_code(stack))
+        case Print(value):
+            value_code = compile_node(value)
+            def print_(stack):
+                result = value_code(stack)
+                print_value(result)
+                return result
+            return print_
+        case Sort(array, descending, key):
+            array_code = compile_node(array)
+            if descending is None:
+                return lambda stack: sort_array(array_code(stack))
+            part_codes = compile_each([part for part in (array, descending, key) if part is not None])
+            return lambda stack: sort_array(*[code(stack) for code in part_codes], call=call_function)
+        case Builtin(name, args):
+            builtin = BUILTINS[name]
+            arg_codes = compile_each(args)
+            return lambda stack: builtin(call_function, *[code(stack) for code in arg_codes])
+        case _:
+            raise ValueError(f"Unknown AST node := {tree}")
+
+def compile_each(trees):
+    return [compile_node(t) for t in trees]
+
+def compile_block(statements):
+    codes = compile_each(statements)
+    if not codes:
+        return lambda stack: None
+    *init, last = codes
+    def block(stack):
+        for code in init:
+            code(stack)
+        return last(stack)
+    return block
+
+def compile_hoisted(slot, expr_code):
+    def hoisted(stack):
+        value = stack[slot]
+        if value is None:
+            value = stack[slot] = expr_code(stack)
+        return value
+    return hoisted
+
+def compile_array_index(array, indices):
+    array_code = compile_node(array)
+    index_codes = compile_each(indices)
+    if len(index_codes) == 1:
+        [index_code] = index_codes
+        return lambda stack: index_value(array_code(stack), index_code(stack))
+    if len(index_codes) == 2:
+        row_code, column_code = index_codes
+        def array_index(stack):
+            current = array_code(stack)
+            i = row_code(stack)
+            if type(current) is Grid and current.rows is None:
+                return current.get(current.row_start(i), column_code(stack))
+            return index_value(index_value(current, i), column_code(stack))
+        return array_index
+    def array_index(stack):
+        current = array_code(stack)
+        start = None  # As in eval.py
+        for index_code in index_codes:
+            idx_val = index_code(stack)
+            if start is not None:
+                current = current.get(start, idx_val)
+                start = None
+            elif type(current) is Grid and current.rows is None:
+                start = current.row_start(idx_val)
+            else:
+                current = index_value(current, idx_val)
+        return current if start is None else GridRow(current.buffer, start, current.cols)
+    return array_index
+
+def compile_array_assign(array, indices, value):
+    array_code = compile_node(array)
+    value_code = compile_node(value)
+    *outer_codes, last_code = compile_each(indices)
+    def array_assign(stack):
+        current = array_code(stack)
+        val = value_code(stack)
+        for i, index_code in enumerate(outer_codes):
+            idx_val = element_index(current, index_code(stack))
+            if i == len(outer_codes) - 1 and type(current) is Grid and current.rows is None:
+                current.set(idx_val * current.cols, last_code(stack), val)
+                return val
+            current = current[idx_val]
+        current[element_index(current, last_code(stack))] = val
+        return val
+    return array_assign
+
+def compile_fun(fun: Fun):
+    body_code = compile_node(fun.body)
+    captures = [(var.depth, var.slot) for var in fun.captures]
+    pure = fun.pure
+    def make_closure(stack):
+        env = [Memo(fun) if pure else None]
+        for depth, slot in captures:
+            env.append(stack[slot] if depth == 0 else stack[0][slot])
+        return (fun, body_code, env)
+    return make_closure
+
+def compile_call(func, args, tail):
+    func_code = compile_node(func)
+    arg_codes = compile_each(args)
+    if tail:
+        def tail_call(stack):
+            func_value = func_code(stack)
+            if not isinstance(func_value, tuple) or len(func_value) != 3:
+                raise TypeError("Attempted to call a non-function")
+            return TailCall(func_value, [code(stack) for code in arg_codes])
+        return tail_call
+    def call(stack):
+        func_value = func_code(stack)
+        if not isinstance(func_value, tuple) or len(func_value) != 3:
+            raise TypeError("Attempted to call a non-function")
+        return call_closure(func_value, [code(stack) for code in arg_codes], operator.call)
+    return call
+
+def call_function(closure, arg_values):
+    """Call a closure for a builtin."""
+    return call_closure(closure, arg_values, operator.call)
+
+def compile_let(variable, value_expr, body_expr):
+    slot = variable.slot
+    value_code = compile_node(value_expr)
+    body_code = compile_node(body_expr)
+    if isinstance(value_expr, Fun):
+        # A recursive function captures itself
+        self_slots = [k for k, var in enumerate(value_expr.captures, 1) if var.i == variable.i]
+        def let_fun(stack):
+            closure = value_code(stack)
+            for k in self_slots:
+                closure[2][k] = closure
+            stack[slot] = closure
+            return body_code(stack)
+        return let_fun
+    def let(stack):
+        stack[slot] = value_code(stack)
+        return body_code(stack)
+    return let
+
+def compile_while(condition, body):
+    cond_code = compile_node(condition)
+    body_codes = compile_each(body)
+    def loop(stack):
+        result = None
+        while True:
+            condition = cond_code(stack)
+            if condition is not True:  # Only a boolean true keeps a loop going
+                break
+            result = None  # Let go of the last value, which may be a string the body adds to
+            for code in body_codes:
+                result = code(stack)
+        return result
+    return loop
+
+def compile_map(entries):
+    entry_codes = []
+    for key, value in entries.items():
+        key_code = None if isinstance(key, str) else compile_node(key)  # Plain string keys are used as they are
+        entry_codes.append((key, key_code, compile_node(value)))
+    def make_map(stack):
+        evaluated_map = {}
+        for key, key_code, value_code in entry_codes:
+            if key_code is not None:
+                key = key_code(stack)
+            evaluated_map[key] = value_code(stack)
+        return evaluated_map
+    return make_map
+
+def compile_map_assign(map, key, value):
+    map_code = compile_node(map)
+    value_code = compile_node(value)
+    if type(key) is str:  # A literal key, see resolver.map_key(): stored under as it is
+        def map_assign(stack):
+            map_value = map_code(stack)
+            value_value = value_code(stack)
+            if type(map_value) is not dict:
+                raise TypeError("Cannot assign to non-map")
+            map_value[key] = value_value
+            return value_value
+        return map_assign
+    key_code = compile_node(key)
+    def map_assign(stack):
+        map_value = map_code(stack)
+        key_value = key_code(stack)
+        value_value = value_code(stack)
+        if not isinstance(map_value, dict):
+            raise TypeError("Cannot assign to non-map")
+        map_value[key_value] = value_value
+        return value_value
+    return map_assign
+
+def compile_map_access(map, key):
+    map_code = compile_node(map)
+    if type(key) is str:  # As in compile_map_assign()
+        if type(map) is Var and map.depth == 0:
+            slot = map.slot
+            def map_access(stack):
+                map_value = stack[slot]
+                if type(map_value) is not dict:
+                    raise TypeError("Cannot access non-map")
+                return map_value[key]
+            return map_access
+        def map_access(stack):
+            map_value = map_code(stack)
+            if type(map_value) is not dict:
+                raise TypeError("Cannot access non-map")
+            return map_value[key]
+        return map_access
+    key_code = compile_node(key)
+    def map_access(stack):
+        map_value = map_code(stack)
+        key_value = key_code(stack)
+        if not isinstance(map_value, dict):
+            raise TypeError("Cannot access non-map")
+        return map_value[key_value]
+    return map_access
+
+# The ways to run a resolved program, by the name --engine takes
+ENGINES = {
+    "tree": e,
+    "closure": run,
+    "cek": cek.run,
+}
@@ -0,0 +1,50 @@
+import glob
+import os
+from compiler import run, compile_node
+from eval import e
+from parser import parse
+from resolver import resolve
+from lexer import IntToken
+from tree import BinOp
+
+def both(code):
+    tree = resolve(parse(code))
+    return e(tree), run(tree)
+
+def test_binary_operator():
+    code = compile_node(BinOp("+", IntToken(3), IntToken(5)))
+    assert code([None]) == 8
+
+def test_closures_and_recursion():
+    walked, compiled = both("let f be fun(n) is if {n < 2} then n else f(n - 1) + f(n - 2) end in f(15) end")
+    assert walked == compiled == IntToken(610)
+
+def test_snapshot_semantics():
+    walked, compiled = both("let x be 1 in let f be fun(y) is x := x + y; x in f(5) + f(5) + x end end")
+    assert walked == compiled == IntToken(13)
+
+def test_arrays_and_maps():
+    walked, compiled = both('let a be [1, [2, 3]] in let m be {"k": 4} in a[1][0] := m."k"; a end end')
+    assert walked == compiled
+    assert compiled[1][0] == IntToken(4)
+
+def test_golden_programs_agree(capsys):
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(here, "tests", "*", "code.txt"))):
+        if os.path.basename(os.path.dirname(path)) == "input":
+            continue
+        with open(path) as f:
+            tree = resolve(parse(f.read()))
+        walked = e(tree)
+        walked_output = capsys.readouterr().out
+        compiled = run(tree)
+        assert (compiled, capsys.readouterr().out) == (walked, walked_output), path
+
+def test_tail_calls():
+    walked, compiled = both("let f be fun(n, acc) is if {n == 0} then acc else f(n - 1, acc + n) end in f(20000, 0) end")
+    assert walked == compiled == IntToken(200010000)
+
+def test_tail_call_to_another_closure():
+    code = "let k be fun(x) is x * 2 in let f be fun(n) is if {n == 0} then 0 else k(n) end in f(4) end end"
+    walked, compiled = both(code)
+    assert walked == compiled == IntToken(8)
@@ -1,30 +1,44 @@
 from tree import *
+from resolver import frame_size
 from lexer import *
-from decimal import Decimal
-import copy
+from runtime import *
 
-def lookup(env, v, i = None):
-    for u, uv in reversed(env):
-        if isinstance(u, Var):
-            if u.v == v and u.i == i:
-                return uv
-        else:
-            if u == v:
-                return uv
-    raise ValueError("No value found.")
+# Environments are frames: lists whose slot 0 holds the running closure's
+# captured values and whose remaining slots hold the variables the resolver
+# assigned to them. A resolved Var's (depth, slot) says whether to read the
+# frame itself or the captured values, and which slot, so no lookup compares
+# names and nothing is copied but what a closure actually uses.
+
+def make_closure(fun: Fun, stack):
+    env = [Memo(fun) if fun.pure else None]
+    for var in fun.captures:
+        env.append(stack[var.slot] if var.depth == 0 else stack[0][var.slot])
+    return (fun, fun.body, env)
 
 def e(tree: AST, stack=None):
 
     if stack is None:
-        stack = []
+        return box(e(tree, [None] * frame_size(tree)))
 
     match tree:
         case Token():
-            return tree
-        case Var(v, i):
-            return lookup(stack, v, i)
+            return tree.v
+        case Var(v, i, depth, slot):
+            if depth == 0:
+                return stack[slot]
+            return stack[0][slot]
+        case Hoisted(var, expr):
+            value = stack[var.slot]
+            if value is None:
+                value = stack[var.slot] = e(expr, stack)
+            return value
+        case Unset():
+            return None
         case Array(elements):
-            return [e(elem, stack) for elem in elements]
+            values = [e(elem, stack) for elem in elements]
+            if elements and all(type(elem) is Array for elem in elements):
+                return literal_grid(values)
+            return pack(values)
         # case ArrayIndex(array, index):
         #     arr = e(array, stack)
         #     idx = e(index, stack)
@@ -50,52 +64,35 @@ def e(tree: AST, stack=None):
         
         case ArrayIndex(array, indices):
             current = e(array, stack)
+            quick = tree.quick
+            start = None  # Where the row of Grid current just indexed starts, until its column is indexed
             for idx in indices:
                 idx_val = e(idx, stack)
-                if not isinstance(idx_val, IntToken):
-                    raise TypeError("Array/string index must be an integer")
-                if isinstance(current, StringToken):
-                    if idx_val.v < 0 or idx_val.v >= len(current.v):
-                        raise IndexError(f"String index out of bounds: {idx_val.v}, string length: {len(current.v)}")
-                    current = StringToken(current.v[int(idx_val.v)])
-                elif not isinstance(current, list):
-                    raise TypeError(f"Cannot index into {type(current).__name__} - only arrays and strings are indexable")
+                if start is not None:
+                    current = current.get(start, idx_val)
+                    start = None
+                elif type(current) is quick and type(idx_val) is int and 0 <= idx_val < len(current):
+                    current = current[idx_val]
+                elif type(current) is Grid and current.rows is None:
+                    start = current.row_start(idx_val)
                 else:
-                    if idx_val.v < 0 or idx_val.v >= len(current):
-                        raise IndexError(f"Array index out of bounds: {idx_val.v}, array length: {len(current)}")
-                    current = current[int(idx_val.v)]
-            return current
+                    quick = quicken_index(tree, current, idx_val)
+                    current = index_value(current, idx_val)
+            return current if start is None else GridRow(current.buffer, start, current.cols)
         case ArrayAssign(array, indices, value):
-            base_arr = e(array, stack)
+            current = e(array, stack)
             val = e(value, stack)
-            current = base_arr
-            for i in range(len(indices) - 1):
-                idx_val = e(indices[i], stack)
-                if not isinstance(idx_val, IntToken):
-                    raise TypeError("Array index must be an integer")
-                if not isinstance(current, list):
-                    raise TypeError("Cannot index into non-array")
-                if idx_val.v < 0 or idx_val.v >= len(current):
-                    raise IndexError(f"Array index out of bounds: {idx_val.v}, array length: {len(current)}")
-                current = current[int(idx_val.v)]
-            final_idx = e(indices[-1], stack)
-            if not isinstance(final_idx, IntToken):
-                raise TypeError("Array index must be an integer")
-            if not isinstance(current, list):
-                raise TypeError("Cannot index into non-array")
-            if final_idx.v < 0 or final_idx.v >= len(current):
-                raise IndexError(f"Array index out of bounds: {final_idx.v}, array length: {len(current)}")
-            current[int(final_idx.v)] = val
+            last = len(indices) - 1
+            for i in range(last):
+                idx_val = element_index(current, e(indices[i], stack))
+                if i == last - 1 and type(current) is Grid and current.rows is None:
+                    current.set(idx_val * current.cols, e(indices[last], stack), val)
+                    return val
+                current = current[idx_val]
+            current[element_index(current, e(indices[last], stack))] = val
             return val
         case ArrayInit(value, size):
-            initial_value = e(value, stack)
-            size_value = e(size, stack)
-            if not isinstance(size_value, IntToken):
-                raise TypeError("Array size must be an integer")
-            if size_value.v < 0:
-                raise ValueError("Array size cannot be negative")
-            # Create a list of the specified size with the initial value
-            return [copy.deepcopy(initial_value) for _ in range(int(size_value.v))]
+            return make_array(e(value, stack), e(size, stack))
         
         # case Fun(name, func_para, func_exp, func_body):   For normal function
         #     stack.append((name, (func_para, func_exp)))
@@ -109,30 +106,24 @@ def e(tree: AST, stack=None):
         #     stack.pop()
         #     return y
         
-        case Fun(parameters, body):
-            return (parameters, body, stack.copy())
-        case Call(func, args):
+        case Fun(parameters, body, size):
+            return make_closure(tree, stack)
+        case Call(func, args, tail):
             func_value = e(func, stack)
             if not isinstance(func_value, tuple) or len(func_value) != 3:
                 raise TypeError("Attempted to call a non-function")
-            parameters, body, func_env = func_value
             arg_values = [e(arg, stack) for arg in args]
-            if len(parameters) != len(arg_values):
-                raise ValueError("Incorrect number of arguments")
-
-            call_env = func_env.copy()
-            for param, arg_val in zip(parameters, arg_values):
-                param_name = param.v if isinstance(param, Var) else param
-                call_env.append((param_name, arg_val))
-            return e(body, call_env)
+            if tail:
+                return TailCall(func_value, arg_values)
+            return call_closure(func_value, arg_values, e)
         case Assign(var, expr):
+            if var.depth == 0 and type(stack[var.slot]) is str and (addition := appended(tree)):
+                return append_string(stack, var.slot, e(addition, stack))
             value = e(expr, stack)
-            for i in range(len(stack)-1, -1, -1):
-                if stack[i][0] == var:
-                    stack[i] = (var, value)
-                    return value
-
-            stack.append((var, value))
+            if var.depth == 0:
+                stack[var.slot] = value
+            else:
+                stack[0][var.slot] = value
             return value
         case Let(variable, value_expr, body_expr):
             # if isinstance(value_expr, Fun):
@@ -153,23 +144,22 @@ def e(tree: AST, stack=None):
             #     stack.pop()
             #     return result
             if isinstance(value_expr, Fun):
-                mutual_env = stack.copy()
-                even_closure = (value_expr.parameters, value_expr.body, mutual_env)
-                mutual_env.append((variable.v, even_closure))
-                stack.append((variable.v, even_closure))
-                result = e(body_expr, stack)
-                stack.pop()
-                return result
-            else:
-                value = e(value_expr, stack)
-                stack.append((variable.v, value))
-                result = e(body_expr, stack)
-                stack.pop()
-                return result
+                even_closure = make_closure(value_expr, stack)
+                # A recursive function captures itself
+                for k, var in enumerate(value_expr.captures, 1):
+                    if var.i == variable.i:
+                        even_closure[2][k] = even_closure
+                stack[variable.slot] = even_closure
+                return e(body_expr, stack)
+            else:
+                stack[variable.slot] = e(value_expr, stack)
+                return e(body_expr, stack)
         case While():
             return eval_loop(tree, stack)
         case BinOp():
             return eval_math(tree, stack)
+        case TypedBinOp(op, left, right):
+            return TYPED_OPS[op](e(left, stack), e(right, stack))
         case If():
             return eval_cond(tree, stack)
         case Map(entries):
@@ -179,15 +169,11 @@ def e(tree: AST, stack=None):
                     evaluated_key = key
                 else:
                     evaluated_key = e(key, stack)
-                    if isinstance(evaluated_key, StringToken):
-                        evaluated_key = evaluated_key.v
                 evaluated_map[evaluated_key] = e(value, stack)
             return evaluated_map
         case MapAssign(map, key, value):
             map_value = e(map, stack)
-            key_value = e(key, stack)
-            if isinstance(key_value, StringToken):
-                key_value = key_value.v
+            key_value = key if type(key) is str else e(key, stack)  # A literal key, see resolver.map_key()
             value_value = e(value, stack)
             if not isinstance(map_value, dict):
                 raise TypeError("Cannot assign to non-map")
@@ -195,202 +181,53 @@ def e(tree: AST, stack=None):
             return value_value
         case MapAccess(map, key):
             map_value = e(map, stack)
-            key_value = e(key, stack)
-            if isinstance(key_value, StringToken):
-                key_value = key_value.v
+            key_value = key if type(key) is str else e(key, stack)
             if not isinstance(map_value, dict):
                 raise TypeError("Cannot access non-map")
             return map_value[key_value]
-        case StringToken(v):
-            return StringToken(v)
         case str():  # Handle plain strings
-            return StringToken(tree)
+            return tree
         case list():  # Handle list of statements
             result = None
             for stmt in tree:
                 result = e(stmt, stack)
             return result
         case Input(prompt):
-            prompt_val = e(prompt, stack)
-            if isinstance(prompt_val, StringToken):
-                user_input = input(prompt_val.v)
-                try:
-                    # Try to convert to number if possible
-                    if '.' in user_input:
-                        return FloatToken(Decimal(user_input))
-                    return IntToken(Decimal(user_input))
-                except:
-                    # If not a number, return as string
-                    return StringToken(user_input)
-            raise TypeError("Input prompt must be a string")
+            return read_input(e(prompt, stack))
         case Print(value):
             result = e(value, stack)
-            if isinstance(result, IntToken):
-                print(result.v)
-            elif isinstance(result, FloatToken):
-                print(result.v)
-            elif isinstance(result, StringToken):
-                print(result.v)
-            elif isinstance(result, list):
-                print(result)  
-            elif isinstance(result, dict):
-                print(result)  
-            else:
-                print(result)  
+            print_value(result)
             return result
-        case Sort(array):
-            arr = e(array, stack)
-            if not isinstance(arr, list):
-                raise TypeError("sort() can only be used on arrays")
-            def get_sort_key(item):
-                if isinstance(item, (IntToken, FloatToken)):
-                    return item.v
-                elif isinstance(item, StringToken):
-                    return item.v
-                elif isinstance(item, BoolToken):
-                    return item.v
-                return item
-            
-            arr.sort(key=get_sort_key)
-            return arr
+        case Sort(array, descending, key):
+            if descending is None:
+                return sort_array(e(array, stack))
+            values = [e(part, stack) for part in (array, descending, key) if part is not None]
+            return sort_array(*values, call=call_function)
+        case Builtin(name, args):
+            return BUILTINS[name](call_function, *[e(arg, stack) for arg in args])
         case _:
             raise ValueError(f"Unknown AST node := {tree}")
 
+def call_function(closure, arg_values):
+    """Call a closure for a builtin."""
+    return call_closure(closure, arg_values, e)
+
 def eval_math(tree: BinOp, stack):
     left = e(tree.left, stack)
     right = e(tree.right, stack)
-
-    # Get actual values from tokens
-    if isinstance(left, Token):
-        left_val = left.v
-    else:
-        left_val = left
-
-    if isinstance(right, Token):
-        right_val = right.v
-    else:
-        right_val = right
-
-    match tree.op:
-        case ">=":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) >= Decimal(right.v))
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} >= {type(right).__name__}")
-        case "<=":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) <= Decimal(right.v))
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} <= {type(right).__name__}")
-        case "//":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if right.v == 0:
-                    raise ZeroDivisionError("Floor division by zero")
-                # Floor division returns an integer
-                return IntToken(left.v // right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} // {type(right).__name__}")
-        case "or":
-            if isinstance(left, (IntToken, BoolToken)) and isinstance(right, (IntToken, BoolToken)):
-                left_val = left.v if isinstance(left, IntToken) else int(left.v)
-                right_val = right.v if isinstance(right, IntToken) else int(right.v)
-                return IntToken(1 if left_val != 0 or right_val != 0 else 0)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} or {type(right).__name__}")
-        case "and":
-            if isinstance(left, (IntToken, BoolToken)) and isinstance(right, (IntToken, BoolToken)):
-                left_val = left.v if isinstance(left, IntToken) else int(left.v)
-                right_val = right.v if isinstance(right, IntToken) else int(right.v)
-                return IntToken(1 if left_val != 0 and right_val != 0 else 0)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} and {type(right).__name__}")
-        case "%":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if right.v == 0:
-                    raise ZeroDivisionError("Modulo by zero")
-                if isinstance(left, FloatToken) or isinstance(right, FloatToken):
-                    return FloatToken(left.v % right.v)
-                return IntToken(left.v % right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} % {type(right).__name__}")
-        case "+":
-            if isinstance(left_val, (int, float, Decimal)) and isinstance(right_val, (int, float, Decimal)):
-                result = left_val + right_val
-                if isinstance(result, float) or isinstance(left_val, float) or isinstance(right_val, float):
-                    return FloatToken(Decimal(str(result)))
-                return IntToken(Decimal(str(result)))
-            elif isinstance(left_val, str) and isinstance(right_val, str):
-                return StringToken(left_val + right_val)
-            elif isinstance(left_val, str) and isinstance(right_val, (int, float, Decimal)):
-                return StringToken(left_val + str(right_val))
-            elif isinstance(left_val, (int, float, Decimal)) and isinstance(right_val, str):
-                return StringToken(str(left_val) + right_val)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} + {type(right).__name__}")
-        case "*":
-            if isinstance(left, StringToken) and isinstance(right, IntToken):
-                return StringToken(left.v * int(right.v))
-            elif isinstance(left, IntToken) and isinstance(right, StringToken):
-                return StringToken(int(right.v) * left.v)
-            elif isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if isinstance(left, FloatToken) or isinstance(right, FloatToken):
-                    return FloatToken(left.v * right.v)
-                return IntToken(left.v * right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} * {type(right).__name__}")
-        case "-":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if isinstance(left, FloatToken) or isinstance(right, FloatToken):
-                    return FloatToken(left.v - right.v)
-                return IntToken(left.v - right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} - {type(right).__name__}")
-        case "/":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if right.v == 0:
-                    raise ZeroDivisionError("Division by zero")
-                return FloatToken(left.v / right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} / {type(right).__name__}")
-        case "^":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                if isinstance(left, FloatToken) or isinstance(right, FloatToken):
-                    return FloatToken(left.v ** right.v)
-                return IntToken(left.v ** right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} ^ {type(right).__name__}")
-        case ">":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) > Decimal(right.v))
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} > {type(right).__name__}")
-        case "<":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) < Decimal(right.v))
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} < {type(right).__name__}")
-        case "==":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) == Decimal(right.v))
-            elif isinstance(left, StringToken) and isinstance(right, StringToken):
-                return BoolToken(left.v == right.v)
-            elif isinstance(left, BoolToken) and isinstance(right, BoolToken):
-                return BoolToken(left.v == right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} == {type(right).__name__}")
-        case "!=":
-            if isinstance(left, (IntToken, FloatToken)) and isinstance(right, (IntToken, FloatToken)):
-                return BoolToken(Decimal(left.v) != Decimal(right.v))
-            elif isinstance(left, BoolToken) and isinstance(right, BoolToken):
-                return BoolToken(left.v != right.v)
-            else:
-                raise TypeError(f"Invalid operation: {type(left).__name__} == {type(right).__name__}")
+    quick = tree.quick
+    if quick:
+        if type(left) is quick[0] and type(right) is quick[1]:
+            return quick[2](left, right)
+    elif quick is False:
+        return BINARY_OPS[tree.op](left, right)
+    return quicken_binop(tree, left, right)
 
 def eval_cond(tree: If, stack):
     """
     Evaluate a conditional expression.
     """
-    if e(tree.cond, stack).v:
+    if e(tree.cond, stack):
         return e(tree.then, stack)
     else:
         return e(tree.else_, stack)
@@ -399,8 +236,9 @@ def eval_loop(tree: While, stack):
     result = None
     while True:
         condition = e(tree.condition, stack)
-        if not (isinstance(condition, BoolToken) and condition.v):
+        if condition is not True:  # Only a boolean true keeps a loop going
             break
+        result = None  # Let go of the last value, which may be a string the body adds to
         for expr in tree.body:
             result = e(expr, stack)
             # print(result)
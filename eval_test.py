@@ -1,4 +1,8 @@
+from decimal import Decimal
 from eval import e
+from runtime import printable, set_decimal_mode
+from parser import parse
+from resolver import resolve
 from tree import BinOp
 from lexer import IntToken, FloatToken, StringToken, BoolToken
 
@@ -43,3 +47,56 @@ def test_nested_operations():
     result = e(tree)
     assert result.v == 20
     assert isinstance(result, IntToken)
+
+def run(code):
+    return e(resolve(parse(code)))
+
+def test_assignment_updates_slot():
+    result = run("let n be 0 in let i be 0 in while {i < 5} do n := n + i; i := i + 1 end; n end end")
+    assert result.v == 10
+
+def test_closure_sees_values_when_made():
+    result = run("let x be 1 in let f be fun(y) is x + y in x := 10; f(2) end end")
+    assert result.v == 3
+
+def test_closure_assignment_stays_local():
+    result = run("let x be 1 in let f be fun(y) is x := y; x in f(5); x end end")
+    assert result.v == 1
+
+def test_recursive_function():
+    result = run("let f be fun(n) is if {n < 2} then n else f(n - 1) + f(n - 2) end in f(15) end")
+    assert result.v == 610
+
+def test_integers_are_unbounded():
+    result = run("2 ^ 100")
+    assert result.v == 2 ** 100
+    assert type(result.v) is int
+
+def test_integer_division_and_modulo_round_toward_zero():
+    assert [run(code).v for code in ["-7 // 2", "7 // -2", "-7 % 3", "7 % -3"]] == [-3, -3, -1, 1]
+
+def test_native_floats_print_as_decimals():
+    assert printable(run("10 / 4")) == FloatToken(Decimal("2.5"))
+    assert repr(printable(run("270 / 3"))) == "FloatToken(v=Decimal('90'))"
+
+def test_integral_floats_keep_their_fraction(capsys):
+    run("let x be 2.0 in print(x); print(2.5 * 2); print(1.5 + 0.5); print(270 / 3 * 1.0); x end")
+    assert capsys.readouterr().out.split() == ["2.0", "5.0", "2.0", "90.0"]
+    assert repr(printable(run("2.0"))) == "FloatToken(v=Decimal('2.0'))"
+    assert repr(printable(run("2.0 * 3"))) == "FloatToken(v=Decimal('6.0'))"
+
+def test_decimal_mode():
+    set_decimal_mode(True)
+    try:
+        result = e(resolve(parse("10 / 3 + 0.1", decimal=True)))
+    finally:
+        set_decimal_mode(False)
+    assert result == FloatToken(Decimal("3.433333333333333333333333333"))
+
+def test_tail_calls_run_in_constant_stack():
+    result = run("let f be fun(n, acc) is if {n == 0} then acc else f(n - 1, acc + n) end in f(20000, 0) end")
+    assert result.v == 200010000
+
+def test_tail_call_through_let_and_sequence():
+    result = run("let f be fun(n) is let m be n - 1 in print(m); if {m > 0} then f(m) else 0 end end in f(3) end")
+    assert result.v == 0
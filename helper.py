@@ -1,14 +1,30 @@
+import argparse
+from compiler import ENGINES
+from runtime import printable, print_memo_stats, print_quick_stats, set_decimal_mode
+from cache import compile_program
+from inliner import INLINE_BUDGET
 import sys
-from parser import parse
-from eval import e
-from resolver import resolve
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 main.py <code_file>")
-        return
+    arg_parser = argparse.ArgumentParser(description="Run a Cobra program.")
+    arg_parser.add_argument("code_file")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always lex, parse and resolve from scratch")
+    arg_parser.add_argument("--no-optimize", action="store_true", help="skip inlining and constant folding")
+    arg_parser.add_argument("--inline-budget", type=int, default=INLINE_BUDGET, metavar="NODES",
+                            help=f"largest function body to inline, 0 for none (default {INLINE_BUDGET})")
+    arg_parser.add_argument("--verbose", action="store_true", help="report what the loop optimizations did")
+    arg_parser.add_argument("--no-memo", action="store_true", help="never memoize calls of pure functions")
+    arg_parser.add_argument("--memo-stats", action="store_true", help="report memo table hits and misses after running")
+    arg_parser.add_argument("--quicken-stats", action="store_true",
+                            help="report how many operators the tree engines specialized and deoptimized")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="cek",
+                            help="cek: walk the tree with an explicit continuation stack (default); "
+                                 "tree: walk it with Python recursion; closure: compile it to Python closures first")
+    arg_parser.add_argument("--decimal", action="store_true", help="exact Decimal floats instead of Python floats")
+    args = arg_parser.parse_args()
+    set_decimal_mode(args.decimal)
 
-    code_file = sys.argv[1]
+    code_file = args.code_file
     try:
         with open(code_file, "r") as f:
             code = f.read()
@@ -16,10 +32,16 @@ def main():
         print(f"Error: File '{code_file}' not found.")
         return
 
-    ast = parse(code)
-    abt = resolve(ast)
-    result = e(abt)
-    print(f"Result: {result}")
+    abt = compile_program(code, use_cache=not args.no_cache, decimal=args.decimal, optimized=not args.no_optimize,
+                          inline_budget=args.inline_budget,
+                          report=(lambda message: print(message, file=sys.stderr)) if args.verbose else None,
+                          memoize=not args.no_memo)
+    result = ENGINES[args.engine](abt)
+    print(f"Result: {printable(result)}")
+    if args.memo_stats:
+        print_memo_stats(sys.stderr)
+    if args.quicken_stats:
+        print_quick_stats(sys.stderr)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,172 @@
+from dataclasses import fields, replace
+from tree import *
+from lexer import *
+
+# Type inference. Every expression is labelled int, float, bool, string,
+# array, map or unknown, and a BinOp whose operand types are proven to be
+# ones its operator accepts becomes a TypedBinOp, which the engines run
+# without checking the types again (see runtime.TYPED_OPS).
+#
+# Variables are typed by all the values ever stored in them, wherever in the
+# program that happens: a let's value and every assignment. A variable that
+# no let binds, declared by assigning it, may be read before any assignment
+# has run, while it is still empty, so it is unknown. Parameters and
+# the results of calls, array and map reads and input are unknown. A
+# variable's type depends on the types of the expressions stored in it, which
+# can depend on it in turn, so the whole program is gone over until no
+# variable's type changes. float means whatever the numeric mode makes
+# floats: Python floats or Decimals, never both in one program.
+
+INT, FLOAT, BOOL, STRING, ARRAY, MAP, UNKNOWN = "int", "float", "bool", "string", "array", "map", "unknown"
+
+NUMERIC = frozenset({INT, FLOAT})
+ARITHMETIC = frozenset({"+", "-", "*"})
+COMPARISONS = frozenset({"<", ">", "<=", ">=", "==", "!="})
+EQUALITY = frozenset({"==", "!="})
+
+LITERAL_TYPES = {IntToken: INT, FloatToken: FLOAT, BoolToken: BOOL, StringToken: STRING}
+
+def join(a, b):
+    """The type of a variable holding values of type a and of type b. None is no value at all yet."""
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    return UNKNOWN
+
+def binop_type(op, left, right):
+    if left in NUMERIC and right in NUMERIC:
+        if op in ARITHMETIC:
+            return INT if left == right == INT else FLOAT
+        if op in COMPARISONS:
+            return BOOL
+        if op == "/":
+            return FLOAT
+        if op == "//":
+            return INT
+        if op == "%":
+            return INT if left == right == INT else FLOAT
+    if op in ("and", "or") and left in (INT, BOOL) and right in (INT, BOOL):
+        return INT
+    if op == "+" and STRING in (left, right) and {left, right} <= {STRING, INT, FLOAT}:
+        return STRING
+    if op == "*" and {left, right} == {STRING, INT}:
+        return STRING
+    if op == "==" and left == right == STRING:
+        return BOOL
+    if op in EQUALITY and left == right == BOOL:
+        return BOOL
+    return UNKNOWN
+
+def specialized(op, left, right) -> bool:
+    """Whether op on values of these types can run as the bare operator in runtime.TYPED_OPS."""
+    if left in NUMERIC and right in NUMERIC:
+        return op in ARITHMETIC or op in COMPARISONS or (op in ("//", "%") and left == right == INT)
+    if left == right == STRING:
+        return op in ("+", "==")  # Strings have no !=
+    return left == right == BOOL and op in EQUALITY
+
+def infer(tree: AST) -> dict:
+    """The type of every variable in a resolved tree, by id."""
+    inference = TypeInference()
+    inference.settle(tree)
+    return {i: inference.type_of(i) for i in inference.variables}
+
+def specialize(tree: AST) -> AST:
+    """tree with every BinOp whose operand types are proven turned into a TypedBinOp."""
+    inference = TypeInference()
+    inference.settle(tree)
+    inference.rewrite = True
+    node, _ = trampoline(inference.steps(tree))
+    return node
+
+class TypeInference:
+    def __init__(self):
+        self.variables = {}   # id -> type of every value stored in it so far
+        self.bound = set()    # ids of the variables a let binds
+        self.changed = False
+        self.rewrite = False  # Whether to build the specialized tree, or only work out types
+
+    def settle(self, tree):
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            trampoline(self.steps(tree))
+
+    def type_of(self, i):
+        return (self.variables.get(i) or UNKNOWN) if i in self.bound else UNKNOWN
+
+    def store(self, var, t):
+        if isinstance(var, Var):
+            joined = join(self.variables.get(var.i), t)
+            if joined != self.variables.get(var.i):
+                self.variables[var.i] = joined
+                self.changed = True
+
+    def steps(self, t):
+        """(t, rewritten if rewriting, and its type)."""
+        match t:
+            case Token():
+                return t, LITERAL_TYPES.get(type(t), UNKNOWN)
+            case Var(v, i):
+                return t, self.type_of(i)
+            case BinOp(op, left, right):
+                left, left_type = yield self.steps(left)
+                right, right_type = yield self.steps(right)
+                if self.rewrite:
+                    t = (TypedBinOp if specialized(op, left_type, right_type) else BinOp)(op, left, right)
+                return t, binop_type(op, left_type, right_type)
+            case Let(variable, value, body):
+                if isinstance(variable, Var):
+                    self.bound.add(variable.i)
+                value, value_type = yield self.steps(value)
+                self.store(variable, value_type)
+                body, body_type = yield self.steps(body)
+                return self.rebuilt(t, variable, value, body), body_type
+            case Assign(var, expr):
+                expr, expr_type = yield self.steps(expr)
+                self.store(var, expr_type)
+                return self.rebuilt(t, var, expr), expr_type
+            case If(cond, then, else_):
+                cond, _ = yield self.steps(cond)
+                then, then_type = yield self.steps(then)
+                else_, else_type = yield self.steps(else_)
+                return self.rebuilt(t, cond, then, else_), join(then_type, else_type)
+            case Hoisted(var, expr):
+                expr, expr_type = yield self.steps(expr)
+                return self.rebuilt(t, var, expr), expr_type
+            case Fun():
+                body, _ = yield self.steps(t.body)
+                return (replace(t, body=body) if self.rewrite else t), UNKNOWN
+            case list():
+                items, item_type = [], UNKNOWN
+                for item in t:
+                    item, item_type = yield self.steps(item)
+                    items.append(item)
+                return items, item_type
+            case dict():
+                entries = {}
+                for key, value in t.items():
+                    entries[key], _ = yield self.steps(value)
+                return entries, MAP
+            case AST():
+                values, types = [], {}
+                for f in fields(t):
+                    value, types[f.name] = yield self.steps(getattr(t, f.name))
+                    values.append(value)
+                node = self.rebuilt(t, *values)
+                match t:
+                    case Array() | ArrayInit() | Sort():
+                        return node, ARRAY
+                    case Builtin(name) if name in ("map", "filter", "matmul"):
+                        return node, ARRAY
+                    case Map():
+                        return node, MAP
+                    case ArrayAssign() | MapAssign() | Print():
+                        return node, types["value"]
+                return node, UNKNOWN
+            case _:
+                return t, UNKNOWN
+
+    def rebuilt(self, t, *values):
+        return type(t)(*values) if self.rewrite else t
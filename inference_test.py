@@ -0,0 +1,110 @@
+import runtime
+from inference import infer, specialize, INT, FLOAT, BOOL, STRING, ARRAY, MAP, UNKNOWN
+from parser import parse
+from resolver import resolve
+from compiler import ENGINES
+from lexer import IntToken, FloatToken, StringToken, BoolToken
+from tree import BinOp, TypedBinOp, Var
+
+def types(code, decimal=False):
+    """The type of each variable in code, by name."""
+    tree = resolve(parse(code, decimal))
+    found = infer(tree)
+    names = {}
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Var) and node.i in found:
+            names[node.v] = found[node.i]
+        if isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+        elif hasattr(node, "__dataclass_fields__"):
+            work.extend(getattr(node, name) for name in node.__dataclass_fields__)
+    return names
+
+def operators(code):
+    """The kind of each BinOp in the specialized tree of code, as (op, typed) in source order."""
+    found = []
+    work = [specialize(resolve(parse(code)))]
+    while work:
+        node = work.pop(0)
+        if isinstance(node, (BinOp, TypedBinOp)):
+            found.append((node.op, isinstance(node, TypedBinOp)))
+        if isinstance(node, list):
+            work[:0] = node
+        elif isinstance(node, dict):
+            work[:0] = node.values()
+        elif hasattr(node, "__dataclass_fields__"):
+            work[:0] = [getattr(node, name) for name in node.__dataclass_fields__]
+    return found
+
+def test_literals_and_operators_give_types():
+    assert types('let a be 1 in let b be 2.5 in let c be a < b in let d be "x" + a in '
+                 'let e be [a] in let f be {"k": b} in a end end end end end end') == {
+        "a": INT, "b": FLOAT, "c": BOOL, "d": STRING, "e": ARRAY, "f": MAP}
+    assert types("let a be 7 // 2.0 in let b be 7 / 7 in let c be 7 % 2 in a end end end") == {
+        "a": INT, "b": FLOAT, "c": INT}
+
+def test_every_stored_value_counts():
+    assert types("let i be 0 in while {i < 10} do i := i + 1 end end") == {"i": INT}
+    assert types("let x be 0 in x := x + 0.5; x end") == {"x": UNKNOWN}
+    assert types('let x be 0 in x := "a"; x end') == {"x": UNKNOWN}
+
+def test_types_flow_through_other_variables():
+    # t is only known to be an int once s is, which is assigned after t is bound
+    assert types("let s be 0 in let t be s in s := t * 2; t := s end end") == {"s": INT, "t": INT}
+
+def test_variables_declared_by_assignment_are_unknown():
+    # x may be read while still empty, when the branch that assigns it has not run
+    assert types("let c be 1 in if {c == 2} then x := 5 else 0 end; x == 5 end") == {"c": INT, "x": UNKNOWN}
+    assert operators("let c be 1 in if {c == 2} then x := 5 else 0 end; x == 5 end") == [("==", True), ("==", False)]
+    assert run_all("let c be 1 in if {c == 2} then x := 5 else 0 end; x == 5 end") == [TypeError] * len(ENGINES)
+
+def test_parameters_and_calls_are_unknown():
+    assert types("let f be fun(n) is n + 1 in let r be f(1) in r end end") == {"f": UNKNOWN, "r": UNKNOWN}
+
+def test_proven_operators_are_specialized():
+    assert operators("let i be 0 in while {i < 10} do i := i + 1 end end") == [("<", True), ("+", True)]
+    assert operators("let f be fun(n) is n + 1 in f(1) end") == [("+", False)]
+    assert operators('let s be "a" in [s + s, s == s, s != s, s * 2] end') == [
+        ("+", True), ("==", True), ("!=", False), ("*", False)]
+    assert operators("let a be 7 in let b be 2.0 in [a // a, a // b, a / a, a ^ a] end end") == [
+        ("//", True), ("//", False), ("/", False), ("^", False)]
+
+def run_all(code, decimal=False):
+    tree = specialize(resolve(parse(code, decimal)))
+    results = []
+    for engine in ENGINES.values():
+        try:
+            results.append(engine(tree))
+        except Exception as error:
+            results.append(type(error))
+    return results
+
+def test_specialized_operators_give_the_checked_results():
+    code = ("let i be -7 in let x be 0.5 in let s be \"a\" in let t be true in "
+            "[i // 2, i % 2, i * x, x - i, s + s, s == s, t == t, t != t, i < x, i >= i] end end end end")
+    expected = [IntToken(-3), IntToken(-1), FloatToken(-3.5), FloatToken(7.5), StringToken("aa"),
+                BoolToken(True), BoolToken(True), BoolToken(False), BoolToken(True), BoolToken(True)]
+    assert run_all(code) == [expected] * len(ENGINES)
+
+def test_decimal_mode():
+    runtime.set_decimal_mode(True)
+    try:
+        [result, *others] = run_all("let x be 0.1 in let i be 2 in x * i + x end end", decimal=True)
+    finally:
+        runtime.set_decimal_mode(False)
+    assert str(result.v) == "0.3"
+    assert others == [result] * len(others)
+
+def test_errors_are_kept():
+    assert run_all("let i be 1 in let z be 0 in i // z end end") == [ZeroDivisionError] * len(ENGINES)
+    assert run_all("let i be 1 in let z be 0 in i % z end end") == [ZeroDivisionError] * len(ENGINES)
+
+def test_nested_stores_are_walked_once():
+    depth = 200  # Each level walked its value twice, which took minutes already at 25
+    code = "let a be [0] in " + "a[0] := (" * depth + "1" + ")" * depth + " end"
+    assert types(code) == {"a": ARRAY}
+    assert run_all(code) == [IntToken(1)] * len(ENGINES)
@@ -0,0 +1,202 @@
+from dataclasses import fields, replace
+from tree import *
+from lexer import *
+from resolver import frame_size
+
+# Inlining of small functions. A call f(a, b) where f is let-bound to a small
+# fun(x, y) is { body } becomes
+#
+#     let x' be a in let y' be b in body' end end
+#
+# in the caller's own frame: x', y' and the callee's locals get fresh ids and
+# fresh slots at the end of the caller's frame, and every variable the callee
+# captured is read from wherever the closure would have captured it from.
+# A function is only inlined when that gives the same result as calling it:
+#
+# - it is not recursive, and every use of it is a call (it never escapes);
+# - neither it nor any variable it captures is ever assigned, so reading a
+#   captured variable at the call gives what the closure's snapshot would;
+# - its body is at most the inline budget, counted in nodes.
+#
+# Only calls from the frame that binds the function are inlined; once all of
+# them are, the let that made the closure is dropped as well.
+
+INLINE_BUDGET = 40
+
+def inline(tree: AST, budget: int = INLINE_BUDGET) -> AST:
+    if budget <= 0:
+        return tree
+    uses, calls, assigned, last_id = survey(tree)
+    inliner = Inliner(budget, uses, calls, assigned, last_id, frame_size(tree))
+    return trampoline(inliner.steps(tree))
+
+def survey(tree: AST):
+    """Count reads and direct calls of each variable, collect assigned ids and find the largest id."""
+    uses, calls, assigned = {}, {}, set()
+    last_id = 0
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Var):
+            uses[node.i] = uses.get(node.i, 0) + 1
+            continue
+        if isinstance(node, Let):
+            last_id = max(last_id, node.v.i or 0)
+            work.extend((node.e, node.f))
+        elif isinstance(node, Assign):
+            if isinstance(node.var, Var):
+                assigned.add(node.var.i)
+                last_id = max(last_id, node.var.i or 0)
+            work.append(node.expr)
+        elif isinstance(node, Fun):
+            last_id = max([last_id] + [p.i or 0 for p in node.parameters])
+            work.append(node.body)
+        elif isinstance(node, Call):
+            if isinstance(node.func, Var):
+                calls[node.func.i] = calls.get(node.func.i, 0) + 1
+            work.append(node.func)
+            work.extend(node.args)
+        elif isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return uses, calls, assigned, last_id
+
+def size(tree) -> int:
+    """The number of nodes in tree, counting tokens and strings as one each."""
+    n = 0
+    work = [tree]
+    while work:
+        node = work.pop()
+        n += 1
+        if isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return n
+
+class Inliner:
+    def __init__(self, budget, uses, calls, assigned, last_id, top_size):
+        self.budget = budget
+        self.uses = uses
+        self.calls = calls
+        self.assigned = assigned
+        self.last_id = last_id
+        self.frames = [top_size]  # Next free slot of each enclosing frame
+        self.inlinable = {}       # id -> Fun, for functions calls may be inlined to
+        self.inlined = {}         # id -> number of calls inlined
+
+    def fresh(self):
+        self.last_id += 1
+        return self.last_id
+
+    def can_inline(self, variable: Var, fun: Fun) -> bool:
+        i = variable.i
+        return (i is not None and fun.captures is not None
+                and i not in self.assigned
+                and self.uses.get(i, 0) == self.calls.get(i, 0)
+                and not fun.assigns_captured
+                and all(c.i != i and c.i not in self.assigned for c in fun.captures)
+                and size(fun.body) <= self.budget)
+
+    def steps(self, t):
+        match t:
+            case Let(variable, value, body):
+                value = yield self.steps(value)
+                if isinstance(value, Fun) and self.can_inline(variable, value):
+                    self.inlinable[variable.i] = value
+                body = yield self.steps(body)
+                if variable.i in self.inlinable and self.inlined.get(variable.i, 0) == self.uses.get(variable.i, 0):
+                    return body  # Every call was inlined, so the closure is never used
+                return Let(variable, value, body)
+            case Fun(parameters, body):
+                self.frames.append(t.size)
+                body = yield self.steps(body)
+                return replace(t, body=body, size=self.frames.pop())
+            case Call(Var(_, i, 0) as func, args):
+                args = yield from self.each(args)
+                fun = self.inlinable.get(i)
+                if fun is None or len(fun.parameters) != len(args):
+                    return replace(t, args=args)
+                self.inlined[i] = self.inlined.get(i, 0) + 1
+                return self.expand(fun, args, t.tail)
+            case AST():
+                values = []
+                for f in fields(t):
+                    values.append((yield self.steps(getattr(t, f.name))))
+                return type(t)(*values)
+            case list():
+                return (yield from self.each(t))
+            case dict():
+                entries = {}
+                for key, value in t.items():
+                    entries[key] = yield self.steps(value)
+                return entries
+            case _:
+                return t
+
+    def each(self, ts):
+        result = []
+        for t in ts:
+            result.append((yield self.steps(t)))
+        return result
+
+    def expand(self, fun: Fun, args, tail: bool):
+        """
+        fun's body moved into the current frame, with its parameters bound to
+        args. Tail calls in it stay tail calls only if the call was one.
+        """
+        base = self.frames[-1] - 1
+        self.frames[-1] += fun.size - 1
+        outer = {c.i for c in fun.captures}
+        ids = {}
+        def rename(i):
+            if i in outer:
+                return i
+            if i not in ids:
+                ids[i] = self.fresh()
+            return ids[i]
+
+        def move(t):
+            """A node of the callee's own frame, readdressed into the caller's."""
+            match t:
+                case Var(v, i, 0, slot):
+                    return Var(v, rename(i), 0, base + slot)
+                case Var(v, i, 1, slot):
+                    return replace(fun.captures[slot - 1])
+                case Fun():
+                    return replace(t, parameters=[relabel(p) for p in t.parameters], body=relabel(t.body),
+                                   captures=[move(c) for c in t.captures])
+                case Call(func, args):
+                    return Call(move(func), move(args), t.tail and tail)
+                case AST():
+                    return type(t)(*(move(getattr(t, f.name)) for f in fields(t)))
+                case list():
+                    return [move(item) for item in t]
+                case dict():
+                    return {key: move(value) for key, value in t.items()}
+                case _:
+                    return t
+
+        def relabel(t):
+            """A node of a function nested in the callee: same addresses, fresh ids."""
+            match t:
+                case Var(v, i, depth, slot):
+                    return Var(v, rename(i), depth, slot)
+                case AST():
+                    return type(t)(*(relabel(getattr(t, f.name)) for f in fields(t)))
+                case list():
+                    return [relabel(item) for item in t]
+                case dict():
+                    return {key: relabel(value) for key, value in t.items()}
+                case _:
+                    return t
+
+        result = move(fun.body)
+        for parameter, arg in reversed(list(zip(fun.parameters, args))):
+            result = Let(move(parameter), arg, result)
+        return result
@@ -0,0 +1,95 @@
+from inliner import inline
+from optimizer import optimize
+from parser import parse
+from resolver import resolve, frame_size
+from eval import e
+from compiler import run
+from lexer import IntToken
+from tree import Call, Fun, Let, Var
+
+def inlined(code, budget=40):
+    return inline(resolve(parse(code)), budget)
+
+def calls(tree):
+    found = []
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Call):
+            found.append(node)
+        if isinstance(node, list):
+            work.extend(node)
+        elif hasattr(node, "__dataclass_fields__"):
+            work.extend(getattr(node, name) for name in node.__dataclass_fields__)
+    return found
+
+def both_engines(code):
+    tree = optimize(resolve(parse(code)))
+    plain = resolve(parse(code))
+    assert e(tree) == run(tree) == e(plain)
+    return e(tree)
+
+def test_inlines_small_function():
+    tree = inlined("let square be fun(x) is x * x in square(3) + square(4) end")
+    assert calls(tree) == []
+    assert not isinstance(tree, Let) or not isinstance(tree.e, Fun)  # The closure is gone too
+    assert e(tree) == IntToken(25)
+
+def test_inlined_locals_get_new_slots():
+    tree = inlined("let f be fun(x) is let y be x + 1 in y * y end in f(1) + f(2) end")
+    assert calls(tree) == []
+    assert frame_size(tree) == 6  # f, then x and y for each call
+    assert e(tree) == IntToken(13)
+
+def test_inlines_inside_loop():
+    code = "let s be 0 in let i be 0 in let sq be fun(x) is x * x in while {i < 10} do s := s + sq(i); i := i + 1 end; s end end end"
+    assert calls(inlined(code)) == []
+    assert both_engines(code) == IntToken(285)
+
+def test_reads_captured_variables():
+    code = "let k be 10 in let add be fun(x) is x + k in add(1) + add(2) end end"
+    assert calls(inlined(code)) == []
+    assert both_engines(code) == IntToken(23)
+
+def test_inlines_into_function():
+    code = "let inc be fun(x) is x + 1 in let twice be fun(y) is inc(inc(y)) in [twice(1), twice(5)] end end"
+    assert both_engines(code) == [IntToken(3), IntToken(7)]
+
+def test_keeps_nested_closures_working():
+    code = "let adder be fun(n) is let add be fun(x) is x + n in add end in let plus be adder(2) in plus(5) end end"
+    assert calls(inlined(code))
+    assert both_engines(code) == IntToken(7)
+
+def test_leaves_recursive_functions():
+    code = "let fact be fun(n) is if {n < 2} then 1 else n * fact(n - 1) end in fact(5) end"
+    assert len(calls(inlined(code))) == 2
+    assert both_engines(code) == IntToken(120)
+
+def test_leaves_escaping_functions():
+    code = "let f be fun(x) is x + 1 in let g be f in g(1) + f(2) end end"
+    assert len(calls(inlined(code))) == 2
+    assert both_engines(code) == IntToken(5)
+
+def test_leaves_assigned_functions():
+    code = "let f be fun(x) is x + 1 in let a be f(1) in f := (fun(x) is x + 2); a + f(1) end end"
+    assert len(calls(inlined(code))) == 2
+    assert both_engines(code) == IntToken(5)
+
+def test_leaves_functions_capturing_assigned_variables():
+    code = "let k be 1 in let f be fun(x) is x + k in k := 5; f(1) end end"
+    assert len(calls(inlined(code))) == 1
+    assert both_engines(code) == IntToken(2)
+
+def test_respects_budget():
+    code = "let f be fun(x) is x * x + x * x + x in f(2) end"
+    assert len(calls(inlined(code, budget=3))) == 1
+    assert calls(inlined(code)) == []
+    assert calls(inlined(code, budget=0))
+
+def test_inlined_tail_calls_stay_tail_calls_only_in_tail_position():
+    k = "let k be fun(x) is if {x < 1} then x else k(x - 1) end in "
+    def k_calls(body):
+        tree = inlined(k + "let f be fun(z) is let g be fun(y) is k(y) in " + body + " end in f end end")
+        return [call.tail for call in calls(tree) if call.func.v == "k" and isinstance(call.args[0], Var)]  # Not k calling itself
+    assert k_calls("g(z) + 1") == [False]
+    assert k_calls("g(z)") == [True]
@@ -1,150 +1,141 @@
+import re
 from dataclasses import dataclass
 from collections.abc import Iterator
 from decimal import Decimal
+from enum import IntEnum
+from typing import ClassVar
 
 class ParseError(Exception):
     """Exception raised for errors in the parsing process."""
     pass
 
+class TokenKind(IntEnum):
+    KEYWORD  = 0
+    INT      = 1
+    FLOAT    = 2
+    BOOL     = 3
+    STRING   = 4
+    OPERATOR = 5
+    VARIABLE = 6
+
+# Tokens are slotted, and every token class carries an integer ``kind`` so the
+# parser can dispatch on it without isinstance checks. Keyword and operator
+# tokens are frozen: lex() hands out the one shared instance from KEYWORDS and
+# OPERATORS for every occurrence, so they can be compared with ``is``.
 class Token:
-    pass
+    __slots__ = ()
+    kind: ClassVar[int]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class KeywordToken(Token):
     v: str
+    kind: ClassVar[int] = TokenKind.KEYWORD
     
-@dataclass
+@dataclass(slots=True)
 class IntToken(Token):
-    v: Decimal
+    v: int
+    kind: ClassVar[int] = TokenKind.INT
 
-@dataclass
+@dataclass(slots=True)
 class FloatToken(Token):
-    v: Decimal
+    v: float | Decimal  # Decimal when the program is run with exact decimals
+    kind: ClassVar[int] = TokenKind.FLOAT
 
-@dataclass
+@dataclass(slots=True)
 class BoolToken(Token):
     v: bool
+    kind: ClassVar[int] = TokenKind.BOOL
 
-@dataclass
+@dataclass(slots=True)
 class StringToken(Token):
     v: str
+    kind: ClassVar[int] = TokenKind.STRING
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class OperatorToken(Token):
     o: str
+    kind: ClassVar[int] = TokenKind.OPERATOR
 
-@dataclass
+@dataclass(slots=True)
 class VariableToken(Token):
     v: str
+    kind: ClassVar[int] = TokenKind.VARIABLE
 
-keywords = ["if", "then", "else", "end", "let", "in", "be", "while", "do", "fun", "is", "input", "and", "or", "not", "print", "sort"]
+keywords = frozenset({"if", "then", "else", "end", "let", "in", "be", "while", "do", "fun", "is", "input", "and", "or", "not", "print", "sort"})
+operators = frozenset({"+", "-", "*", "/", "//", "%", "^", "<", "<=", ">", ">=", "==", "!=", ":=", ":",
+                       "(", ")", "{", "}", "[", "]", ",", ".", ";"})
 
-def lex(s: str) -> Iterator[Token]:
-    i = 0
-    while True:
-        # Skip whitespace
-        while i < len(s) and s[i].isspace():
-            i = i + 1
+KEYWORDS = {k: KeywordToken(k) for k in keywords}
+OPERATORS = {o: OperatorToken(o) for o in operators}
 
-        if i >= len(s):
-            return
+# One alternative per token class; the index of the group that matched
+# (``m.lastindex``) tells lex_spans() what kind of token it found.
+# Leading whitespace is swallowed by every match, so a failed match means
+# only whitespace is left.
+_WORD, _FLOAT, _INT, _STRING, _OPERATOR, _UNTERMINATED, _UNEXPECTED = range(1, 8)
 
-        if s[i].isalpha():
-            t = s[i]
-            i = i + 1
-            while i < len(s) and s[i].isalpha():
-                t = t + s[i]
-                i = i + 1
-            if t in keywords:
-                yield KeywordToken(t)
+_token_re = re.compile(r"""
+    \s*
+    (?:
+        ([^\W\d_]+)                                 # identifier, keyword or boolean
+      | (-?\d+\.\d*)                                # float, only one decimal point
+      | (-?\d+)                                     # integer
+      | "([^"]*)"                                   # string literal
+      | (<=|>=|//|==|!=|:=|[-+*^(){},\[\].;%<>/:])  # operator
+      | (")                                         # string literal with no closing quote
+      | (\S)                                        # anything else
+    )
+""", re.VERBOSE)
+
+def lex_spans(s: str, decimal: bool = False) -> Iterator[tuple[Token, int, int]]:
+    """
+    Yield (token, start, end) for every token in s, where s[start:end] is the token's source text.
+
+    Integer literals are Python ints. Float literals are floats, or exact
+    Decimals if decimal is set.
+    """
+    match = _token_re.match
+    make_float = Decimal if decimal else float
+    numbers = {}
+    i = 0
+    n = len(s)
+    while i < n:
+        m = match(s, i)
+        if m is None:  # only whitespace left
+            return
+        i = m.end()
+        kind = m.lastindex
+        start = m.start(kind)
+        t = m.group(kind)
+        if kind == _WORD:
+            token = KEYWORDS.get(t)
+            if token is not None:
+                yield token, start, i
             elif t == "true":
-                yield BoolToken(True)
+                yield BoolToken(True), start, i
             elif t == "false":
-                yield BoolToken(False)
-            else:
-                yield VariableToken(t)
-
-        elif s[i].isdigit():
-            t = s[i]
-            i = i + 1
-            while i < len(s) and (s[i].isdigit() or s[i] == '.'):
-                if s[i] == '.' and '.' in t:  # Ensure only one decimal point
-                    break
-                t = t + s[i]
-                i = i + 1
-            if '.' in t:
-                yield FloatToken(Decimal(t))
+                yield BoolToken(False), start, i
             else:
-                yield IntToken(Decimal(t))
-
-        elif s[i] == '"':
-            i += 1
-            start = i
-            while i < len(s) and s[i] != '"':
-                i += 1
-            if i >= len(s):
-                raise ValueError("Unterminated string literal")
-            yield StringToken(s[start:i])
-            i += 1
-
+                yield VariableToken(t), start, i
+        elif kind == _OPERATOR:
+            yield OPERATORS[t], start, i
+        elif kind == _INT:
+            v = numbers.get(t)
+            if v is None:
+                v = numbers[t] = int(t)
+            yield IntToken(v), start, i
+        elif kind == _FLOAT:
+            v = numbers.get(t)
+            if v is None:
+                v = numbers[t] = -make_float(t[1:]) if t[0] == '-' else make_float(t)
+            yield FloatToken(v), start, i
+        elif kind == _STRING:
+            yield StringToken(t), start - 1, i
+        elif kind == _UNTERMINATED:
+            raise ValueError("Unterminated string literal")
         else:
-            match t := s[i]:
-                case '+' | '*' | '^' | '(' | ')' | '{' | '}' | ',' | '[' | ']' | '.' | ';' | '%':
-                    i = i + 1
-                    yield OperatorToken(t)
-                case '-':
-                    if i + 1 < len(s) and s[i + 1].isdigit():
-                        i = i + 1  
-                        t = s[i]
-                        i = i + 1
-                        while i < len(s) and (s[i].isdigit() or s[i] == '.'):
-                            if s[i] == '.' and '.' in t:  
-                                break
-                            t = t + s[i]
-                            i = i + 1
-                        if '.' in t:
-                            yield FloatToken(-Decimal(t))
-                        else:
-                            yield IntToken(-Decimal(t))
-                    else:
-                        i = i + 1
-                        yield OperatorToken(t)
-                case '<':
-                    if i + 1 < len(s) and s[i + 1] == '=':
-                        i = i + 2
-                        yield OperatorToken('<=')
-                    else:
-                        i = i + 1
-                        yield OperatorToken('<')
-                case '>':
-                    if i + 1 < len(s) and s[i + 1] == '=':
-                        i = i + 2
-                        yield OperatorToken('>=')
-                    else:
-                        i = i + 1
-                        yield OperatorToken('>')
-                case '/':
-                    if i + 1 < len(s) and s[i + 1] == '/':
-                        i = i + 2
-                        yield OperatorToken('//')
-                    else:
-                        i = i + 1
-                        yield OperatorToken('/')
-                case '=':
-                    if i + 1 < len(s) and s[i + 1] == '=':
-                        i = i + 2
-                        yield OperatorToken('==')
-                case '!':
-                    if i + 1 < len(s) and s[i + 1] == '=':
-                        i = i + 2
-                        yield OperatorToken('!=')
-                case ':':
-                    if i + 1 < len(s) and s[i + 1] == '=':
-                        i = i + 2
-                        yield OperatorToken(':=')
-                    else:
-                        i = i + 1
-                        yield OperatorToken(':')
-                case _:
-                    print(f"Unexpected character: {s[i]}")
-                    i = i + 1
+            print(f"Unexpected character: {t}")
+
+def lex(s: str, decimal: bool = False) -> Iterator[Token]:
+    for t, _, _ in lex_spans(s, decimal):
+        yield t
@@ -1,4 +1,5 @@
-from lexer import IntToken, FloatToken, StringToken, BoolToken
+from lexer import IntToken, FloatToken, StringToken, BoolToken, KeywordToken, OperatorToken, VariableToken, TokenKind, KEYWORDS, OPERATORS, lex, lex_spans
+from decimal import Decimal
 
 def test_int_token():
     token = IntToken(42)
@@ -22,3 +23,36 @@ def test_bool_token():
     assert token_false.v is False
     assert isinstance(token_true, BoolToken)
     assert isinstance(token_false, BoolToken)
+
+
+def test_lex_let():
+    tokens = list(lex('let x be 1.5 in print(x) end'))
+    assert tokens == [
+        KeywordToken("let"), VariableToken("x"), KeywordToken("be"), FloatToken(Decimal("1.5")),
+        KeywordToken("in"), KeywordToken("print"), OperatorToken("("), VariableToken("x"),
+        OperatorToken(")"), KeywordToken("end"),
+    ]
+
+def test_lex_operators_and_literals():
+    tokens = list(lex('a<=b // -3 := "hi" true'))
+    assert tokens == [
+        VariableToken("a"), OperatorToken("<="), VariableToken("b"), OperatorToken("//"),
+        IntToken(Decimal("-3")), OperatorToken(":="), StringToken("hi"), BoolToken(True),
+    ]
+
+def test_lex_spans():
+    src = 'let s be "ab" in s end'
+    assert [(start, end) for _, start, end in lex_spans(src)] == [(0, 3), (4, 5), (6, 8), (9, 13), (14, 16), (17, 18), (19, 22)]
+    assert [src[start:end] for _, start, end in lex_spans(src)][3] == '"ab"'
+
+def test_keywords_and_operators_are_shared():
+    first, plus, second = lex("end + end")
+    assert first is second is KEYWORDS["end"]
+    assert plus is OPERATORS["+"]
+
+def test_token_kind():
+    assert [tok.kind for tok in lex('let 1 2.0 true "s" ; x')] == [
+        TokenKind.KEYWORD, TokenKind.INT, TokenKind.FLOAT, TokenKind.BOOL,
+        TokenKind.STRING, TokenKind.OPERATOR, TokenKind.VARIABLE,
+    ]
+    assert not hasattr(IntToken(1), "__dict__")
@@ -0,0 +1,288 @@
+from dataclasses import fields, replace
+from tree import *
+from lexer import *
+from resolver import frame_size
+
+# Loop optimizations, applied to each While innermost first:
+#
+# - Strength reduction. If the body steps an integer variable once per
+#   iteration, with a top-level i := i + c and no other assignment to i, then
+#   i * k for an integer literal k that is used more than once is kept in a
+#   temporary instead: it starts out as i * k and goes up by c * k as i does.
+# - Hoisting. A BinOp whose variables are neither bound nor assigned inside
+#   the loop gives the same value every time round, so it becomes a Hoisted
+#   node: worked out the first time the loop reaches it and kept in a
+#   temporary from then on. Doing that lazily, rather than before the loop,
+#   means a loop that never reaches it never works it out, and an error it
+#   raises is raised where it always was.
+#
+# The temporaries are let-bound around the loop, in new slots at the end of
+# the frame it runs in.
+
+def optimize_loops(tree: AST, report=None) -> AST:
+    """Hoist invariants out of and strength-reduce the loops of a resolved tree; report(message) hears of each."""
+    int_ids, last_id = survey(tree)
+    return trampoline(LoopOptimizer(int_ids, last_id, frame_size(tree), report).steps(tree))
+
+def step(statement):
+    """(id, c) if statement is i := i + c or i := i - c for an integer literal c, else None."""
+    match statement:
+        case Assign(Var(_, i, 0), BinOp("+", Var(_, j), IntToken(c))) if i == j:
+            return i, c
+        case Assign(Var(_, i, 0), BinOp("+", IntToken(c), Var(_, j))) if i == j:
+            return i, c
+        case Assign(Var(_, i, 0), BinOp("-", Var(_, j), IntToken(c))) if i == j:
+            return i, -c
+    return None
+
+def survey(tree: AST):
+    """The ids of variables that only ever hold integers, and the largest id."""
+    ints, stepped_only = set(), {}
+    last_id = 0
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Var):
+            last_id = max(last_id, node.i or 0)
+        elif isinstance(node, Let) and isinstance(node.e, IntToken):
+            ints.add(node.v.i)
+        elif isinstance(node, Assign) and isinstance(node.var, Var):
+            stepped_only[node.var.i] = stepped_only.get(node.var.i, True) and step(node) is not None
+        if isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return {i for i in ints if stepped_only.get(i, True)}, last_id
+
+def scan(loop: While):
+    """
+    The ids bound or assigned anywhere in loop, how many times each is
+    assigned, and how often each (id, k) product is used in the loop's own
+    frame.
+    """
+    variant, assigns, products = set(), {}, {}
+    work = [(loop.condition, True), (loop.body, True)]
+    while work:
+        node, own_frame = work.pop()
+        if isinstance(node, Let):
+            variant.add(node.v.i)
+        elif isinstance(node, Assign) and isinstance(node.var, Var):
+            variant.add(node.var.i)
+            assigns[node.var.i] = assigns.get(node.var.i, 0) + 1
+        elif isinstance(node, Fun):
+            variant.update(p.i for p in node.parameters)
+            work.append((node.body, False))
+            continue
+        elif own_frame and (product := product_of(node)) is not None:
+            products[product] = products.get(product, 0) + 1
+        if isinstance(node, AST):
+            work.extend((getattr(node, f.name), own_frame) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend((item, own_frame) for item in node)
+        elif isinstance(node, dict):
+            work.extend((value, own_frame) for value in node.values())
+    return variant, assigns, products
+
+def product_of(node):
+    """(id, k) if node is i * k or k * i for an integer literal k, else None."""
+    match node:
+        case BinOp("*", Var(_, i), IntToken(k)) | BinOp("*", IntToken(k), Var(_, i)):
+            return i, k
+    return None
+
+def show(t, depth: int = 3) -> str:
+    """Short source-like text for a report."""
+    match t:
+        case StringToken(v):
+            return repr(v)
+        case Token():
+            return str(t.v)
+        case Var(v):
+            return v
+        case Hoisted(_, expr):
+            return show(expr, depth)
+        case BinOp(op, left, right) if depth > 0:
+            sides = [side.expr if isinstance(side, Hoisted) else side for side in (left, right)]
+            parts = [f"({show(side, depth - 1)})" if isinstance(side, BinOp) else show(side, depth - 1) for side in sides]
+            return f"{parts[0]} {op} {parts[1]}"
+    return "..."
+
+class LoopOptimizer:
+    def __init__(self, int_ids, last_id, top_size, report):
+        self.int_ids = int_ids
+        self.last_id = last_id
+        self.frames = [top_size]  # Next free slot of each enclosing frame
+        self.report = report
+
+    def temporary(self) -> Var:
+        self.last_id += 1
+        slot = self.frames[-1]
+        self.frames[-1] += 1
+        return Var(f"${self.last_id}", self.last_id, 0, slot)  # A name no program can use
+
+    def steps(self, t):
+        match t:
+            case While(condition, body):
+                condition = yield self.steps(condition)
+                body = yield self.steps(body)
+                return (yield self.optimize(While(condition, body)))
+            case Fun(parameters, body):
+                self.frames.append(t.size)
+                body = yield self.steps(body)
+                return replace(t, body=body, size=self.frames.pop())
+            case AST():
+                values = []
+                for f in fields(t):
+                    values.append((yield self.steps(getattr(t, f.name))))
+                return type(t)(*values)
+            case list():
+                items = []
+                for item in t:
+                    items.append((yield self.steps(item)))
+                return items
+            case dict():
+                entries = {}
+                for key, value in t.items():
+                    entries[key] = yield self.steps(value)
+                return entries
+            case _:
+                return t
+
+    def optimize(self, loop: While):
+        label = f"while {show(loop.condition)}"
+        variant, assigns, products = scan(loop)
+        lets = []
+
+        # Strength reduction
+        reduced = {}
+        statements = [s for item in loop.body for s in (item if isinstance(item, list) else [item])]
+        steps = {}
+        for statement in statements:
+            if (stepping := step(statement)) is not None:
+                i, c = stepping
+                if i in self.int_ids and assigns.get(i) == 1:
+                    steps[i] = (statement.var, c)
+        for (i, k), uses in products.items():
+            if i in steps and uses > 1:
+                var, c = steps[i]
+                total = self.temporary()
+                lets.append((total, BinOp("*", replace(var), IntToken(k))))
+                reduced[i, k] = total
+                self.say(label, f"strength-reduced {var.v} * {k} to a total stepped by {c * k}")
+        if reduced:
+            loop = yield self.reduce(loop, reduced)
+            loop = While(loop.condition, [self.step_totals(item, reduced, steps) for item in loop.body])
+            variant.update(total.i for total in reduced.values())
+
+        # Hoisting
+        hoisted = []  # (expression, temporary) pairs
+        condition = yield self.hoist_child(loop.condition, variant, hoisted)
+        body = yield self.hoist_child(loop.body, variant, hoisted)
+        loop = While(condition, body)
+        for expr, temporary in hoisted:
+            lets.append((temporary, Unset()))
+            self.say(label, f"hoisted {show(expr)}")
+
+        for var, value in reversed(lets):
+            loop = Let(var, value, loop)
+        return loop
+
+    def say(self, label: str, message: str):
+        if self.report is not None:
+            self.report(f"{label}: {message}")
+
+    def step_totals(self, item, reduced, steps):
+        """item, with each total updated just before the statement that steps its variable."""
+        if isinstance(item, list):
+            return [s for statement in item for s in self.step_totals_of(statement, reduced, steps)]
+        return item if step(item) is None else self.step_totals_of(item, reduced, steps)
+
+    def step_totals_of(self, statement, reduced, steps):
+        stepping = step(statement)
+        if stepping is None or stepping[0] not in steps:
+            return [statement]
+        i, c = stepping
+        updates = [Assign(replace(total), BinOp("+", replace(total), IntToken(c * k)))
+                   for (j, k), total in reduced.items() if j == i]
+        return updates + [statement]
+
+    def reduce(self, t, reduced):
+        """t with each reduced product read from its total. Stays out of nested functions."""
+        product = product_of(t)
+        if product in reduced:
+            return replace(reduced[product])
+        match t:
+            case Fun():
+                return t
+            case AST():
+                values = []
+                for f in fields(t):
+                    values.append((yield self.reduce(getattr(t, f.name), reduced)))
+                return type(t)(*values)
+            case list():
+                items = []
+                for item in t:
+                    items.append((yield self.reduce(item, reduced)))
+                return items
+            case dict():
+                entries = {}
+                for key, value in t.items():
+                    entries[key] = yield self.reduce(value, reduced)
+                return entries
+            case _:
+                return t
+
+    def hoist_child(self, t, variant, hoisted):
+        """t, or a Hoisted in its place if it is itself an invariant BinOp."""
+        t, invariant = yield self.hoist(t, variant, hoisted)
+        return self.wrap(t, hoisted) if invariant else t
+
+    def wrap(self, t, hoisted):
+        if not isinstance(t, BinOp):
+            return t
+        for expr, temporary in hoisted:
+            if expr == t:  # The same expression twice shares a temporary
+                break
+        else:
+            temporary = self.temporary()
+            hoisted.append((t, temporary))
+        return Hoisted(replace(temporary), t)
+
+    def hoist(self, t, variant, hoisted):
+        """(t with its invariant BinOps hoisted, whether t is an invariant expression itself)."""
+        match t:
+            case Token():
+                return t, True
+            case Var(_, i):
+                return t, i not in variant
+            case BinOp(op, left, right):
+                left, left_invariant = yield self.hoist(left, variant, hoisted)
+                right, right_invariant = yield self.hoist(right, variant, hoisted)
+                if left_invariant and right_invariant:
+                    return BinOp(op, left, right), True  # Hoisted as part of something bigger, if it can be
+                if left_invariant:
+                    left = self.wrap(left, hoisted)
+                if right_invariant:
+                    right = self.wrap(right, hoisted)
+                return BinOp(op, left, right), False
+            case Fun() | Hoisted():
+                return t, False
+            case AST():
+                values = []
+                for f in fields(t):
+                    values.append((yield self.hoist_child(getattr(t, f.name), variant, hoisted)))
+                return type(t)(*values), False
+            case list():
+                items = []
+                for item in t:
+                    items.append((yield self.hoist_child(item, variant, hoisted)))
+                return items, False
+            case dict():
+                entries = {}
+                for key, value in t.items():
+                    entries[key] = yield self.hoist_child(value, variant, hoisted)
+                return entries, False
+            case _:
+                return t, False
@@ -0,0 +1,78 @@
+from loops import optimize_loops
+from optimizer import optimize
+from parser import parse
+from resolver import resolve
+from eval import e
+from compiler import run
+from lexer import IntToken, FloatToken
+from tree import Hoisted, Let, Unset, While
+
+def optimized(code, report=None):
+    return optimize(resolve(parse(code)), report=report)
+
+def nodes(tree, kind):
+    found = []
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, kind):
+            found.append(node)
+        if isinstance(node, list):
+            work.extend(node)
+        elif hasattr(node, "__dataclass_fields__"):
+            work.extend(getattr(node, name) for name in node.__dataclass_fields__)
+    return found
+
+def check(code, expected):
+    tree = optimized(code)
+    assert e(tree) == run(tree) == e(resolve(parse(code))) == expected
+    return tree
+
+LOOP = "let f be fun(n, a) is let s be 0 in let i be 0 in while {i < n - 1} do s := s + %s; i := i + 1 end; s end end in f(%s) end"
+
+def test_hoists_invariant_expressions():
+    tree = check(LOOP % ("a * a + i", "5, 3"), IntToken(42))
+    hoisted = [node.expr for node in nodes(tree, Hoisted)]
+    assert len(hoisted) == 2  # n - 1, a * a
+    assert len(nodes(tree, Unset)) == 2
+
+def test_shares_temporaries_between_copies():
+    tree = check(LOOP % ("a * a + (a * a)", "4, 2"), IntToken(24))
+    assert len(nodes(tree, Unset)) == 2
+
+def test_hoisted_values_are_worked_out_lazily():
+    # n // z would raise, but the loop never reaches it
+    check("let f be fun(n, z) is let i be 0 in while {i > 0} do i := n // z end; i end in f(1, 0) end", IntToken(0))
+
+def test_inner_loop_recomputes_for_each_outer_iteration():
+    code = """let f be fun(n) is let s be 0 in let i be 0 in
+        while {i < n} do let j be 0 in while {j < i + 1} do s := s + i * 10; j := j + 1 end end; i := i + 1 end;
+        s end end in f(4) end"""
+    tree = check(code, IntToken(200))
+    assert sorted(node.expr.op for node in nodes(tree, Hoisted)) == ["*", "+"]
+
+def test_strength_reduces_induction_products():
+    tree = check(LOOP % ("i * 4 + i * 4", "6, 0"), IntToken(80))
+    assert not [node for node in nodes(tree, While) if "i * 4" in repr(node)]
+    reports = []
+    optimized(LOOP % ("i * 4 + i * 4", "6, 0"), reports.append)
+    assert "while i < (n - 1): strength-reduced i * 4 to a total stepped by 4" in reports
+
+def test_leaves_products_of_other_variables():
+    # i is stepped twice, or is not always an integer
+    check("let f be fun(n) is let s be 0 in let i be 0 in while {i < n} do s := s + i * 4 + i * 4; i := i + 1; i := i + 1 end; s end end in f(6) end",
+          IntToken(48))
+    check("let f be fun(n) is let s be 0 in let i be 0.5 in while {i < n} do s := s + i * 2 + i * 2; i := i + 1 end; s end end in f(2) end",
+          FloatToken(8.0))
+
+def test_reports_nothing_for_plain_loops():
+    reports = []
+    optimized("let i be 0 in while {i < 10} do i := i + 1 end end", reports.append)
+    assert reports == []
+
+def test_deeply_nested_loop_body():
+    depth = 3000
+    body = "let x be n + 1 in " * depth + "x" + " end" * depth
+    tree = optimize_loops(resolve(parse(f"let n be 0 in let i be 0 in while {{i < 3}} do i := i + 1; {body} end end end")))
+    assert len({node.var.slot for node in nodes(tree, Hoisted)}) == 1  # Every copy of n + 1 shares one
+    assert len(nodes(tree, Unset)) == 1
@@ -2,9 +2,15 @@
 # from graphviz import Digraph
 from parser import *
 from eval import *
+from runtime import *
 from tree import *
 from lexer import *
 from resolver import *
+from cache import compile_program
+from inliner import INLINE_BUDGET
+import sys
+from compiler import ENGINES
+import argparse
 
 # def visualize_ast(node, graph=None, parent=None, counter=None):
 #     """Recursively add nodes and edges to the Graphviz Digraph."""
@@ -65,8 +71,25 @@ from resolver import *
 
 
 if __name__ == "__main__":
-  
-    file_path = "code.txt"
+    arg_parser = argparse.ArgumentParser(description="Run a Cobra program.")
+    arg_parser.add_argument("file", nargs="?", default="code.txt")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always lex, parse and resolve from scratch")
+    arg_parser.add_argument("--no-optimize", action="store_true", help="skip inlining and constant folding")
+    arg_parser.add_argument("--inline-budget", type=int, default=INLINE_BUDGET, metavar="NODES",
+                            help=f"largest function body to inline, 0 for none (default {INLINE_BUDGET})")
+    arg_parser.add_argument("--verbose", action="store_true", help="report what the loop optimizations did")
+    arg_parser.add_argument("--no-memo", action="store_true", help="never memoize calls of pure functions")
+    arg_parser.add_argument("--memo-stats", action="store_true", help="report memo table hits and misses after running")
+    arg_parser.add_argument("--quicken-stats", action="store_true",
+                            help="report how many operators the tree engines specialized and deoptimized")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="cek",
+                            help="cek: walk the tree with an explicit continuation stack (default); "
+                                 "tree: walk it with Python recursion; closure: compile it to Python closures first")
+    arg_parser.add_argument("--decimal", action="store_true", help="exact Decimal floats instead of Python floats")
+    args = arg_parser.parse_args()
+    set_decimal_mode(args.decimal)
+
+    file_path = args.file
     try:
         with open(file_path, "r") as f:
             code = f.read()
@@ -74,17 +97,18 @@ if __name__ == "__main__":
         print(f"Error: File '{file_path}' not found.")
         exit(1)
 
-    ast = parse(code)
-    # print(ast)
-    # graph = visualize_ast(ast)
-    # graph.render("ast_tree", view=True)
-
-    print("-------------------------------------")
-    abt = resolve(ast)
-    # print(abt)
+    abt = compile_program(code, use_cache=not args.no_cache, decimal=args.decimal, optimized=not args.no_optimize,
+                          inline_budget=args.inline_budget,
+                          report=(lambda message: print(message, file=sys.stderr)) if args.verbose else None,
+                          memoize=not args.no_memo)
     # graph = visualize_ast(abt)
     # graph.render("abt_tree", view=True)
 
-    result = e(abt)
+    print("-------------------------------------")
+    result = ENGINES[args.engine](abt)
     # astpretty.pprint(abt)
-    print(f"Result: {result}")
+    print(f"Result: {printable(result)}")
+    if args.memo_stats:
+        print_memo_stats(sys.stderr)
+    if args.quicken_stats:
+        print_quick_stats(sys.stderr)
@@ -6,6 +6,8 @@ from tree import *
 from lexer import *
 from resolver import *
 from assembler import *
+from cache import compile_program
+import argparse
 
 # def visualize_ast(node, graph=None, parent=None, counter=None):
 #     """Recursively add nodes and edges to the Graphviz Digraph."""
@@ -66,8 +68,14 @@ from assembler import *
 
 
 if __name__ == "__main__":
-  
-    file_path = "code.txt"
+    arg_parser = argparse.ArgumentParser(description="Compile a Cobra program to program.bin.")
+    arg_parser.add_argument("file", nargs="?", default="code.txt")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always lex, parse and resolve from scratch")
+    # Off by default: assembler.py does not handle every node the optimizer can produce
+    arg_parser.add_argument("--optimize", action="store_true", help="fold and propagate constants and optimize loops first")
+    args = arg_parser.parse_args()
+
+    file_path = args.file
     try:
         with open(file_path, "r") as f:
             code = f.read()
@@ -75,13 +83,8 @@ if __name__ == "__main__":
         print(f"Error: File '{file_path}' not found.")
         exit(1)
 
-    ast = parse(code)
-    # print(ast)
-    # graph = visualize_ast(ast)
-    # graph.render("ast_tree", view=True)
-
+    abt = compile_program(code, use_cache=not args.no_cache, optimized=args.optimize)
     print("-------------------------------------")
-    abt = resolve(ast)
 
     # result = e(abt)
     # print(f"Result: {result}")
@@ -0,0 +1,149 @@
+from dataclasses import fields, replace
+from tree import *
+from lexer import *
+from inliner import inline, INLINE_BUDGET
+from loops import optimize_loops
+from purity import mark_pure
+from inference import specialize
+import runtime
+
+# Simplifications of a resolved program, run before any engine or code
+# generator sees it. First small functions are inlined (see inliner.py), then:
+#
+# - A BinOp whose operands are both literals is replaced by its value, unless
+#   evaluating it raises (that is left for run time) or the value is too big
+#   to be worth storing.
+# - A let-bound variable whose value is a literal, and which is never the
+#   target of an Assign, is replaced by that literal wherever it is read.
+# - An If whose condition is a literal is replaced by the branch it takes.
+#
+# Then loop invariants are hoisted and induction variables strength-reduced
+# (see loops.py), pure functions are marked for memoization (purity.py) and
+# last, arithmetic and comparisons whose operand types are proven are
+# specialized (inference.py).
+#
+# Like the resolver, the pass is written as generators for trampoline(), so
+# it handles nesting of any depth.
+
+LITERALS = (IntToken, FloatToken, StringToken, BoolToken)
+
+MAX_FOLDED_SIZE = 4096  # Characters of a string, bits of an int
+
+def optimize(tree: AST, decimal: bool = False, inline_budget: int = INLINE_BUDGET, report=None,
+             memoize: bool = True) -> AST:
+    """
+    Inline, fold constants in and optimize the loops of a resolved tree,
+    unless memoize is false mark its pure functions, and specialize the
+    operators whose operand types are known. decimal must match the
+    mode it was parsed in. report, if given, is called with a message for
+    each loop transformed.
+    """
+    tree = inline(tree, inline_budget)
+    saved = runtime.decimal_mode
+    runtime.decimal_mode = decimal  # Folding / must give what running it would
+    try:
+        tree = trampoline(optimize_steps(tree, {}, assigned_ids(tree)))
+    finally:
+        runtime.decimal_mode = saved
+    tree = optimize_loops(tree, report)
+    if memoize:
+        tree = mark_pure(tree)
+    return specialize(tree)
+
+def assigned_ids(tree: AST) -> set:
+    """The ids of every variable some Assign stores to."""
+    assigned = set()
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Assign) and isinstance(node.var, Var):
+            assigned.add(node.var.i)
+        if isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return assigned
+
+def literal(value):
+    """A runtime value as a literal token, or None if it has no literal form."""
+    t = type(value)
+    if t is int:
+        return IntToken(value) if value.bit_length() <= MAX_FOLDED_SIZE else None
+    if t in runtime.FLOAT:
+        return FloatToken(value)
+    if t is bool:
+        return BoolToken(value)
+    if t is str:
+        return StringToken(value) if len(value) <= MAX_FOLDED_SIZE else None
+    return None
+
+def cheap(op, left, right) -> bool:
+    """Whether op can be worked out at compile time without building something huge."""
+    if op == "^" and type(left) is int and type(right) is int:
+        return abs(right) * max(left.bit_length(), 1) <= MAX_FOLDED_SIZE
+    if op == "*" and type(left) is str and type(right) is int:
+        return len(left) * right <= MAX_FOLDED_SIZE
+    if op == "*" and type(left) is int and type(right) is str:
+        return left * len(right) <= MAX_FOLDED_SIZE
+    return True
+
+def fold(op, left: Token, right: Token):
+    """The literal op gives for two literals, or None to leave it for run time."""
+    if not cheap(op, left.v, right.v):
+        return None
+    try:
+        value = runtime.BINARY_OPS[op](left.v, right.v)
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+    return literal(value)
+
+def optimize_steps(t, constants, assigned):
+    """constants maps the id of each propagated variable to its literal."""
+    match t:
+        case Var(v, i):
+            return constants.get(i, t)
+        case BinOp(op, left, right):
+            left = yield optimize_steps(left, constants, assigned)
+            right = yield optimize_steps(right, constants, assigned)
+            if isinstance(left, LITERALS) and isinstance(right, LITERALS):
+                folded = fold(op, left, right)
+                if folded is not None:
+                    return folded
+            return BinOp(op, left, right)
+        case Let(variable, value, body):
+            value = yield optimize_steps(value, constants, assigned)
+            if isinstance(value, LITERALS) and variable.i is not None and variable.i not in assigned:
+                constants[variable.i] = value
+            body = yield optimize_steps(body, constants, assigned)
+            return Let(variable, value, body)
+        case If(cond, then, else_):
+            cond = yield optimize_steps(cond, constants, assigned)
+            if isinstance(cond, LITERALS):
+                return (yield optimize_steps(then if cond.v else else_, constants, assigned))
+            then = yield optimize_steps(then, constants, assigned)
+            else_ = yield optimize_steps(else_, constants, assigned)
+            return If(cond, then, else_)
+        case Fun(parameters, body):
+            # Only the body: parameters and captures are addresses, not reads
+            return replace(t, body=(yield optimize_steps(body, constants, assigned)))
+        case Assign(var, expr):
+            return Assign(var, (yield optimize_steps(expr, constants, assigned)))
+        case AST():
+            values = []
+            for f in fields(t):
+                values.append((yield optimize_steps(getattr(t, f.name), constants, assigned)))
+            return type(t)(*values)
+        case list():
+            items = []
+            for item in t:
+                items.append((yield optimize_steps(item, constants, assigned)))
+            return items
+        case dict():
+            entries = {}
+            for key, value in t.items():
+                entries[key] = yield optimize_steps(value, constants, assigned)
+            return entries
+        case _:
+            return t
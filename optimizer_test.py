@@ -0,0 +1,46 @@
+from optimizer import optimize
+from parser import parse
+from resolver import resolve
+from eval import e
+from lexer import IntToken, FloatToken, StringToken, BoolToken
+from tree import BinOp, If, Let, TypedBinOp, Var
+
+def optimized(code, **options):
+    return optimize(resolve(parse(code)), **options)
+
+def test_folds_literal_operands():
+    assert optimized("(2 + 3) * 4") == IntToken(20)
+    assert optimized('"ab" + "cd"') == StringToken("abcd")
+    assert optimized("1 < 2") == BoolToken(True)
+    assert optimized("10 / 4") == FloatToken(2.5)
+
+def test_propagates_let_bound_constants():
+    tree = optimized("let a be 10 in let b be 5 in (a + b) * (a - b) / b end end")
+    assert tree.f.f == FloatToken(15.0)
+
+def test_keeps_assigned_variables():
+    tree = optimized("let a be 1 in a := a + 1; a end")
+    assert tree.f[1] == Var("a", tree.v.i, 0, 1)
+    assert e(tree) == IntToken(2)
+
+def test_keeps_errors_for_run_time():
+    assert isinstance(optimized("1 // 0"), TypedBinOp)
+    assert isinstance(optimized('"a" - 1'), BinOp)
+
+def test_drops_constant_branches():
+    assert optimized("let x be 3 in if {x > 2} then x else 0 end end").f == IntToken(3)
+    assert isinstance(optimized("let f be fun(x) is if {x > 2} then 1 else 0 end in f(3) end", inline_budget=0).e.body, If)
+    # Once f is inlined, its argument is a constant too
+    assert optimized("let f be fun(x) is if {x > 2} then 1 else 0 end in f(3) end").f == IntToken(1)
+
+def test_does_not_build_huge_values():
+    assert isinstance(optimized("2 ^ 100000"), BinOp)
+    assert optimized("2 ^ 10") == IntToken(1024)
+
+def test_deeply_nested_lets():
+    depth = 5000
+    tree = optimized("let x be 0 in " * depth + "x + 1" + " end" * depth)
+    for _ in range(depth):
+        assert isinstance(tree, Let)
+        tree = tree.f
+    assert tree == IntToken(1)
@@ -3,222 +3,143 @@ from lexer import *
 from more_itertools import peekable
 from decimal import Decimal
 
-def parse(s: str) -> AST:
-    t = peekable(lex(s))
+# Binary operators, keyed by their (shared) token: (operator, binding power, chains).
+# Higher powers bind tighter. An operator that chains is left associative
+# (a - b - c is (a - b) - c); one that does not takes a single right operand,
+# so a second one at the same power ends the expression (a / b / c parses a / b).
+# A new operator only needs an entry here.
+BINARY_OPERATORS = {
+    KEYWORDS["or"]:   ("or",  1, True),
+    KEYWORDS["and"]:  ("and", 2, True),
+    OPERATORS["<"]:   ("<",   3, False),
+    OPERATORS["<="]:  ("<=",  3, False),
+    OPERATORS[">"]:   (">",   3, False),
+    OPERATORS[">="]:  (">=",  3, False),
+    OPERATORS["=="]:  ("==",  3, False),
+    OPERATORS["!="]:  ("!=",  3, False),
+    OPERATORS["-"]:   ("-",   4, True),
+    OPERATORS["+"]:   ("+",   5, True),
+    OPERATORS["*"]:   ("*",   6, True),
+    OPERATORS["//"]:  ("//",  7, False),
+    OPERATORS["/"]:   ("/",   7, False),
+    OPERATORS["%"]:   ("%",   8, False),
+    OPERATORS["^"]:   ("^",   9, False),
+}
+
+def parse(s: str, decimal: bool = False) -> AST:
+    t = peekable(lex(s, decimal))
     def expect(what: Token):
-        if t.peek(None) == what:
+        if t.peek(None) is what:
             next(t)
             return
         raise ParseError
     
     def parse_braced_expr():
-        expect(OperatorToken('{'))
-        expr = parse_statements()
-        expect(OperatorToken('}'))
+        expect(OPERATORS['{'])
+        expr = (yield parse_statements())
+        expect(OPERATORS['}'])
         return expr
 
     def parse_statements():
-        statements = [parse_print()]
-        while t.peek(None) == OperatorToken(';'):
+        statements = [(yield parse_print())]
+        while t.peek(None) is OPERATORS[';']:
             next(t)
-            statements.append(parse_print())
+            statements.append((yield parse_print()))
         if len(statements) == 1:
             return statements[0]
         return statements
     
     def parse_print():
-        match t.peek(None):
-            case KeywordToken("print"):
-                next(t)
-                expect(OperatorToken('('))
-                expr = parse_let()
-                expect(OperatorToken(')'))
-                return Print(expr)
-            case _:
-                return parse_let()
+        if t.peek(None) is KEYWORDS["print"]:
+            next(t)
+            expect(OPERATORS['('])
+            expr = (yield parse_expr())
+            expect(OPERATORS[')'])
+            return Print(expr)
+        return (yield parse_expr())
+
+    def parse_expr():
+        tok = t.peek(None)
+        if tok is KEYWORDS["let"]:
+            return (yield parse_let())
+        if tok is KEYWORDS["fun"]:
+            return (yield parse_fun())
+        if tok is KEYWORDS["if"]:
+            return (yield parse_if())
+        if tok is KEYWORDS["while"]:
+            return (yield parse_while())
+        return (yield parse_binary(0))
 
     def parse_let():
-        match t.peek(None):
-            case KeywordToken("let"):
-                next(t)
-                vt = next(t)
-                expect(KeywordToken("be"))
-                e = parse_let()
-                expect(KeywordToken("in"))
-                f = parse_statements()  # Change from parse_let to parse_statements
-                expect(KeywordToken("end"))
-                return Let(Var(vt.v), e, f)
-            case _:
-                return parse_fun()
+        next(t)
+        vt = next(t)
+        expect(KEYWORDS["be"])
+        e = (yield parse_expr())
+        expect(KEYWORDS["in"])
+        f = (yield parse_statements())
+        expect(KEYWORDS["end"])
+        return Let(Var(vt.v), e, f)
 
     def parse_fun():
-        match t.peek(None):
-            case KeywordToken("fun"):
+        next(t)
+        expect(OPERATORS['('])
+        parameters = []
+        while t.peek(None) is not OPERATORS[')']:
+            parameters.append(Var(next(t).v))
+            if t.peek(None) is OPERATORS[',']:
                 next(t)
-                expect(OperatorToken('('))
-                parameters = []
-                while t.peek(None) != OperatorToken(')'):
-                    parameters.append(Var(next(t).v))
-                    if t.peek(None) == OperatorToken(','):
-                        next(t)
-                expect(OperatorToken(')'))  
-                expect(KeywordToken("is"))
-                body = parse_statements()
-                return Fun(parameters, body)
-            case _:
-                return parse_if()
+        expect(OPERATORS[')'])  
+        expect(KEYWORDS["is"])
+        body = (yield parse_statements())
+        return Fun(parameters, body)
 
     def parse_if():
-        match t.peek(None):
-            case KeywordToken("if"):
-                next(t)
-                cond = parse_braced_expr()
-                expect(KeywordToken("then"))
-                then = parse_statements()
-                expect(KeywordToken("else"))
-                else_ = parse_statements()
-                expect(KeywordToken("end"))
-                return If(cond, then, else_)
-            case _:
-                return parse_while()
+        next(t)
+        cond = (yield parse_braced_expr())
+        expect(KEYWORDS["then"])
+        then = (yield parse_statements())
+        expect(KEYWORDS["else"])
+        else_ = (yield parse_statements())
+        expect(KEYWORDS["end"])
+        return If(cond, then, else_)
             
     def parse_while():
-        match t.peek(None):
-            case KeywordToken("while"):
-                next(t)
-                cond = parse_braced_expr()
-                expect(KeywordToken("do"))
-                body_expr = []
-                while t.peek(None) != KeywordToken("end"):
-                    body_expr.append(parse_statements())
-                expect(KeywordToken("end"))
-                return While(cond, body_expr)
-            case _:
-                return parse_or()
+        next(t)
+        cond = (yield parse_braced_expr())
+        expect(KEYWORDS["do"])
+        body_expr = []
+        while t.peek(None) is not KEYWORDS["end"]:
+            body_expr.append((yield parse_statements()))
+        expect(KEYWORDS["end"])
+        return While(cond, body_expr)
 
-    def parse_or():
-        ast = parse_and()
+    def parse_binary(min_power):
+        """Precedence climbing over BINARY_OPERATORS: one loop, one table lookup per operator."""
+        ast = (yield parse_atom())
+        limit = None
         while True:
-            match t.peek(None):
-                case KeywordToken("or"):
-                    next(t)
-                    ast = BinOp("or", ast, parse_and())
-                case _:
-                    return ast
-
-    def parse_and():
-        ast = parse_cmp()
-        while True:
-            match t.peek(None):
-                case KeywordToken("and"):
-                    next(t)
-                    ast = BinOp("and", ast, parse_cmp())
-                case _:
-                    return ast
-
-    def parse_cmp():
-        l = parse_sub()
-        if t.peek(None) == OperatorToken('<'):
-            next(t)
-            r = parse_sub()
-            return BinOp('<', l, r)
-        elif t.peek(None) == OperatorToken('<='):
-            next(t)
-            r = parse_sub()
-            return BinOp('<=', l, r)
-        elif t.peek(None) == OperatorToken('>'):
+            tok = t.peek(None)
+            if not isinstance(tok, (KeywordToken, OperatorToken)):
+                return ast
+            entry = BINARY_OPERATORS.get(tok)
+            if entry is None:
+                return ast
+            op, power, chains = entry
+            if power < min_power or (limit is not None and power >= limit):
+                return ast
             next(t)
-            r = parse_sub()
-            return BinOp('>', l, r)
-        elif t.peek(None) == OperatorToken('>='):
-            next(t)
-            r = parse_sub()
-            return BinOp('>=', l, r)
-        elif t.peek(None) == OperatorToken('=='):
-            next(t)
-            r = parse_sub()
-            return BinOp('==', l, r)
-        elif t.peek(None) == OperatorToken('!='):
-            next(t)
-            r = parse_sub()
-            return BinOp('!=', l, r)
-        else:
-            return l
-
-    def parse_sub():
-        ast = parse_add()
-        while True:
-            match t.peek(None):
-                case OperatorToken('-'):
-                    next(t)
-                    ast = BinOp('-', ast, parse_add())
-                case _:
-                    return ast
-                    
-    def parse_add():
-        ast = parse_mul()
-        while True:
-            match t.peek(None):
-                case OperatorToken('+'):
-                    next(t)
-                    ast = BinOp('+', ast, parse_mul())
-                case _:
-                    return ast
-
-    def parse_mul():
-        ast = parse_div()
-        while True:
-            match t.peek(None):
-                case OperatorToken('*'):
-                    next(t)
-                    ast = BinOp("*", ast, parse_div())
-                case _:
-                    return ast
-    
-    def parse_div():
-        ast = parse_mod()
-        match t.peek(None):
-            case OperatorToken('//'):
-                next(t)
-                ast = BinOp("//", ast, parse_mod())
-            case OperatorToken('/'):
-                next(t)
-                ast = BinOp("/", ast, parse_mod())
-        return ast
-    
-    def parse_mod():
-        ast = parse_pow()
-        match t.peek(None):
-            case OperatorToken('%'):
-                next(t)
-                ast = BinOp("%", ast, parse_pow())
-        return ast
-    
-    def parse_pow():
-        ast = parse_atom()
-        match t.peek(None):
-            case OperatorToken('^'):
-                next(t)
-                ast = BinOp("^", ast, parse_atom())
-        return ast
+            ast = BinOp(op, ast, (yield parse_binary(power + 1)))
+            # Only a looser operator, or the same one again if it chains, may follow
+            limit = power + 1 if chains else power
 
     def parse_atom():
         match t.peek(None):
-            case BoolToken(v):
-                next(t)
-                return BoolToken(v)
-            case IntToken(v):
-                next(t)
-                return IntToken(v)
-            case FloatToken(v):
-                next(t)
-                return FloatToken(v)
-            case StringToken(v):
-                next(t)
-                return StringToken(v)
+            case BoolToken() | IntToken() | FloatToken() | StringToken():
+                # Literal tokens are fresh per occurrence, so the lexed token is the node
+                return next(t)
             case OperatorToken('('):
                 next(t)
-                expr = parse_let()  # Parse the expression inside the parentheses
+                expr = (yield parse_expr())  # Parse the expression inside the parentheses
                 match t.peek(None):
                     case OperatorToken(')'):
                         next(t)
@@ -227,109 +148,112 @@ def parse(s: str) -> AST:
                         raise ValueError("Missing closing parenthesis")
             case OperatorToken('['):
                 next(t)
-                if t.peek(None) == OperatorToken('('):
+                if t.peek(None) is OPERATORS['(']:
                     # Handle [(value, size)] format
                     next(t)  # consume '('
-                    value = parse_let()
-                    expect(OperatorToken(','))
-                    size = parse_let()
-                    expect(OperatorToken(')'))
-                    expect(OperatorToken(']'))
+                    value = (yield parse_expr())
+                    expect(OPERATORS[','])
+                    size = (yield parse_expr())
+                    expect(OPERATORS[')'])
+                    expect(OPERATORS[']'])
                     return ArrayInit(value, size)
                 else:
                     # Handle normal array literal
                     elements = []
-                    while t.peek(None) != OperatorToken(']'):
-                        elements.append(parse_let())
-                        if t.peek(None) == OperatorToken(','):
+                    while t.peek(None) is not OPERATORS[']']:
+                        elements.append((yield parse_expr()))
+                        if t.peek(None) is OPERATORS[',']:
                             next(t)
-                    expect(OperatorToken(']'))
+                    expect(OPERATORS[']'])
                     return Array(elements)
             case OperatorToken('{'):
                 next(t)
                 entries = {}
-                while t.peek(None) != OperatorToken('}'):
-                    key = parse_let()
+                while t.peek(None) is not OPERATORS['}']:
+                    key = (yield parse_expr())
                     if isinstance(key, StringToken):
                         key = key.v  # Convert StringToken to plain string
-                    expect(OperatorToken(':'))
-                    value = parse_let()
+                    expect(OPERATORS[':'])
+                    value = (yield parse_expr())
                     entries[key] = value
-                    if t.peek(None) == OperatorToken(','):
+                    if t.peek(None) is OPERATORS[',']:
                         next(t)
-                expect(OperatorToken('}'))
+                expect(OPERATORS['}'])
                 return Map(entries)
             case VariableToken(v):
                 var_name = next(t).v
-                # if t.peek(None) == OperatorToken('['):
+                # if t.peek(None) is OPERATORS['[']:
                 #     # Array indexing
                 #     array_var = Var(var_name)
-                #     expect(OperatorToken('['))
+                #     expect(OPERATORS['['])
                 #     index = parse_let()
-                #     expect(OperatorToken(']'))
-                #     if t.peek(None) == OperatorToken(':='):
+                #     expect(OPERATORS[']'])
+                #     if t.peek(None) is OPERATORS[':=']:
                 #         # Array assignment
-                #         expect(OperatorToken(':='))
+                #         expect(OPERATORS[':='])
                 #         value = parse_let()
                 #         return ArrayAssign(array_var, index, value)
                 #     return ArrayIndex(array_var, index)
 
-                if t.peek(None) == OperatorToken('['):
+                if t.peek(None) is OPERATORS['[']:
                     # Array indexing with support for multi-dimensional arrays
                     array_var = Var(var_name)
                     indices = []
                     # Collect all consecutive indices into a list
-                    while t.peek(None) == OperatorToken('['):
-                        expect(OperatorToken('['))
-                        indices.append(parse_let())
-                        expect(OperatorToken(']'))
+                    while t.peek(None) is OPERATORS['[']:
+                        expect(OPERATORS['['])
+                        indices.append((yield parse_expr()))
+                        expect(OPERATORS[']'])
                     # Check if this is an assignment
-                    if t.peek(None) == OperatorToken(':='):
-                        expect(OperatorToken(':='))
-                        value = parse_let()
+                    if t.peek(None) is OPERATORS[':=']:
+                        expect(OPERATORS[':='])
+                        value = (yield parse_expr())
                         return ArrayAssign(array_var, indices, value)
                     
                     return ArrayIndex(array_var, indices)
 
-                if t.peek(None) == OperatorToken('('):
-                    expect(OperatorToken('('))
+                if t.peek(None) is OPERATORS['(']:
+                    expect(OPERATORS['('])
                     args = []
-                    while t.peek(None) != OperatorToken(')'):
-                        args.append(parse_let())
-                        if t.peek(None) == OperatorToken(','):
+                    while t.peek(None) is not OPERATORS[')']:
+                        args.append((yield parse_expr()))
+                        if t.peek(None) is OPERATORS[',']:
                             next(t)
-                    expect(OperatorToken(')'))
+                    expect(OPERATORS[')'])
                     return Call(Var(var_name), args)
-                elif t.peek(None) == OperatorToken(':='):
-                    expect(OperatorToken(':='))
-                    arg = parse_let()
+                elif t.peek(None) is OPERATORS[':=']:
+                    expect(OPERATORS[':='])
+                    arg = (yield parse_expr())
                     return Assign(var_name, arg)
-                elif t.peek(None) == OperatorToken('.'):
-                    expect(OperatorToken('.'))
-                    key = parse_atom()  # Changed from parse_let() to parse_atom()
-                    if t.peek(None) == OperatorToken(':='):
-                        expect(OperatorToken(':='))
-                        value = parse_let()
+                elif t.peek(None) is OPERATORS['.']:
+                    expect(OPERATORS['.'])
+                    key = (yield parse_atom())  # Changed from parse_let() to parse_atom()
+                    if t.peek(None) is OPERATORS[':=']:
+                        expect(OPERATORS[':='])
+                        value = (yield parse_expr())
                         return MapAssign(Var(var_name), key, value)
                     return MapAccess(Var(var_name), key)
                 return Var(var_name)
             case KeywordToken("input"):
                 next(t)
-                expect(OperatorToken('('))
-                prompt = parse_let()
-                expect(OperatorToken(')'))
+                expect(OPERATORS['('])
+                prompt = (yield parse_expr())
+                expect(OPERATORS[')'])
                 return Input(prompt)
             case KeywordToken("sort"):
                 next(t)
-                expect(OperatorToken('('))
-                array = parse_let()
-                expect(OperatorToken(')'))
-                return Sort(array)
+                expect(OPERATORS['('])
+                parts = [(yield parse_expr())]
+                while len(parts) < 3 and t.peek(None) is OPERATORS[',']:
+                    expect(OPERATORS[','])
+                    parts.append((yield parse_expr()))
+                expect(OPERATORS[')'])
+                return Sort(*parts)
             case _:
                 print(t.peek(None))
                 raise ValueError("Unexpected token in expression")
 
-    result = parse_print()
+    result = trampoline(parse_print())
     if result is None:
         raise ValueError("Invalid syntax")
     return result
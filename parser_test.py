@@ -1,5 +1,5 @@
 from parser import parse
-from tree import BinOp
+from tree import BinOp, Let, Sort, Var
 
 def test_addition():
     tree = parse("3 + 5")
@@ -17,3 +17,31 @@ def test_nested_expression():
     assert tree.left.left.v == 1
     assert tree.left.right.v == 2
     assert tree.right.v == 4
+
+def test_left_associative_chain():
+    tree = parse("a - b - c")
+    assert tree.op == "-"
+    assert tree.left.op == "-"
+    assert tree.left.left.v == "a"
+    assert tree.right.v == "c"
+
+def test_binding_powers():
+    tree = parse("a < b + 2 * c and d")
+    assert tree.op == "and"
+    assert tree.left.op == "<"
+    assert tree.left.right.op == "+"
+    assert tree.left.right.right.op == "*"
+    assert tree.right.v == "d"
+
+def test_deeply_nested_lets():
+    depth = 5000
+    tree = parse("let x be 0 in " * depth + "x" + " end" * depth)
+    for _ in range(depth):
+        assert isinstance(tree, Let)
+        tree = tree.f
+    assert tree.v == "x"
+
+def test_sort_takes_an_order_and_a_key():
+    assert parse("sort(a)") == Sort(Var("a"))
+    tree = parse("sort(a, true, 1)")
+    assert isinstance(tree, Sort) and tree.descending.v is True and tree.key.v == 1
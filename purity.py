@@ -0,0 +1,102 @@
+from dataclasses import fields, replace
+from tree import *
+from lexer import *
+
+# Purity analysis, to find the functions whose calls can be memoized. A
+# function is pure if calling it twice with the same arguments gives the same
+# result and nothing else happens: its body
+#
+# - prints or reads nothing, and changes no array or map (no Print, Input,
+#   Sort, ArrayAssign or MapAssign);
+# - calls no builtin, since those read arrays and may call any function;
+# - assigns no captured variable, though it may assign its own locals;
+# - reads no array or map element, since those can change between calls;
+# - calls only pure functions: itself, or let-bound functions that are never
+#   reassigned and are pure in turn.
+#
+# Functions that call each other are worked out together: every function
+# starts out pure and loses it once it breaks a rule or calls one that has,
+# until nothing changes.
+
+IMPURE = (Print, Input, Sort, ArrayAssign, MapAssign, ArrayIndex, MapAccess, Builtin)
+
+def mark_pure(tree: AST) -> AST:
+    """tree with Fun.pure set on each pure function."""
+    funs, bound, assigned = survey(tree)
+    facts = {id(fun): body_facts(fun) for fun in funs}
+    callable_ids = {i: fun for i, fun in bound.items() if i not in assigned}
+    pure = {id(fun) for fun in funs if facts[id(fun)] is not None}
+    changed = True
+    while changed:
+        changed = False
+        for fun in funs:
+            if id(fun) in pure and any(i not in callable_ids or id(callable_ids[i]) not in pure for i in facts[id(fun)]):
+                pure.discard(id(fun))
+                changed = True
+    return trampoline(mark_steps(tree, pure))
+
+def survey(tree: AST):
+    """Every Fun, the Fun each let-bound function id names, and the ids ever assigned."""
+    funs, bound, assigned = [], {}, set()
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, Fun):
+            funs.append(node)
+        elif isinstance(node, Let) and isinstance(node.e, Fun):
+            bound[node.v.i] = node.e
+        elif isinstance(node, Assign) and isinstance(node.var, Var):
+            assigned.add(node.var.i)
+        if isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return funs, bound, assigned
+
+def body_facts(fun: Fun):
+    """The ids of the functions fun's body calls, or None if it breaks a rule whatever they are."""
+    if fun.assigns_captured:
+        return None
+    called = set()
+    work = [fun.body]
+    while work:
+        node = work.pop()
+        if isinstance(node, IMPURE):
+            return None
+        if isinstance(node, Fun):
+            continue  # Making a closure does nothing; calling it is checked where it is called
+        if isinstance(node, Call):
+            if not isinstance(node.func, Var):
+                return None
+            called.add(node.func.i)
+        if isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return called
+
+def mark_steps(t, pure):
+    match t:
+        case Fun(parameters, body):
+            return replace(t, body=(yield mark_steps(body, pure)), pure=id(t) in pure)
+        case AST():
+            values = []
+            for f in fields(t):
+                values.append((yield mark_steps(getattr(t, f.name), pure)))
+            return type(t)(*values)
+        case list():
+            items = []
+            for item in t:
+                items.append((yield mark_steps(item, pure)))
+            return items
+        case dict():
+            entries = {}
+            for key, value in t.items():
+                entries[key] = yield mark_steps(value, pure)
+            return entries
+        case _:
+            return t
@@ -0,0 +1,87 @@
+import runtime
+from purity import mark_pure
+from parser import parse
+from resolver import resolve
+from eval import e
+from compiler import run, ENGINES
+from lexer import IntToken, StringToken
+from tree import Fun
+
+def marked(code):
+    return mark_pure(resolve(parse(code)))
+
+def purity(code):
+    """Whether each function in code is pure, in source order."""
+    found = []
+    work = [marked(code)]
+    while work:
+        node = work.pop(0)
+        if isinstance(node, Fun):
+            found.append(node.pure)
+        if isinstance(node, list):
+            work[:0] = node
+        elif hasattr(node, "__dataclass_fields__"):
+            work[:0] = [getattr(node, name) for name in node.__dataclass_fields__]
+    return found
+
+FIB = "let fib be fun(n) is if {n < 2} then n else fib(n - 1) + fib(n - 2) end in fib(%d) end"
+
+def test_recursive_arithmetic_is_pure():
+    assert purity(FIB % 10) == [True]
+
+def test_effects_are_impure():
+    assert purity("let f be fun(n) is print(n) in f(1) end") == [False]
+    assert purity("let f be fun(a) is a[0] := 1 in f([0]) end") == [False]
+    assert purity("let a be [1] in let f be fun(n) is a[0] + n in f(1) end end") == [False]
+    assert purity("let x be 1 in let f be fun(n) is x := n in f(1) end end") == [False]
+
+def test_local_assignments_are_pure():
+    assert purity("let f be fun(n) is let s be 0 in while {n > 0} do s := s + n; n := n - 1 end; s end in f(3) end") == [True]
+
+def test_calls_must_be_to_pure_functions():
+    assert purity("let f be fun(g, n) is g(n) in 1 end") == [False]
+    assert purity("let p be fun(n) is print(n) in let f be fun(n) is p(n) in f(1) end end") == [False, False]
+    assert purity("let p be fun(n) is n + 1 in let f be fun(n) is p(n) in f(1) end end") == [True, True]
+    assert purity("let p be fun(n) is n in let f be fun(n) is p(n) in p := fun(n) is print(n); f(1) end end") == [True, False, False]
+
+def both(code):
+    tree = marked(code)
+    return e(tree), run(tree)
+
+def test_memoized_calls_give_the_same_results():
+    runtime.memo_stats.clear()
+    assert both(FIB % 25) == (IntToken(75025), IntToken(75025))
+    [stats] = runtime.memo_stats.values()
+    assert stats.misses == 2 * 26 and stats.hits == 2 * 23
+
+def test_tail_calls_are_not_remembered():
+    code = "let f be fun(n, acc) is if {n == 0} then acc else f(n - 1, acc + n) end in f(100000, 0) end"
+    for engine in ENGINES.values():
+        runtime.memo_stats.clear()
+        assert engine(marked(code)) == IntToken(5000050000)
+        [stats] = runtime.memo_stats.values()
+        assert (stats.hits, stats.misses) == (0, 1)  # Only the outer call, on every engine
+
+def test_keys_tell_booleans_from_integers():
+    walked, compiled = both('let f be fun(x) is x + "" in [f(1), f(true), f(1)] end')
+    assert walked == compiled == [StringToken("1"), StringToken("True"), StringToken("1")]
+
+def test_arrays_are_not_remembered():
+    code = "let f be fun(n) is [n] in let a be f(1) in a[0] := 5; f(1) end end"
+    assert both(code) == ([IntToken(1)], [IntToken(1)])
+
+def test_tables_are_bounded(monkeypatch):
+    monkeypatch.setattr(runtime, "MEMO_SIZE", 2)
+    memo = runtime.Memo(marked(FIB % 1).e)
+    for n in range(3):
+        memo.add(runtime.memo_key([n]), n)
+    assert memo.find(runtime.memo_key([0])) is runtime.MISSING  # The oldest went first
+    assert memo.find(runtime.memo_key([1])) == 1
+    memo.add(runtime.memo_key([3]), 3)
+    assert memo.find(runtime.memo_key([2])) is runtime.MISSING  # 1 was used more recently
+    assert (memo.stats.hits, memo.stats.misses) == (1, 2)
+
+def test_only_ints_strings_and_booleans_make_keys():
+    assert runtime.memo_key([1, "a", True]) is not None
+    assert runtime.memo_key([1.0]) is None
+    assert runtime.memo_key([[1]]) is None
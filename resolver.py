@@ -1,11 +1,77 @@
 from tree import *
 from lexer import *
+import sys
 
-def lookup(env, v):
-    for u, uv in reversed(env):
-        if u == v:
-            return uv
-    raise ValueError("No value found.")
+class Frame:
+    """A function being resolved: its slot count and the variables it captures."""
+    def __init__(self):
+        self.size = 1            # Next free slot
+        self.captures = []       # Addresses in the enclosing frame, one per captured slot
+        self.captured = {}       # Binding id -> slot among the captured values
+        self.assigns_captured = False
+
+class Env:
+    """
+    The names in scope while resolving. Each name maps to a stack of its
+    bindings, innermost last, so lookup is a dict access however many names
+    are in scope. Every binding is (id, frame number, slot): frames are
+    numbered by function nesting (0 is the top level) and slots count from 1
+    within a frame, slot 0 being the link to the closure's captured values.
+
+    Closures are flat: a function copies the values of the outer variables it
+    uses into its own captured frame when it is made, so a variable is always
+    at depth 0 (a local) or depth 1 (a captured value). A variable from
+    several functions out is captured by every function in between.
+    """
+    def __init__(self):
+        self.bindings = {}
+        self.trail = []          # Names in binding order, for unbinding back to a mark
+        self.frames = [Frame()]
+
+    def bind(self, name, id):
+        frame = self.frames[-1]
+        slot = frame.size
+        frame.size += 1
+        self.bindings.setdefault(name, []).append((id, len(self.frames) - 1, slot))
+        self.trail.append(name)
+        return Var(name, id, 0, slot)
+
+    def lookup(self, name):
+        stack = self.bindings.get(name)
+        if not stack:
+            return None
+        id, frame, slot = stack[-1]
+        current = len(self.frames) - 1
+        if frame == current:
+            return Var(name, id, 0, slot)
+        captured = self.frames[current].captured.get(id)
+        if captured is not None:
+            return Var(name, id, 1, captured)
+        # Thread the capture through each function between the binding and here
+        depth = 0
+        for level in range(frame + 1, current + 1):
+            f = self.frames[level]
+            captured = f.captured.get(id)
+            if captured is None:
+                f.captures.append(Var(name, id, depth, slot))
+                captured = f.captured[id] = len(f.captures)
+            depth, slot = 1, captured
+        return Var(name, id, 1, slot)
+
+    def mark(self):
+        return len(self.trail)
+
+    def unbind_to(self, mark):
+        bindings, trail = self.bindings, self.trail
+        while len(trail) > mark:
+            bindings[trail.pop()].pop()
+
+    def enter_frame(self):
+        self.frames.append(Frame())
+
+    def exit_frame(self):
+        """Leave a function's frame and return it."""
+        return self.frames.pop()
 
 def make_fresh():
     i = 0
@@ -17,42 +83,53 @@ def make_fresh():
 
 def resolve(t: AST, env = None, fresh = None) -> AST:
     if env is None:
-        env = []
+        env = Env()
     if fresh is None: 
         fresh = make_fresh()
-        
+    return trampoline(resolve_steps(t, env, fresh))
+
+def lookup(env, x):
+    var = env.lookup(x)
+    if var is None:
+        raise ValueError(f"Unbound variable: {x}")
+    return var
+
+def resolve_steps(t: AST, env, fresh, tail=False):
+    """
+    The resolver as a generator for trampoline(): each sub-resolution is
+    yielded, not called. tail says whether t's value is the result of the
+    function it is in, which makes a call there a tail call.
+    """
     match t:
         case IntToken(n):
             return IntToken(n)
-        case Var(x, _):
-            return Var(x, lookup(env, x))
-        case Let(Var(x, _), e, f):
+        case Var(x):
+            return lookup(env, x)
+        case Let(Var(x), e, f):
             # er = resolve(e, env, fresh) normal case
             # env.append((x, i := fresh()))
             # fr = resolve(f, env, fresh)
             # env.pop()
             # return Let(Var(x, i), er, fr)
+            mark = env.mark()
             if isinstance(e, Fun):
-                env.append((x, i := fresh()))
-                er = resolve(e, env, fresh)
-                fr = resolve(f, env, fresh)
-                env.pop()
-                return Let(Var(x, i), er, fr)
+                v = env.bind(x, fresh())
+                er = yield resolve_steps(e, env, fresh)
             else:
-                er = resolve(e, env, fresh)
-                env.append((x, i := fresh()))
-                fr = resolve(f, env, fresh)
-                env.pop()
-                return Let(Var(x, i), er, fr)
+                er = yield resolve_steps(e, env, fresh)
+                v = env.bind(x, fresh())
+            fr = yield resolve_steps(f, env, fresh, tail)
+            env.unbind_to(mark)
+            return Let(v, er, fr)
         case Assign(var, expr):
-            expr_resolved = resolve(expr, env, fresh)
-            try:
-                var_id = lookup(env, var)
-                return Assign(Var(var, var_id), expr_resolved)
-            except ValueError:
-                env.append((var, i := fresh()))
-                result = Assign(Var(var, i), expr_resolved)
-                return result
+            expr_resolved = yield resolve_steps(expr, env, fresh)
+            v = env.lookup(var)
+            if v is None:
+                # Assigning an unbound name declares it for the rest of the enclosing scope
+                v = env.bind(var, fresh())
+            if v.depth == 1:
+                env.frames[-1].assigns_captured = True
+            return Assign(v, expr_resolved)
         # case Fun(f, Var(x, _), b, y):     normal case
         #     env.append((x, i := fresh()))
         #     br = resolve(b, env, fresh)
@@ -63,85 +140,124 @@ def resolve(t: AST, env = None, fresh = None) -> AST:
         #     xr = resolve(x, env, fresh)
         #     return Call(f, xr)
         case Fun(parameters, body):
-            param_names = [param.v for param in parameters]
-            param_ids = [fresh() for _ in param_names]
-            env.extend(zip(param_names, param_ids))
-            body_resolved = resolve(body, env, fresh)
-            for _ in param_names:
-                env.pop()
-            
-            return Fun([Var(name, param_id) for name, param_id in zip(param_names, param_ids)], body_resolved)
+            mark = env.mark()
+            env.enter_frame()
+            params_resolved = [env.bind(param.v, fresh()) for param in parameters]
+            body_resolved = yield resolve_steps(body, env, fresh, True)
+            frame = env.exit_frame()
+            env.unbind_to(mark)
+            return Fun(params_resolved, body_resolved, frame.size, frame.captures, frame.assigns_captured)
+        case Call(Var(x), args) if x in BUILTIN_ARITY and env.lookup(x) is None:
+            # A builtin, unless the program binds the name itself
+            arity = BUILTIN_ARITY[x]
+            if len(args) != arity:
+                raise ValueError(f"{x}() takes {arity} argument{'s' if arity > 1 else ''}")
+            return Builtin(x, (yield from resolve_each(args, env, fresh)))
         case Call(func, args):
-            func_resolved = resolve(func, env, fresh)
-            args_resolved = [resolve(arg, env, fresh) for arg in args]
-            return Call(func_resolved, args_resolved)
+            func_resolved = yield resolve_steps(func, env, fresh)
+            args_resolved = yield from resolve_each(args, env, fresh)
+            return Call(func_resolved, args_resolved, tail)
         case Array(elements):
-            return Array([resolve(elem, env, fresh) for elem in elements])
-        # case ArrayIndex(array, index):
-        #     return ArrayIndex(
-        #         resolve(array, env, fresh),
-        #         resolve(index, env, fresh)
-        #     )
-        # case ArrayAssign(array, index, value):
-        #     return ArrayAssign(
-        #         resolve(array, env, fresh),
-        #         resolve(index, env, fresh),
-        #         resolve(value, env, fresh)
-        #     )
+            return Array((yield from resolve_each(elements, env, fresh)))
         
         case ArrayIndex(array, indices):
             # If indices is not a list, wrap it in a list for backwards compatibility
             if not isinstance(indices, list):
-                resolved_indices = resolve(indices, env, fresh)
+                resolved_indices = yield resolve_steps(indices, env, fresh)
             else:
                 # Resolve each index in the list
-                resolved_indices = [resolve(idx, env, fresh) for idx in indices]
+                resolved_indices = yield from resolve_each(indices, env, fresh)
             
             return ArrayIndex(
-                resolve(array, env, fresh),
+                (yield resolve_steps(array, env, fresh)),
                 resolved_indices
             )
             
         case ArrayAssign(array, indices, value):
             # If indices is not a list, wrap it in a list for backwards compatibility
             if not isinstance(indices, list):
-                resolved_indices = resolve(indices, env, fresh)
+                resolved_indices = yield resolve_steps(indices, env, fresh)
             else:
                 # Resolve each index in the list
-                resolved_indices = [resolve(idx, env, fresh) for idx in indices]
+                resolved_indices = yield from resolve_each(indices, env, fresh)
                 
             return ArrayAssign(
-                resolve(array, env, fresh),
+                (yield resolve_steps(array, env, fresh)),
                 resolved_indices,
-                resolve(value, env, fresh)
+                (yield resolve_steps(value, env, fresh))
             )
 
         case BinOp(op, left, right):
-            return BinOp(op, resolve(left, env, fresh), resolve(right, env, fresh))
+            return BinOp(op, (yield resolve_steps(left, env, fresh)), (yield resolve_steps(right, env, fresh)))
         case If(cond, then, else_):
-            return If(resolve(cond, env, fresh), resolve(then, env, fresh), resolve(else_, env, fresh))
+            return If((yield resolve_steps(cond, env, fresh)), (yield resolve_steps(then, env, fresh, tail)),
+                      (yield resolve_steps(else_, env, fresh, tail)))
         case While(condition, body):
-            condition_resolved = resolve(condition, env, fresh)            
-            body_resolved = []
-            for expr in body:
-                body_resolved.append(resolve(expr, env, fresh))
+            condition_resolved = yield resolve_steps(condition, env, fresh)
+            body_resolved = yield from resolve_each(body, env, fresh)
             return While(condition_resolved, body_resolved)
         case Map(entries):
-            resolved_entries = {resolve(key, env, fresh): resolve(value, env, fresh) for key, value in entries.items()}
+            resolved_entries = {}
+            for key, value in entries.items():
+                key_resolved = yield resolve_steps(map_key(key), env, fresh)
+                resolved_entries[key_resolved] = yield resolve_steps(value, env, fresh)
             return Map(resolved_entries)
         case MapAssign(map, key, value):
-            return MapAssign(resolve(map, env, fresh), resolve(key, env, fresh), resolve(value, env, fresh))
+            return MapAssign((yield resolve_steps(map, env, fresh)), (yield resolve_steps(map_key(key), env, fresh)), (yield resolve_steps(value, env, fresh)))
         case MapAccess(map, key):
-            return MapAccess(resolve(map, env, fresh), resolve(key, env, fresh))
+            return MapAccess((yield resolve_steps(map, env, fresh)), (yield resolve_steps(map_key(key), env, fresh)))
         case ArrayInit(value, size):
             return ArrayInit(
-                resolve(value, env, fresh),
-                resolve(size, env, fresh)
+                (yield resolve_steps(value, env, fresh)),
+                (yield resolve_steps(size, env, fresh))
             )
         case Print(value):
-            return Print(resolve(value, env, fresh))
-        case Sort(array):
-            return Sort(resolve(array, env, fresh))
+            return Print((yield resolve_steps(value, env, fresh)))
+        case Sort(array, descending, key):
+            return Sort(
+                (yield resolve_steps(array, env, fresh)),
+                (yield resolve_steps(descending, env, fresh)),
+                (yield resolve_steps(key, env, fresh))
+            )
+        case list():
+            return (yield from resolve_each(t, env, fresh, tail))
         case _:
             return t
-        
+
+def map_key(key):
+    """
+    A map key as written: a string literal becomes the plain string, interned,
+    which the engines use as it is. Every literal key with the same text is
+    then the same string, so a map built from literal keys and looked up by
+    one compares keys by identity alone, and its hash is worked out only once.
+    """
+    if isinstance(key, StringToken):
+        key = key.v
+    return sys.intern(key) if type(key) is str else key
+
+def resolve_each(ts, env, fresh, tail=False):
+    """Resolve a list; with tail, its last item is in tail position."""
+    resolved = []
+    last = len(ts) - 1
+    for k, t in enumerate(ts):
+        resolved.append((yield resolve_steps(t, env, fresh, tail and k == last)))
+    return resolved
+
+def frame_size(t: AST) -> int:
+    """The number of slots (including the link in slot 0) the top level of a resolved program needs."""
+    size = 1
+    work = [t]
+    while work:
+        node = work.pop()
+        if isinstance(node, Var):
+            if node.depth == 0 and node.slot is not None:
+                size = max(size, node.slot + 1)
+        elif isinstance(node, Fun):
+            work.extend(node.captures or ())  # Its body lives in its own frame
+        elif isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+        elif isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+    return size
@@ -1,7 +1,7 @@
 import pytest
 from tree import *
 from lexer import *
-from resolver import resolve
+from resolver import resolve, frame_size
 
 def test_simple_let():
     ast = Let(Var("x", None), IntToken(5), BinOp("+", Var("x", None), IntToken(3)))
@@ -53,3 +53,76 @@ def test_while_loop():
                    While(BinOp("<", Var("x", 0), IntToken(10)),
                          BinOp("+", Var("x", 0), IntToken(1))))
     assert resolve(ast) == expected
+
+def test_deeply_nested_lets():
+    depth = 5000
+    ast = Var("x", None)
+    for _ in range(depth):
+        ast = Let(Var("x", None), IntToken(0), ast)
+    resolved = resolve(ast)
+    for _ in range(depth - 1):
+        resolved = resolved.f
+    assert resolved.f.i == resolved.v.i
+
+def test_lexical_addresses():
+    # let x be 1 in let f be fun(y) is x + y in f(2) end end
+    ast = Let(Var("x"), IntToken(1),
+              Let(Var("f"), Fun([Var("y")], BinOp("+", Var("x"), Var("y"))),
+                  Call(Var("f"), [IntToken(2)])))
+    resolved = resolve(ast)
+    fun = resolved.f.e
+    assert (resolved.v.depth, resolved.v.slot) == (0, 1)
+    assert (resolved.f.v.depth, resolved.f.v.slot) == (0, 2)
+    assert (fun.body.left.depth, fun.body.left.slot) == (1, 1)
+    assert (fun.body.right.depth, fun.body.right.slot) == (0, 1)
+    assert fun.size == 2
+    assert [(c.v, c.depth, c.slot) for c in fun.captures] == [("x", 0, 1)]
+    assert not fun.assigns_captured
+    assert frame_size(resolved) == 3
+
+def test_captures_thread_through_enclosing_functions():
+    # let x be 1 in fun(a) is fun(b) is x := b end
+    ast = Let(Var("x"), IntToken(1),
+              Fun([Var("a")], Fun([Var("b")], Assign("x", Var("b")))))
+    outer = resolve(ast).f
+    inner = outer.body
+    assert [(c.v, c.depth, c.slot) for c in outer.captures] == [("x", 0, 1)]
+    assert [(c.v, c.depth, c.slot) for c in inner.captures] == [("x", 1, 1)]
+    assert (inner.body.var.depth, inner.body.var.slot) == (1, 1)
+    assert inner.assigns_captured and not outer.assigns_captured
+
+def test_shadowing_uses_innermost_binding():
+    ast = Let(Var("x"), IntToken(1), Let(Var("x"), Var("x"), Var("x")))
+    resolved = resolve(ast)
+    assert resolved.f.e.i == resolved.v.i
+    assert resolved.f.f.i == resolved.f.v.i != resolved.v.i
+    assert resolved.f.f.slot == 2
+
+def test_marks_tail_calls():
+    # fun(n) is if n then g(n) else let x be g(n) in g(x) end end
+    ast = Let(Var("g"), Fun([Var("a")], Var("a")),
+              Fun([Var("n")], If(Var("n"), Call(Var("g"), [Var("n")]),
+                                 Let(Var("x"), Call(Var("g"), [Var("n")]), [Call(Var("g"), [Var("x")])]))))
+    body = resolve(ast).f.body
+    assert body.then.tail
+    assert not body.else_.e.tail
+    assert body.else_.f[0].tail
+
+def test_top_level_calls_are_not_tail_calls():
+    resolved = resolve(Let(Var("g"), Fun([], IntToken(1)), Call(Var("g"), [])))
+    assert not resolved.f.tail
+
+def test_unbound_builtin_names_become_builtins():
+    ast = Call(Var("sum", None), [Array([IntToken(1)])])
+    assert resolve(ast) == Builtin("sum", [Array([IntToken(1)])])
+    with pytest.raises(ValueError, match="dot\\(\\) takes 2 arguments"):
+        resolve(Call(Var("dot", None), [Array([])]))
+    shadowed = resolve(Let(Var("sum", None), IntToken(1), Call(Var("sum", None), [IntToken(2)])))
+    assert isinstance(shadowed.f, Call)
+
+def test_literal_map_keys_are_interned_strings():
+    key = "".join(["cou", "nt"])  # Not the same string object as any other "count"
+    tree = resolve(Let(Var("m", None), Map({key: IntToken(1)}),
+                       MapAssign(Var("m", None), StringToken(key), MapAccess(Var("m", None), StringToken(key)))))
+    [map_key] = tree.e.entries
+    assert map_key == "count" and map_key is tree.f.key is tree.f.value.key
@@ -0,0 +1,971 @@
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+from functools import reduce
+from lexer import *
+import copy
+import math
+import operator
+
+try:
+    import numpy
+except ImportError:  # Optional: the same results come without it, only slower
+    numpy = None
+
+# Runtime values are plain Python values: int, float (or Decimal), bool, str,
+# list (or NumArray, see below) for arrays, dict for maps and a (Fun, body, captured values) tuple for
+# closures. The lexer's tokens only come back at the edges: box() turns a
+# result into tokens for whoever called the engine, and printable() does the
+# same with numbers as Decimals for printing. Everything here is shared by all
+# the engines that run Cobra programs.
+
+class WholeQuotient(float):
+    """
+    The float / gives for two integers that divide exactly. It prints with no
+    fraction, as the exact Decimal quotient always did (270 / 3 prints 90),
+    and like that Decimal it stays whole through +, -, *, % and exact / with
+    integers and other whole quotients; with any other float it gives a plain
+    float, which prints its fraction (2.0).
+    """
+    __slots__ = ()
+
+    def keep(self, value, other):
+        if value is NotImplemented or type(other) not in WHOLE:
+            return value
+        return WholeQuotient(value)
+
+    def __add__(self, other):
+        return self.keep(float.__add__(self, other), other)
+
+    def __radd__(self, other):
+        return self.keep(float.__radd__(self, other), other)
+
+    def __sub__(self, other):
+        return self.keep(float.__sub__(self, other), other)
+
+    def __rsub__(self, other):
+        return self.keep(float.__rsub__(self, other), other)
+
+    def __mul__(self, other):
+        return self.keep(float.__mul__(self, other), other)
+
+    def __rmul__(self, other):
+        return self.keep(float.__rmul__(self, other), other)
+
+    def __truediv__(self, other):
+        value = float.__truediv__(self, other)
+        return self.keep(value, other) if float.__mod__(self, other) == 0 else value
+
+    def __rtruediv__(self, other):
+        value = float.__rtruediv__(self, other)
+        return self.keep(value, other) if float.__rmod__(self, other) == 0 else value
+
+    def __neg__(self):
+        return WholeQuotient(-float(self))
+
+WHOLE = frozenset({int, bool, WholeQuotient})  # Numbers a WholeQuotient stays whole with
+
+NUMBER = frozenset({int, float, WholeQuotient, Decimal})  # bool is an int to Python, but not to Cobra
+FLOAT = frozenset({float, WholeQuotient, Decimal})
+INT_OR_BOOL = frozenset({int, bool})
+
+TYPE_NAMES = {int: "IntToken", float: "FloatToken", WholeQuotient: "FloatToken", Decimal: "FloatToken", bool: "BoolToken", str: "StringToken"}
+
+def type_name(value) -> str:
+    """The name error messages use for a value's type."""
+    return TYPE_NAMES.get(type(value)) or type(value).__name__
+
+def box(value):
+    """A runtime value as lexer tokens."""
+    t = type(value)
+    if t is int:
+        return IntToken(value)
+    if t in FLOAT:
+        return FloatToken(value)
+    if t is bool:
+        return BoolToken(value)
+    if t is str:
+        return StringToken(value)
+    if t in ARRAY_TYPES:
+        return [box(item) for item in value]
+    if t is dict:
+        return {key: box(item) for key, item in value.items()}
+    return value
+
+# Numbers. Integers are Python ints, so they never overflow or round. Floats
+# are Python floats, unless the program runs with exact decimals, in which case
+# they are Decimals and dividing two integers gives a Decimal too. Either way
+# numbers are printed as the Decimals Cobra has always printed.
+decimal_mode = False
+
+def set_decimal_mode(enabled: bool):
+    """Use Decimal rather than float for / and input(); lex and parse with decimal=enabled to match."""
+    global decimal_mode
+    decimal_mode = enabled
+
+def as_decimal(v):
+    if type(v) is int:
+        return Decimal(v)
+    if type(v) is float:
+        return Decimal(repr(v))  # Its shortest repr: 2.0 prints as 2.0
+    if type(v) is WholeQuotient:
+        return Decimal(int(v))
+    return v
+
+def number_text(v) -> str:
+    return str(as_decimal(v))
+
+def printable(value):
+    """A runtime value, or a result already boxed by box(), as tokens with every number a Decimal."""
+    if isinstance(value, (IntToken, FloatToken)):
+        return type(value)(as_decimal(value.v))
+    if isinstance(value, Token):
+        return value
+    t = type(value)
+    if t in ARRAY_TYPES:
+        return [printable(item) for item in value]
+    if t is dict:
+        return {key: printable(item) for key, item in value.items()}
+    if t in NUMBER:
+        return printable(box(value))
+    return box(value)
+
+def trunc_div(a, b):
+    """a // b rounded toward zero, as Decimal has always done it in Cobra."""
+    if type(a) is int and type(b) is int:
+        q = a // b
+        if q < 0 and q * b != a:  # Python rounds down
+            q += 1
+        return q
+    if isinstance(a, Decimal) or isinstance(b, Decimal):
+        return int(a // b)
+    q = int(abs(a) // abs(b))
+    return q if (a < 0) == (b < 0) else -q
+
+def trunc_mod(a, b):
+    """a % b with the sign of a, as Decimal has always done it in Cobra."""
+    if type(a) is int and type(b) is int:
+        r = a % b
+        if r and (a < 0) != (b < 0):  # Python gives r the sign of b
+            r -= b
+        return r
+    if isinstance(a, Decimal) or isinstance(b, Decimal):
+        return a % b
+    r = math.fmod(a, b)
+    return WholeQuotient(r) if type(a) in WHOLE and type(b) in WHOLE else r
+
+# Binary operators
+
+def op_ge(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left >= right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} >= {type_name(right)}")
+
+def op_le(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left <= right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} <= {type_name(right)}")
+
+def op_floordiv(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        if right == 0:
+            raise ZeroDivisionError("Floor division by zero")
+        # Floor division returns an integer
+        return trunc_div(left, right)
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} // {type_name(right)}")
+
+def op_or(left, right):
+    if type(left) in INT_OR_BOOL and type(right) in INT_OR_BOOL:
+        return 1 if left != 0 or right != 0 else 0
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} or {type_name(right)}")
+
+def op_and(left, right):
+    if type(left) in INT_OR_BOOL and type(right) in INT_OR_BOOL:
+        return 1 if left != 0 and right != 0 else 0
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} and {type_name(right)}")
+
+def op_mod(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        if right == 0:
+            raise ZeroDivisionError("Modulo by zero")
+        return trunc_mod(left, right)
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} % {type_name(right)}")
+
+def op_add(left, right):
+    # Booleans add as 0 and 1
+    if isinstance(left, (int, float, Decimal)) and isinstance(right, (int, float, Decimal)):
+        return left + right
+    elif type(left) is str and type(right) is str:
+        return left + right
+    elif type(left) is str and isinstance(right, (int, float, Decimal)):
+        return left + number_text(right)
+    elif isinstance(left, (int, float, Decimal)) and type(right) is str:
+        return number_text(left) + right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} + {type_name(right)}")
+
+def op_mul(left, right):
+    if type(left) is str and type(right) is int:
+        return left * right
+    elif type(left) is int and type(right) is str:
+        return right * left
+    elif type(left) in NUMBER and type(right) in NUMBER:
+        return left * right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} * {type_name(right)}")
+
+def op_sub(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left - right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} - {type_name(right)}")
+
+def op_truediv(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        if right == 0:
+            raise ZeroDivisionError("Division by zero")
+        if type(left) is int and type(right) is int:
+            if decimal_mode:
+                return Decimal(left) / Decimal(right)
+            if left % right == 0:
+                return WholeQuotient(left / right)
+        return left / right  # A WholeQuotient divides as its __truediv__ says
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} / {type_name(right)}")
+
+def op_pow(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        if type(left) is int and type(right) is int and right < 0:
+            return op_truediv(1, left ** -right)
+        return left ** right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} ^ {type_name(right)}")
+
+def op_gt(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left > right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} > {type_name(right)}")
+
+def op_lt(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left < right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} < {type_name(right)}")
+
+def op_eq(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left == right
+    elif type(left) is str and type(right) is str:
+        return left == right
+    elif type(left) is bool and type(right) is bool:
+        return left == right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} == {type_name(right)}")
+
+def op_ne(left, right):
+    if type(left) in NUMBER and type(right) in NUMBER:
+        return left != right
+    elif type(left) is bool and type(right) is bool:
+        return left != right
+    else:
+        raise TypeError(f"Invalid operation: {type_name(left)} == {type_name(right)}")
+
+# One function per operator
+BINARY_OPS = {
+    ">=": op_ge,
+    "<=": op_le,
+    "//": op_floordiv,
+    "or": op_or,
+    "and": op_and,
+    "%": op_mod,
+    "+": op_add,
+    "*": op_mul,
+    "-": op_sub,
+    "/": op_truediv,
+    "^": op_pow,
+    ">": op_gt,
+    "<": op_lt,
+    "==": op_eq,
+    "!=": op_ne,
+}
+
+def int_floordiv(left, right):
+    if right == 0:
+        raise ZeroDivisionError("Floor division by zero")
+    return trunc_div(left, right)
+
+def int_mod(left, right):
+    if right == 0:
+        raise ZeroDivisionError("Modulo by zero")
+    return trunc_mod(left, right)
+
+# The operators a TypedBinOp can have, for operands whose types are already
+# known to suit: numbers for all of them, two ints for // and %, two strings
+# for + and ==, two booleans for == and !=. Each gives just what the checked
+# operator would.
+TYPED_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "//": int_floordiv,
+    "%": int_mod,
+}
+
+def typed_op(op, left_type, right_type):
+    """The TYPED_OPS function for op on values of these Python types, or None if op needs checking."""
+    if left_type in NUMBER and right_type in NUMBER:
+        suits = op in TYPED_OPS and (op not in ("//", "%") or left_type is right_type is int)
+    elif left_type is right_type is str:
+        suits = op in ("+", "==")
+    elif left_type is right_type is bool:
+        suits = op in ("==", "!=")
+    else:
+        suits = False
+    return TYPED_OPS[op] if suits else None
+
+# Quickening, for operators whose operand types type inference could not
+# prove. The first time an engine runs a BinOp it stores in node.quick the
+# operand types it saw and the TYPED_OPS function for them, and from then on
+# runs that function straight away whenever the operands have those types
+# again. An ArrayIndex learns the same way whether it indexes arrays or
+# strings with integers. The first time the types differ the node is
+# deoptimized for good (quick is False) and goes the checked way from then on.
+
+class QuickStats:
+    def __init__(self):
+        self.specialized = 0
+        self.deoptimized = 0
+
+    def __str__(self):
+        return f"{self.specialized} nodes specialized, {self.deoptimized} deoptimized"
+
+quick_stats = QuickStats()
+
+def quicken_binop(node, left, right):
+    """The value of a BinOp whose specialized function does not apply, specializing or deoptimizing it."""
+    quick = node.quick
+    if quick is None:
+        handler = typed_op(node.op, type(left), type(right))
+        if handler is not None:
+            node.quick = (type(left), type(right), handler)
+            quick_stats.specialized += 1
+        else:
+            node.quick = False
+    elif quick:
+        node.quick = False
+        quick_stats.deoptimized += 1
+    return BINARY_OPS[node.op](left, right)
+
+def quicken_index(node, current, idx_val):
+    """
+    One step of an ArrayIndex that did not go the quick way, specializing or
+    deoptimizing it: the type it now indexes quickly, or False.
+    """
+    quick = node.quick
+    if quick is None:
+        if type(idx_val) is int and type(current) in (list, str):  # Packed arrays go the checked way
+            node.quick = type(current)
+            quick_stats.specialized += 1
+        else:
+            node.quick = False
+    elif quick and (type(current) is not quick or type(idx_val) is not int):  # Not just out of bounds
+        node.quick = False
+        quick_stats.deoptimized += 1
+    return node.quick
+
+def print_quick_stats(file):
+    print(f"Quickening: {quick_stats}", file=file)
+
+# Calls
+
+class TailCall:
+    """
+    What a call in tail position gives back instead of making the call: the
+    closure and arguments, for the call that is running the function to make
+    in its own place. Calls are never nested for tail calls, so a function
+    that recurses only through them runs in constant Python stack.
+    """
+    __slots__ = ("closure", "args")
+
+    def __init__(self, closure, args):
+        self.closure = closure
+        self.args = args
+
+def call_frame(fun, func_env, arg_values, frame=None):
+    """
+    The frame a call of fun runs in. A tail call passes the frame of the call
+    it replaces, which is reused if it is the right size, as no closure keeps
+    hold of one.
+    """
+    if len(fun.parameters) != len(arg_values):
+        raise ValueError("Incorrect number of arguments")
+    if fun.assigns_captured:
+        func_env = func_env.copy()  # Assignments last only as long as the call
+    if frame is not None and len(frame) == fun.size:
+        # Every slot but the arguments' is stored before it is read
+        frame[0] = func_env
+        frame[1:len(arg_values) + 1] = arg_values
+        return frame
+    frame = [func_env, *arg_values]
+    frame.extend([None] * (fun.size - len(frame)))
+    return frame
+
+# Memoization. A closure of a pure function (see purity.py) keeps a table of
+# its results by argument values in slot 0 of its captured values, which is
+# otherwise unused. Arguments are only looked up if they are all ints, strings
+# or booleans, so that no two different values share a key the way 1, 1.0 and
+# true or 0.0 and -0.0 would, and only immutable results are kept, so a
+# result is never an array some earlier caller could have changed.
+
+MEMO_SIZE = 1024  # Results kept per closure, least recently used dropped first
+
+MISSING = object()
+MEMO_RESULTS = frozenset({int, float, WholeQuotient, Decimal, bool, str, type(None)})
+_TRUE, _FALSE = object(), object()
+
+memo_stats = {}  # id of each memoized Fun -> its MemoStats
+
+class MemoStats:
+    """How often calls of one pure function were answered from its memo tables."""
+    def __init__(self, fun):
+        self.fun = fun
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        names = ", ".join(p.v for p in self.fun.parameters)
+        return f"fun({names}): {self.hits} hits, {self.misses} misses"
+
+class Memo:
+    __slots__ = ("table", "stats")
+
+    def __init__(self, fun):
+        self.table = OrderedDict()
+        stats = memo_stats.get(id(fun))
+        if stats is None or stats.fun is not fun:
+            stats = memo_stats[id(fun)] = MemoStats(fun)
+        self.stats = stats
+
+    def find(self, key):
+        """The result remembered for key, or MISSING."""
+        result = self.table.get(key, MISSING)
+        if result is MISSING:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+            self.table.move_to_end(key)
+        return result
+
+    def add(self, key, result):
+        if type(result) in MEMO_RESULTS:
+            table = self.table
+            table[key] = result
+            if len(table) > MEMO_SIZE:
+                table.popitem(last=False)
+
+def memo_key(arg_values):
+    """The memo table key for a call's arguments, or None if they cannot be one."""
+    key = []
+    for value in arg_values:
+        t = type(value)
+        if t is int or t is str:
+            key.append(value)
+        elif t is bool:
+            key.append(_TRUE if value else _FALSE)
+        else:
+            return None
+    return tuple(key)
+
+def print_memo_stats(file=None):
+    for stats in memo_stats.values():
+        print(stats, file=file)
+
+def call_closure(closure, arg_values, run):
+    """
+    Call closure as a Call not in tail position does, making the tail calls
+    it ends in in its place. run(body, frame) runs the body of a closure of
+    the engine that made it and gives its result.
+    """
+    if not isinstance(closure, tuple) or len(closure) != 3:
+        raise TypeError("Attempted to call a non-function")
+    fun, body, func_env = closure
+    memo = func_env[0]
+    key = None if memo is None else memo_key(arg_values)
+    if key is not None:
+        result = memo.find(key)
+        if result is not MISSING:
+            return result
+    frame = call_frame(fun, func_env, arg_values)
+    result = run(body, frame)
+    while type(result) is TailCall:
+        fun, body, func_env = result.closure
+        frame = call_frame(fun, func_env, result.args, frame)
+        result = run(body, frame)
+    if key is not None:
+        memo.add(key, result)
+    return result
+
+# Arrays, maps, input and output
+
+# Arrays of at least PACKED_MIN_LENGTH numbers of one type are packed: all
+# ints that fit in 64 bits, or all Python floats. Shorter ones are not worth
+# it, since packed elements are slower to reach.
+PACKED_MIN_LENGTH = 32
+PACKED_TYPES = {"q": int, "d": float}
+
+class NumArray:
+    """
+    An array of numbers packed into an array.array, which takes a fraction of
+    the memory of a list of them. The first time something that does not fit
+    is stored, it unpacks its items into a list and keeps them that way, so it
+    always holds exactly the values a list would.
+    """
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def __setitem__(self, i, value):
+        items = self.items
+        if type(items) is not list:
+            if type(value) is PACKED_TYPES[items.typecode]:
+                try:
+                    items[i] = value
+                    return
+                except OverflowError:  # An int too big for 64 bits
+                    pass
+            self.items = items = items.tolist()
+        items[i] = value
+
+    def __deepcopy__(self, memo):
+        items = self.items
+        return NumArray(copy.deepcopy(items, memo) if type(items) is list else items[:])
+
+    def sort(self, key=None, reverse=False):
+        items = self.items
+        if type(items) is list:
+            items.sort(key=key, reverse=reverse)
+        elif key is None and numpy is not None and items.typecode == "q":
+            vector = numpy.frombuffer(items, dtype=numpy.int64)
+            vector.sort()  # In place, in the array's own memory
+            if reverse:
+                vector[:] = vector[::-1].copy()
+        else:
+            self.items = array(items.typecode, sorted(items, key=key, reverse=reverse))
+
+TYPE_NAMES[NumArray] = "list"
+
+def pack(items: list):
+    """items as a NumArray if they can be packed, else as they are."""
+    if len(items) >= PACKED_MIN_LENGTH:
+        t = type(items[0])
+        if (t is int or t is float) and all(type(item) is t for item in items):
+            try:
+                return NumArray(array("q" if t is int else "d", items))
+            except OverflowError:
+                pass
+    return items
+
+# Two-dimensional arrays. An array of equal-length arrays of plain values,
+# made by [(row, n)] or written out as a literal of literal rows, is a Grid:
+# all its elements in one flat buffer, row after row, so a[i][j] is a single
+# look-up at i * cols + j and making n rows is one repetition of the first.
+# a[i] on its own is a GridRow, a view of row i in the same buffer, so a
+# store through either is seen through the other, as with lists of lists.
+# Replacing a whole row, a[i] := r, is the one thing the buffer cannot do:
+# the grid turns into an ordinary array of its rows, views of the buffer
+# until replaced, and stays one.
+
+SCALARS = frozenset({int, float, WholeQuotient, Decimal, bool, str})
+
+class Grid:
+    __slots__ = ("buffer", "cols", "length", "rows")
+
+    def __init__(self, buffer, cols, length):
+        self.buffer = buffer  # A NumArray, packed if it can be
+        self.cols = cols
+        self.length = length
+        self.rows = None      # Once a row has been replaced, the list of rows
+
+    def __len__(self):
+        return self.length if self.rows is None else len(self.rows)
+
+    def __iter__(self):
+        if self.rows is not None:
+            return iter(self.rows)
+        return (GridRow(self.buffer, i * self.cols, self.cols) for i in range(self.length))
+
+    def __getitem__(self, i):
+        if self.rows is not None:
+            return self.rows[i]
+        return GridRow(self.buffer, i * self.cols, self.cols)
+
+    def __setitem__(self, i, value):
+        if self.rows is None:
+            self.rows = list(self)
+        self.rows[i] = value
+
+    def __deepcopy__(self, memo):
+        if self.rows is not None:
+            return copy.deepcopy(self.rows, memo)
+        return Grid(copy.deepcopy(self.buffer, memo), self.cols, self.length)
+
+    def sort(self, key=None, reverse=False):
+        if self.rows is None:
+            self.rows = list(self)
+        self.rows.sort(key=key, reverse=reverse)
+
+    def row_start(self, i):
+        """Check a row index of a grid still in its buffer, and return where the row starts."""
+        if type(i) is not int:
+            raise TypeError("Array/string index must be an integer")
+        if i < 0 or i >= self.length:
+            raise IndexError(f"Array index out of bounds: {i}, array length: {self.length}")
+        return i * self.cols
+
+    def get(self, start, j):
+        """Element j of the row that starts at start, as index_value() would give it."""
+        if type(j) is not int:
+            raise TypeError("Array/string index must be an integer")
+        if j < 0 or j >= self.cols:
+            raise IndexError(f"Array index out of bounds: {j}, array length: {self.cols}")
+        return self.buffer.items[start + j]
+
+    def set(self, start, j, value):
+        """Store value as element j of the row that starts at start, checking j as element_index() would."""
+        if type(j) is not int:
+            raise TypeError("Array index must be an integer")
+        if j < 0 or j >= self.cols:
+            raise IndexError(f"Array index out of bounds: {j}, array length: {self.cols}")
+        self.buffer[start + j] = value
+
+class GridRow:
+    """Row of a Grid: length elements of its buffer from start on."""
+    __slots__ = ("buffer", "start", "length")
+
+    def __init__(self, buffer, start, length):
+        self.buffer = buffer
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.buffer.items[self.start:self.start + self.length])
+
+    def __getitem__(self, j):
+        return self.buffer.items[self.start + j]
+
+    def __setitem__(self, j, value):
+        self.buffer[self.start + j] = value
+
+    def __deepcopy__(self, memo):
+        return pack(copy.deepcopy(list(self), memo))
+
+    # Rows compare as the lists they stand for, for sorting a grid
+    def __lt__(self, other):
+        return list(self) < (list(other) if type(other) in ARRAY_TYPES else other)
+
+    def __gt__(self, other):
+        if type(other) in ARRAY_TYPES:
+            return list(self) > list(other)
+        return other < list(self)  # Reflected from other < self, so fail as that would
+
+    def sort(self, key=None, reverse=False):
+        items, start, end = self.buffer.items, self.start, self.start + self.length
+        ordered = sorted(items[start:end], key=key, reverse=reverse)
+        items[start:end] = ordered if type(items) is list else array(items.typecode, ordered)
+
+TYPE_NAMES[Grid] = TYPE_NAMES[GridRow] = "list"
+ARRAYS = (list, NumArray, Grid, GridRow)
+ARRAY_TYPES = frozenset(ARRAYS)
+
+def grid(row, length: int):
+    """A Grid of length copies of row, or None if row is empty or holds more than plain values."""
+    row = list(row)
+    if not row or any(type(item) not in SCALARS for item in row):
+        return None
+    t = type(row[0])
+    if (t is int or t is float) and len(row) * length >= PACKED_MIN_LENGTH and all(type(item) is t for item in row):
+        try:
+            return Grid(NumArray(array("q" if t is int else "d", row) * length), len(row), length)
+        except OverflowError:
+            pass
+    return Grid(NumArray(row * length), len(row), length)
+
+def literal_grid(rows: list):
+    """The value of an array literal whose elements are all array literals: a Grid if rows fit one."""
+    cols = len(rows[0])
+    if any(len(row) != cols for row in rows):
+        return rows
+    flat = [item for row in rows for item in row]
+    if not flat or any(type(item) not in SCALARS for item in flat):
+        return rows
+    packed = pack(flat)
+    return Grid(packed if type(packed) is NumArray else NumArray(flat), cols, len(rows))
+
+def index_value(current, idx_val):
+    """One step of arr[i][j]...: index an array or a string."""
+    if type(idx_val) is not int:
+        raise TypeError("Array/string index must be an integer")
+    if type(current) is str:
+        if idx_val < 0 or idx_val >= len(current):
+            raise IndexError(f"String index out of bounds: {idx_val}, string length: {len(current)}")
+        return current[idx_val]
+    elif type(current) is NumArray:
+        current = current.items
+        if idx_val < 0 or idx_val >= len(current):
+            raise IndexError(f"Array index out of bounds: {idx_val}, array length: {len(current)}")
+        return current[idx_val]
+    elif not isinstance(current, ARRAYS):
+        raise TypeError(f"Cannot index into {type_name(current)} - only arrays and strings are indexable")
+    else:
+        if idx_val < 0 or idx_val >= len(current):
+            raise IndexError(f"Array index out of bounds: {idx_val}, array length: {len(current)}")
+        return current[idx_val]
+
+def element_index(current, idx_val):
+    """Check one index of an array assignment and return it."""
+    if type(idx_val) is not int:
+        raise TypeError("Array index must be an integer")
+    if not isinstance(current, ARRAYS):
+        raise TypeError("Cannot index into non-array")
+    if idx_val < 0 or idx_val >= len(current):
+        raise IndexError(f"Array index out of bounds: {idx_val}, array length: {len(current)}")
+    return idx_val
+
+def make_array(initial_value, size_value):
+    if type(size_value) is not int:
+        raise TypeError("Array size must be an integer")
+    if size_value < 0:
+        raise ValueError("Array size cannot be negative")
+    if type(initial_value) in ARRAY_TYPES:
+        rows = grid(initial_value, size_value)
+        if rows is not None:
+            return rows
+    t = type(initial_value)
+    if (t is int or t is float) and size_value >= PACKED_MIN_LENGTH:
+        try:
+            return NumArray(array("q" if t is int else "d", [initial_value]) * size_value)
+        except OverflowError:
+            pass
+    if type(initial_value) in NUMBER or type(initial_value) in (bool, str):
+        return [initial_value] * size_value  # Immutable, so the copies can be shared
+    # Create a list of the specified size with the initial value
+    return [copy.deepcopy(initial_value) for _ in range(size_value)]
+
+def read_input(prompt_val):
+    if type(prompt_val) is str:
+        user_input = input(prompt_val)
+        try:
+            # Try to convert to number if possible
+            if '.' in user_input:
+                return Decimal(user_input) if decimal_mode else float(user_input)
+            return int(user_input)
+        except:
+            # If not a number, return as string
+            return user_input
+    raise TypeError("Input prompt must be a string")
+
+def print_value(value):
+    if type(value) in NUMBER:
+        print(as_decimal(value))
+    elif type(value) is str:
+        print(value)
+    else:
+        print(printable(value))
+
+# sort(a) sorts the unboxed values themselves, so Python's sort sees plain
+# ints, floats or strings and compares them without going through Cobra's
+# operators; packed integers are sorted in their own memory by NumPy when it
+# is installed. sort(a, descending) sorts largest first, keeping equal
+# elements in order, and sort(a, descending, key) sorts by each element's key:
+# with an integer k, element k of each row, with a function, its result for
+# the element, worked out once per element rather than once per comparison.
+
+def sort_array(arr, descending=False, key=None, call=None):
+    if not isinstance(arr, ARRAYS):
+        raise TypeError("sort() can only be used on arrays")
+    if type(descending) is not bool:
+        raise TypeError("sort() order must be a boolean")
+    if key is not None:
+        key = sort_key(arr, key, call)
+    arr.sort(key=key, reverse=descending)
+    return arr
+
+def sort_key(arr, key, call):
+    """The Python key function for sorting array arr by Cobra key."""
+    if type(key) is int:
+        if key >= 0 and all(type(row) in ARRAY_TYPES and len(row) > key for row in arr):
+            return operator.itemgetter(key)
+        return lambda row: index_value(row, key)  # Fails as row[key] would
+    if isinstance(key, tuple) and len(key) == 3:
+        return lambda item: call(key, [item])
+    raise TypeError("sort() key must be a column index or a function")
+
+# Building strings: x := x + e, for x a string in the running frame, adds e
+# to x's string in place rather than copying it, when nothing but x refers to
+# it. Python resizes a string it holds the only reference to when it is
+# added to (and values are plain strs, so that is the same str any other
+# operation sees), so a string built up a piece at a time in a loop takes
+# time in proportion to its length rather than to its length squared. If
+# anything else does refer to the string, such as another variable, it is
+# copied as before and the other keeps its value. (Characters taken from a
+# string by indexing need no cache of their own: Python keeps one string for
+# each of the first 256 characters and hands that out.)
+
+def append_string(frame, slot, addition):
+    """frame[slot] := frame[slot] + addition, for a string in frame[slot]."""
+    value = frame[slot]
+    if type(addition) is not str:
+        frame[slot] = value = op_add(value, addition)
+        return value
+    frame[slot] = None  # So that value alone may refer to the string
+    value += addition
+    frame[slot] = value
+    return value
+
+# Array builtins: sum(a), map(f, a), filter(f, a), reduce(f, a, initial),
+# dot(a, b) and matmul(a, b), each a Builtin node whose name picks its
+# function here. Each gives just what the while loop that does the same in
+# Cobra would, element by element from the left with the checked operators,
+# but runs as one bulk operation: with NumPy over packed integers when it is
+# installed and the result is sure to fit in 64 bits, else in Python's own C
+# loops wherever the elements' types allow. Each function is passed first
+# call(closure, arguments), the running engine's way to call a Cobra function.
+
+INT64_MAX = 2 ** 63 - 1
+NUMBER_OR_BOOL = NUMBER | {bool}
+
+def items_of(value, name):
+    """The elements of array value, packed if they are, for builtin name."""
+    t = type(value)
+    if t is NumArray:
+        return value.items
+    if t is list:
+        return value
+    if t in ARRAY_TYPES:
+        return list(value)
+    raise TypeError(f"{name}() can only be used on arrays")
+
+def int_vector(items):
+    """Packed integers as a NumPy int64 vector sharing their memory, or None."""
+    if numpy is not None and type(items) is array and items.typecode == "q" and len(items):
+        return numpy.frombuffer(items, dtype=numpy.int64)
+    return None
+
+def largest(values) -> int:
+    """The largest magnitude in a non-empty NumPy int64 array."""
+    return max(abs(int(values.min())), abs(int(values.max())))
+
+def add_all(values, kinds):
+    """0 + values[0] + values[1] + ..., added from the left as + would; kinds are their types."""
+    if kinds <= {int}:
+        return sum(values)  # Exact, so the order does not matter
+    if kinds <= NUMBER_OR_BOOL:
+        return reduce(operator.add, values, 0)
+    return reduce(op_add, values, 0)
+
+def kinds_of(items) -> set:
+    if type(items) is array:
+        return {PACKED_TYPES[items.typecode]}
+    return set(map(type, items))
+
+def sum_array(call, a):
+    items = items_of(a, "sum")
+    vector = int_vector(items)
+    if vector is not None and largest(vector) * len(vector) <= INT64_MAX:
+        return int(vector.sum())
+    return add_all(items, kinds_of(items))
+
+def dot_values(xs, ys, kinds):
+    """xs[0] * ys[0] + xs[1] * ys[1] + ... from 0, as the loop would; kinds are the elements' types."""
+    if kinds <= {int}:
+        return sum(map(operator.mul, xs, ys))
+    if kinds <= NUMBER:
+        return reduce(operator.add, map(operator.mul, xs, ys), 0)
+    total = 0
+    for x, y in zip(xs, ys):
+        total = op_add(total, op_mul(x, y))
+    return total
+
+def dot(call, a, b):
+    xs, ys = items_of(a, "dot"), items_of(b, "dot")
+    if len(xs) != len(ys):
+        raise ValueError(f"dot() needs arrays of the same length, not {len(xs)} and {len(ys)}")
+    u, v = int_vector(xs), int_vector(ys)
+    if u is not None and v is not None and largest(u) * largest(v) * len(u) <= INT64_MAX:
+        return int(numpy.dot(u, v))
+    return dot_values(xs, ys, kinds_of(xs) | kinds_of(ys))
+
+def int_matrix(value):
+    """A Grid of packed integers as a NumPy int64 matrix sharing its memory, or None."""
+    if type(value) is Grid and value.rows is None:
+        vector = int_vector(value.buffer.items)
+        if vector is not None:
+            return vector.reshape(value.length, value.cols)
+    return None
+
+def matmul(call, a, b):
+    rows = [items_of(row, "matmul") for row in items_of(a, "matmul")]
+    b_rows = [items_of(row, "matmul") for row in items_of(b, "matmul")]
+    cols = len(b_rows[0]) if b_rows else 0
+    if any(len(row) != cols for row in b_rows):
+        raise ValueError("matmul() needs the rows of its second array to be the same length")
+    if any(len(row) != len(b_rows) for row in rows):
+        raise ValueError(f"matmul() needs the rows of its first array to have {len(b_rows)} elements")
+    left, right = int_matrix(a), int_matrix(b)
+    if left is not None and right is not None and largest(left) * largest(right) * len(b_rows) <= INT64_MAX:
+        product = array("q")
+        product.frombytes(numpy.ascontiguousarray(left @ right, dtype=numpy.int64).tobytes())
+        return Grid(NumArray(product), cols, len(rows))
+    kinds = set()
+    for row in rows + b_rows:
+        kinds |= kinds_of(row)
+    columns = list(zip(*b_rows)) if b_rows else [()] * cols
+    result = [[dot_values(row, column, kinds) for column in columns] for row in rows]
+    return literal_grid(result) if result else result
+
+def map_array(call, f, a):
+    return pack([call(f, [item]) for item in items_of(a, "map")])
+
+def filter_array(call, f, a):
+    return pack([item for item in items_of(a, "filter") if call(f, [item])])
+
+def reduce_array(call, f, a, initial):
+    result = initial
+    for item in items_of(a, "reduce"):
+        result = call(f, [result, item])
+    return result
+
+BUILTINS = {
+    "sum": sum_array,
+    "map": map_array,
+    "filter": filter_array,
+    "reduce": reduce_array,
+    "dot": dot,
+    "matmul": matmul,
+}
@@ -0,0 +1,165 @@
+from decimal import Decimal
+import pytest
+import operator
+import runtime
+from runtime import box, printable, op_add, op_lt, op_or, make_array, index_value, sort_array, pack, NumArray, Grid, GridRow, grid, literal_grid, typed_op, quicken_binop, quicken_index
+from lexer import IntToken, FloatToken, BoolToken, StringToken
+from tree import ArrayIndex, BinOp, Var
+
+def test_box():
+    assert box([1, 2.5, True, "s", {"k": [0]}]) == [
+        IntToken(1), FloatToken(2.5), BoolToken(True), StringToken("s"), {"k": [IntToken(0)]}]
+
+def test_printable():
+    assert repr(printable([3, 90.0, 0.1, runtime.WholeQuotient(90)])) == (
+        "[IntToken(v=Decimal('3')), FloatToken(v=Decimal('90.0')), FloatToken(v=Decimal('0.1')), FloatToken(v=Decimal('90'))]")
+
+def test_whole_quotients_stay_whole_with_integers():
+    whole = runtime.op_truediv(270, 3)
+    assert type(whole) is runtime.WholeQuotient and whole == 90
+    for value in [whole + 1, 2 * whole, whole - whole, whole / 9, runtime.trunc_mod(whole, 7), -whole]:
+        assert type(value) is runtime.WholeQuotient
+    for value in [whole + 0.5, whole * 1.0, whole / 4, runtime.op_truediv(7, 2)]:
+        assert type(value) is float
+    assert printable(IntToken(7)) == IntToken(Decimal(7))
+
+def test_operators_work_on_plain_values():
+    assert op_add(1, 2) == 3 and type(op_add(1, 2.0)) is float
+    assert op_add("n=", 2) == "n=2"
+    assert op_add(True, True) == 2
+    assert op_lt(1, 2) is True
+    assert op_or(0, False) == 0
+
+def test_type_errors_name_tokens():
+    with pytest.raises(TypeError, match="Invalid operation: BoolToken < IntToken"):
+        op_lt(True, 1)
+    with pytest.raises(TypeError, match="Cannot index into IntToken"):
+        index_value(5, 0)
+
+def test_make_array_copies_only_mutable_values():
+    rows = make_array([0, 0], 2)
+    rows[0][0] = 1
+    assert [list(row) for row in rows] == [[1, 0], [0, 0]]
+    nested = make_array([[0]], 2)
+    nested[0][0][0] = 1
+    assert nested == [[[1]], [[0]]]
+    assert make_array(0, 3) == [0, 0, 0]
+
+def test_numeric_arrays_are_packed():
+    ints = make_array(0, 100)
+    assert type(ints) is NumArray and ints.items.typecode == "q"
+    assert pack([0.5] * 40).items.typecode == "d"
+    assert type(pack([1] * 40 + [0.5])) is list  # Mixed, so it would not hold the same values
+    assert type(pack([True] * 40)) is list
+    assert type(pack([2 ** 70] * 40)) is list
+    assert type(make_array(0, 3)) is list  # Too short to be worth it
+    ints[5] = 7
+    assert index_value(ints, 5) == 7 and type(ints.items) is not list
+    with pytest.raises(IndexError, match="Array index out of bounds: 100"):
+        index_value(ints, 100)
+
+def test_packed_arrays_unpack_on_the_first_store_that_does_not_fit():
+    for value in (0.5, True, "s", [1], 2 ** 64):
+        ints = make_array(0, 40)
+        ints[1] = value
+        assert type(ints.items) is list and ints[1] == value and type(ints[1]) is type(value)
+    floats = make_array(0.0, 40)
+    floats[0] = 1  # An int stays an int
+    assert type(floats[0]) is int
+
+def test_packed_arrays_sort_copy_and_box():
+    a = pack(list(range(40, 0, -1)))
+    assert sort_array(a) is a and list(a) == list(range(1, 41))
+    rows = make_array(a, 2)
+    rows[0][0] = 99
+    assert rows[1][0] == 1
+    assert box(a)[:2] == [IntToken(1), IntToken(2)]
+
+def test_typed_ops_only_where_unchecked_is_the_same():
+    assert typed_op("+", int, float) is operator.add
+    assert typed_op("//", int, int) is runtime.int_floordiv
+    assert typed_op("//", float, int) is None
+    assert typed_op("+", bool, int) is None
+    assert typed_op("!=", str, str) is None
+    assert typed_op("/", int, int) is None
+
+def test_quickening_specializes_then_deoptimizes(monkeypatch):
+    monkeypatch.setattr(runtime, "quick_stats", runtime.QuickStats())
+    node = BinOp("+", Var("a"), Var("b"))
+    assert quicken_binop(node, 1, 2) == 3
+    assert node.quick == (int, int, operator.add)
+    assert quicken_binop(node, "a", 1) == "a1"
+    assert node.quick is False
+    index = ArrayIndex(Var("a"), [Var("i")])
+    assert quicken_index(index, [1], 0) is list
+    assert quicken_index(index, [1], 5) is list  # Out of bounds is an error, not a different type
+    assert quicken_index(index, "s", 0) is False
+    assert str(runtime.quick_stats) == "2 nodes specialized, 2 deoptimized"
+
+def test_grids_keep_rows_in_one_buffer():
+    table = make_array(pack([0] * 40), 40)
+    assert type(table) is Grid and table.buffer.items.typecode == "q" and len(table.buffer) == 1600
+    row = index_value(table, 2)
+    assert type(row) is GridRow
+    row[3] = 7
+    assert table.get(table.row_start(2), 3) == 7
+    table.set(table.row_start(2), 4, "s")  # Unpacks the buffer, and every view sees it
+    assert row[4] == "s"
+    assert grid([], 3) is None and grid([[0]], 3) is None
+    assert type(literal_grid([[1], [2, 3]])) is list
+
+def test_replacing_a_row_keeps_views_of_the_others():
+    table = literal_grid([[1, 2], [3, 4]])
+    row = table[0]
+    table[1] = [9]
+    row[0] = 5
+    assert box(table) == [[IntToken(5), IntToken(2)], [IntToken(9)]]
+    with pytest.raises(IndexError, match="Array index out of bounds: 1, array length: 1"):
+        index_value(index_value(table, 1), 1)
+
+def never_called(closure, args):
+    raise AssertionError("no function to call")
+
+def test_builtins_add_from_the_left_like_a_loop():
+    assert runtime.sum_array(never_called, [0.1] * 10) == 0.1 + 0.1 + 0.1 + 0.1 + 0.1 + 0.1 + 0.1 + 0.1 + 0.1 + 0.1
+    assert runtime.sum_array(never_called, pack(list(range(100)))) == 4950
+    assert runtime.sum_array(never_called, [True, 2, "a"]) == "3a"
+    assert runtime.sum_array(never_called, pack([2 ** 62] * 40)) == 40 * 2 ** 62  # Past 64 bits
+    assert runtime.dot(never_called, literal_grid([[1, 2], [3, 4]])[1], [2, 0.5]) == 8.0
+    assert box(runtime.matmul(never_called, make_array(pack([2] * 40), 40), make_array(pack([3] * 40), 40))[39]) == [IntToken(240)] * 40
+
+def test_builtin_errors():
+    with pytest.raises(TypeError, match="sum\\(\\) can only be used on arrays"):
+        runtime.sum_array(never_called, 5)
+    with pytest.raises(ValueError, match="same length, not 2 and 1"):
+        runtime.dot(never_called, [1, 2], [1])
+    with pytest.raises(ValueError, match="rows of its first array to have 2 elements"):
+        runtime.matmul(never_called, [[1]], [[1], [2]])
+    with pytest.raises(TypeError, match="Invalid operation: IntToken \\+ list"):
+        runtime.sum_array(never_called, [[1]])
+
+def test_sort_orders_and_keys():
+    assert sort_array([3, 1, 2], True) == [3, 2, 1]
+    assert sort_array(pack(list(range(40))), True).items.tolist() == list(range(39, -1, -1))
+    rows = [[1, "b"], [0, "c"], [1, "a"]]
+    assert sort_array(rows, True, 0) == [[1, "b"], [1, "a"], [0, "c"]]  # Equal keys keep their order
+    calls = []
+    assert sort_array(["bb", "a", "ccc"], False, ("f", None, None), lambda f, args: calls.append(args) or -len(args[0])) == ["ccc", "bb", "a"]
+    assert len(calls) == 3  # Once per element
+    table = literal_grid([[2, 0], [1, 5]])
+    assert box(sort_array(table, False, 1)) == [[IntToken(2), IntToken(0)], [IntToken(1), IntToken(5)]]
+    with pytest.raises(TypeError, match="sort\\(\\) order must be a boolean"):
+        sort_array([1], 1)
+    with pytest.raises(IndexError, match="Array index out of bounds: 2, array length: 2"):
+        sort_array(rows, False, 2)
+    with pytest.raises(TypeError, match="sort\\(\\) key must be"):
+        sort_array(rows, False, "k")
+
+def test_append_string():
+    frame = [None, "ab" * 20]
+    alias = frame[1]
+    assert runtime.append_string(frame, 1, "c") == "ab" * 20 + "c" and alias == "ab" * 20
+    assert runtime.append_string(frame, 1, 1.5) == frame[1] == "ab" * 20 + "c1.5"
+    with pytest.raises(TypeError, match="Invalid operation: StringToken \\+ list"):
+        runtime.append_string(frame, 1, [])
+    assert frame[1] == "ab" * 20 + "c1.5"
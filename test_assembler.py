@@ -1,8 +1,11 @@
 import unittest
 from assembler import codegen
 from lexer import IntToken
-from tree import Var, Let, BinOp, While, Assign, Array, ArrayIndex, ArrayAssign, Fun, Call
+from tree import Var, Let, BinOp, TypedBinOp, While, Assign, Array, ArrayIndex, ArrayAssign, Fun, Call, Map, Hoisted, Unset
 from decimal import Decimal
+from optimizer import optimize
+from parser import parse
+from resolver import resolve
 
 class TestAssembler(unittest.TestCase):
     def test_simple_arithmetic(self):
@@ -87,6 +90,48 @@ class TestAssembler(unittest.TestCase):
         ])
         self.assertEqual(bytecode, expected)
 
+    def test_typed_arithmetic(self):
+        expr = TypedBinOp(op="*", left=IntToken(v=Decimal("2")), right=IntToken(v=Decimal("3")))
+        bytecode = codegen(expr)
+        expected = bytearray([1, 2, 1, 3, 5, 0])  # PUSH 2, PUSH 3, MUL, HALT
+        self.assertEqual(bytecode, expected)
+
+    def test_hoisted_expression_is_worked_out_in_place(self):
+        expr = Hoisted(var=Var(v="t", i=None), expr=BinOp(op="-", left=IntToken(v=Decimal("5")), right=IntToken(v=Decimal("1"))))
+        bytecode = codegen([Unset(), expr])
+        expected = bytearray([1, 0, 1, 5, 1, 1, 4, 0])  # PUSH 0, PUSH 5, PUSH 1, SUB, HALT
+        self.assertEqual(bytecode, expected)
+
+    def test_optimized_arithmetic(self):
+        bytecode = codegen(optimize(resolve(parse("let f be fun(x) is x + 1 in let y be 5 in f(y) * y end end"))))
+        expected = bytearray([
+            1, 5, 14, 0,  # PUSH 5, STORE 0 (y)
+            1, 5, 14, 1, 1, 6,  # The inlined call: PUSH 5, STORE 1 (x), PUSH 6
+            1, 5, 5,  # PUSH 5, MUL
+            0  # HALT
+        ])
+        self.assertEqual(bytecode, expected)
+
+    def test_optimized_loop(self):
+        bytecode = codegen(optimize(resolve(parse(
+            "let n be 9 in n := n + 1; let i be 0 in while {i < n - 1} do i := i + 1 end end end"))))
+        expected = bytearray([
+            1, 9, 14, 0,  # PUSH 9, STORE 0 (n)
+            13, 0, 1, 1, 3, 14, 0,  # LOAD 0, PUSH 1, ADD, STORE 0
+            1, 0, 14, 1,  # PUSH 0, STORE 1 (i)
+            1, 0, 14, 2,  # PUSH 0, STORE 2 (the hoisted n - 1)
+            13, 1, 13, 0, 1, 1, 4, 9,  # LOAD 1, LOAD 0, PUSH 1, SUB, LT
+            12, 38,  # JMPF to end
+            13, 1, 1, 1, 3, 14, 1,  # LOAD 1, PUSH 1, ADD, STORE 1
+            11, 19,  # JMP to start
+            0  # HALT
+        ])
+        self.assertEqual(bytecode, expected)
+
+    def test_unknown_node_is_an_error(self):
+        with self.assertRaises(ValueError):
+            codegen(Map(entries={}))
+
     def test_negative_and_subtraction(self):
         expr = BinOp(op="-", left=IntToken(v=Decimal("10")), right=IntToken(v=Decimal("3")))
         bytecode = codegen(expr)
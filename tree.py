@@ -1,4 +1,30 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+
+def trampoline(gen):
+    """
+    Run a recursive descent written as generators on an explicit stack.
+
+    Each step of the descent is a generator that yields the generator for a
+    sub-step and is sent back that sub-step's return value, so nesting depth
+    is bounded by memory rather than by Python's recursion limit.
+    """
+    stack = [gen]
+    push, pop = stack.append, stack.pop
+    send = gen.send
+    value = None
+    while True:
+        try:
+            sub = send(value)
+        except StopIteration as stop:
+            pop()
+            if not stack:
+                return stop.value
+            send = stack[-1].send
+            value = stop.value
+        else:
+            push(sub)
+            send = sub.send
+            value = None
 
 # Abstract Syntax Tree classes
 class AST:
@@ -10,6 +36,15 @@ class BinOp(AST):
     left: AST
     right: AST
     _fields = ('op', 'left', 'right')
+    quick = None  # What the engines have learned of its operand types, see runtime.quicken_binop()
+
+@dataclass
+class TypedBinOp(AST):
+    """A BinOp whose operands inference.py has proven to be of types op accepts, so it runs unchecked."""
+    op: str
+    left: AST
+    right: AST
+    _fields = ('op', 'left', 'right')
 
 @dataclass
 class Let(AST):
@@ -21,7 +56,9 @@ class Let(AST):
 @dataclass
 class Var(AST):
     v: str
-    i: int = None
+    i: int = None      # Unique id from the resolver
+    depth: int = None  # Lexical address from the resolver: 0 for the current frame, 1 for the
+    slot: int = None   # closure's captured values, and the slot within that frame
 
 @dataclass
 class If(AST):
@@ -54,12 +91,17 @@ class While(AST):
 class Fun(AST):
     parameters: list[str] 
     body: AST              
+    size: int = None  # Slots in a call's frame, set by the resolver
+    captures: list = None         # Where each captured variable lives where the closure is made
+    assigns_captured: bool = False  # Whether the body assigns to a captured variable
+    pure: bool = False  # Whether calls can be memoized, set by purity.py
     _fields = ('parameters', 'body')
 
 @dataclass
 class Call(AST):
     func: AST 
     args: list[AST] 
+    tail: bool = False  # Whether its value is its function's result, set by the resolver
     _fields = ('func', 'args')
 
 @dataclass
@@ -67,6 +109,36 @@ class Assign(AST):
     var: AST 
     expr: AST  
     _fields = ('var', 'expr')
+    appended = None  # What it appends to its variable, if anything, see appended()
+
+def appended(assign: Assign):
+    """
+    e if assign is x := x + e for a variable x of the frame it runs in and
+    e assigns no x, else False: what runtime.append_string() can add to x's
+    string in place. Worked out the first time it is asked for.
+    """
+    if assign.appended is None:
+        var, expr = assign.var, assign.expr
+        assign.appended = False
+        if (type(expr) in (BinOp, TypedBinOp) and expr.op == "+" and type(expr.left) is Var
+                and expr.left.i == var.i and var.depth == 0 and not assigns(expr.right, var.i)):
+            assign.appended = expr.right
+    return assign.appended
+
+def assigns(tree, i) -> bool:
+    """Whether tree has an assignment to the variable with id i."""
+    work = [tree]
+    while work:
+        node = work.pop()
+        if type(node) is Assign and node.var.i == i:
+            return True
+        if isinstance(node, list):
+            work.extend(node)
+        elif isinstance(node, dict):
+            work.extend(node.values())
+        elif isinstance(node, AST):
+            work.extend(getattr(node, f.name) for f in fields(node))
+    return False
 
 @dataclass
 class Array(AST):
@@ -78,6 +150,7 @@ class ArrayIndex(AST):
     array: AST
     index: list[AST]
     _fields = ('array', 'index')
+    quick = None  # What the engines have learned of what it indexes, see runtime.quicken_index()
 
 @dataclass
 class ArrayAssign(AST):
@@ -123,4 +196,27 @@ class Print(AST):
 @dataclass
 class Sort(AST):
     array: AST
-    _fields = ('array',)
\ No newline at end of file
+    descending: AST = None  # sort(array, descending) and sort(array, descending, key)
+    key: AST = None
+    _fields = ('array', 'descending', 'key')
+
+@dataclass
+class Builtin(AST):
+    """A call of an array builtin, which the resolver makes of a call of an unbound name in BUILTIN_ARITY."""
+    name: str
+    args: list[AST]
+    _fields = ('name', 'args')
+
+# The array builtins and how many arguments each takes; runtime.BUILTINS runs them
+BUILTIN_ARITY = {"sum": 1, "map": 2, "filter": 2, "reduce": 3, "dot": 2, "matmul": 2}
+
+@dataclass
+class Hoisted(AST):
+    var: Var   # A temporary: empty until expr is first worked out, then its value
+    expr: AST  # A loop-invariant expression
+    _fields = ('var', 'expr')
+
+@dataclass
+class Unset(AST):
+    """The value a Hoisted temporary starts out with."""
+    _fields = ()